@@ -393,3 +393,234 @@ class SplineAug(object):
                 torch.stack(deformed_weights_list),
                 torch.stack(deformed_coupled_points_list),
             )
+
+
+def euler_zyx_to_matrix(angles):
+    """
+    batched version of scipy Rotation.from_euler("zyx", angles, degrees=True).as_matrix()
+
+    :param angles: Bx3 tensor, extrinsic rotation angles (degree) around z, y, x axis
+    :return: Bx3x3 tensor
+    """
+    angles = angles * (np.pi / 180.0)
+    cos, sin = torch.cos(angles), torch.sin(angles)
+    zeros, ones = torch.zeros_like(angles[:, 0]), torch.ones_like(angles[:, 0])
+
+    def _stack(*rows):
+        return torch.stack(rows, -1).view(-1, 3, 3)
+
+    rz = _stack(
+        cos[:, 0], -sin[:, 0], zeros, sin[:, 0], cos[:, 0], zeros, zeros, zeros, ones
+    )
+    ry = _stack(
+        cos[:, 1], zeros, sin[:, 1], zeros, ones, zeros, -sin[:, 1], zeros, cos[:, 1]
+    )
+    rx = _stack(
+        ones, zeros, zeros, zeros, cos[:, 2], -sin[:, 2], zeros, sin[:, 2], cos[:, 2]
+    )
+    return rx @ ry @ rz
+
+
+def batch_grid_cluster(points, point_weights, spacing):
+    """
+    voxel grid clustering on a whole batch, the number of clusters differs among samples,
+    the result is padded to the largest one with zero weights
+
+    :param points: BxNxD tensor
+    :param point_weights: BxNx1 tensor
+    :param spacing: voxel size
+    :return: BxMxD cluster centers, BxMx1 cluster weights
+    """
+    B, N, D = points.shape
+    device = points.device
+    batch_index = torch.arange(B, device=device)[:, None, None].expand(B, N, 1)
+    voxel_index = torch.floor(points / spacing).long()
+    keys = torch.cat([batch_index, voxel_index], -1).view(B * N, D + 1)
+    unique_keys, inverse = torch.unique(keys, dim=0, return_inverse=True)
+    ncluster = unique_keys.shape[0]
+    flat_points, flat_weights = points.reshape(B * N, D), point_weights.reshape(B * N, 1)
+    cluster_points = torch.zeros(ncluster, D, device=device, dtype=points.dtype)
+    cluster_weights = torch.zeros(ncluster, 1, device=device, dtype=points.dtype)
+    cluster_points.index_add_(0, inverse, flat_points * flat_weights)
+    cluster_weights.index_add_(0, inverse, flat_weights)
+    cluster_points = cluster_points / cluster_weights.clamp(min=1e-15)
+    # unique keys are sorted, so clusters of the same sample are contiguous
+    cluster_batch = unique_keys[:, 0]
+    counts = torch.bincount(cluster_batch, minlength=B)
+    offsets = torch.cumsum(counts, 0) - counts
+    rank = torch.arange(ncluster, device=device) - offsets[cluster_batch]
+    M = int(counts.max().item())
+    batch_cluster_points = torch.zeros(B, M, D, device=device, dtype=points.dtype)
+    batch_cluster_weights = torch.zeros(B, M, 1, device=device, dtype=points.dtype)
+    batch_cluster_points[cluster_batch, rank] = cluster_points
+    batch_cluster_weights[cluster_batch, rank] = cluster_weights
+    return batch_cluster_points, batch_cluster_weights
+
+
+class BatchSplineAug(SplineAug):
+    """
+    batched version of SplineAug, it deforms a whole collated batch at once,
+    so it can be called after collation on either cpu or gpu.
+    each sample still gets its own random displacement / rigid parameters,
+    all random numbers are drawn from an explicit torch.Generator
+
+    :param aug_settings: the same settings as SplineAug, with an additional "seed"
+    :param generator: optional torch.Generator, overwrite the "seed" setting if given
+    """
+
+    def __init__(self, aug_settings, generator=None):
+        super(BatchSplineAug, self).__init__(aug_settings)
+        if generator is None:
+            seed = aug_settings[
+                ("seed", -1, "random seed of the batch augmentation, -1 for no seed")
+            ]
+            generator = torch.Generator()
+            if seed >= 0:
+                generator.manual_seed(seed)
+            else:
+                generator.seed()
+        self.generator = generator
+
+    def rand(self, *size, device=None):
+        """uniform random in [0,1), drawn from the generator and moved to device"""
+        rand = torch.rand(*size, generator=self.generator, device=self.generator.device)
+        return rand.to(device)
+
+    def rand_range(self, value_range, *size, device=None):
+        return (
+            self.rand(*size, device=device) * (value_range[1] - value_range[0])
+            + value_range[0]
+        )
+
+    def grid_spline_deform(self, points, point_weights, coupled_points=None):
+        """
+        :param points: BxNxD
+        :param point_weights: BxNx1
+        :param coupled_points: BxN'xD
+        :return:
+        """
+        grid_aug_settings = self.aug_settings["grid_spline_aug"]
+        grid_spacing = grid_aug_settings["grid_spacing"]
+        B, device = points.shape[0], points.device
+        scale = grid_aug_settings["disp_scale"] * self.rand(B, 1, 1, device=device)
+        grid_control_points, grid_control_weights = batch_grid_cluster(
+            points, point_weights, grid_spacing
+        )
+        grid_control_disp = (
+            self.rand_range([-1, 1], *grid_control_points.shape, device=device) * scale
+        )
+        points_disp = self.grid_spline_kernel(
+            points, grid_control_points, grid_control_disp, grid_control_weights
+        )
+        deformed_points = points + points_disp
+        if coupled_points is None:
+            deformed_coupled_points = None
+        else:
+            coupled_points_disp = self.grid_spline_kernel(
+                coupled_points,
+                grid_control_points,
+                grid_control_disp,
+                grid_control_weights,
+            )
+            deformed_coupled_points = coupled_points + coupled_points_disp
+        return deformed_points, point_weights, deformed_coupled_points
+
+    def local_deform_spline_deform(self, points, point_weights, coupled_points=None):
+        """
+        :param points: BxNxD
+        :param point_weights: BxNx1
+        :param coupled_points: BxN'xD
+        :return:
+        """
+        local_deform_aug_settings = self.aug_settings["local_deform_aug"]
+        num_sample = local_deform_aug_settings["num_sample"]
+        scale = local_deform_aug_settings["disp_scale"]
+        B, N, D = points.shape
+        device = points.device
+        # uniform sampling without replacement, independently for each sample
+        if num_sample <= N:
+            index = self.rand(B, N, device=device).argsort(1)[:, :num_sample]
+        else:
+            index = (self.rand(B, num_sample, device=device) * N).long()
+        index = index.sort(1)[0]
+        sampling_control_points = torch.gather(
+            points, 1, index[..., None].expand(B, num_sample, D)
+        )
+        sampling_control_weights = torch.gather(point_weights, 1, index[..., None])
+        sampling_control_disp = (
+            self.rand_range([-1, 1], *sampling_control_points.shape, device=device)
+            * scale
+        )
+        points_disp = self.local_deform_spline_kernel(
+            points,
+            sampling_control_points,
+            sampling_control_disp,
+            sampling_control_weights,
+        )
+        deformed_points = points + points_disp
+        if coupled_points is None:
+            deformed_coupled_points = None
+        else:
+            coupled_points_disp = self.knn_interp_kernel(
+                coupled_points, points, points_disp
+            )
+            deformed_coupled_points = coupled_points + coupled_points_disp
+        return deformed_points, point_weights, deformed_coupled_points
+
+    def rigid_deform(self, points, point_weights=None, coupled_points=None):
+        """
+        :param points: BxNxD
+        :param point_weights: BxNx1
+        :param coupled_points: BxN'xD
+        :return:
+        """
+        rigid_aug_settings = self.aug_settings["rigid_aug"]
+        rotation_range = rigid_aug_settings["rotation_range"]
+        scale_range = rigid_aug_settings["scale_range"]
+        translation_range = rigid_aug_settings["translation_range"]
+        B, device = points.shape[0], points.device
+        scale = self.rand_range(scale_range, B, 1, 1, device=device)
+        translation = self.rand_range(translation_range, B, 1, 1, device=device)
+        angles = self.rand_range(rotation_range, B, 3, device=device)
+        r_matrix = euler_zyx_to_matrix(angles).to(points.dtype) * scale
+        deformed_points = points @ r_matrix + translation
+        if coupled_points is None:
+            deformed_coupled_points = None
+        else:
+            deformed_coupled_points = coupled_points @ r_matrix + translation
+        return deformed_points, point_weights, deformed_coupled_points
+
+    def __call__(self, batch_points, batch_point_weights, batch_coupled_points=None):
+        """
+        :param batch_points: torch.tensor  BxNxD
+        :param batch_point_weights: torch.tensor BxNx1
+        :param batch_coupled_points: torch.tensor BxN'xD
+        :return:
+        """
+        deformed_points = batch_points
+        deformed_weights = batch_point_weights
+        deformed_coupled_points = batch_coupled_points
+        deform_list = [
+            (self.do_local_deform_aug, self.local_deform_spline_deform, "local deform"),
+            (self.do_grid_aug, self.grid_spline_deform, "global deform"),
+            (self.do_rigid_aug, self.rigid_deform, "rigid deform"),
+        ]
+        for do_deform, deform, deform_name in deform_list:
+            if not do_deform:
+                continue
+            deformed_points, deformed_weights, deformed_coupled_points = deform(
+                deformed_points, deformed_weights, deformed_coupled_points
+            )
+            if self.plot:
+                visualize(
+                    batch_points[0],
+                    deformed_points[0],
+                    batch_point_weights[0],
+                    deformed_weights[0],
+                    title1="before " + deform_name,
+                    title2="after " + deform_name,
+                )
+        if deformed_coupled_points is None:
+            return deformed_points, deformed_weights
+        else:
+            return deformed_points, deformed_weights, deformed_coupled_points
@@ -1,8 +1,160 @@
+import os
+import threading
+from functools import partial
+from queue import Queue, Empty, Full
 import torch
 import numpy as np
 from robot.global_variable import DATASET_POOL
 from robot.utils.obj_factory import partial_obj_factory
 
+
+def get_available_cores():
+    """
+    the cpu cores the current process is allowed to run on
+    :return: list of core ids
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def auto_num_workers(
+    ncores, main_threads=1, threads_per_worker=1, max_workers=32, ratio=1.0
+):
+    """
+    size the number of dataloader workers from the cores left by the main process
+    :param ncores: number of available cores
+    :param main_threads: number of threads reserved for the main (training) process
+    :param threads_per_worker: number of torch threads each worker runs
+    :param max_workers: upper bound of the worker number
+    :param ratio: fraction of the free cores given to this phase
+    :return: int, number of workers
+    """
+    free_cores = max(ncores - main_threads, 0)
+    num_workers = int(free_cores * ratio) // max(threads_per_worker, 1)
+    return max(min(num_workers, max_workers), 0)
+
+
+def _worker_init_fn(worker_id, threads_per_worker=1, cores=None):
+    """
+    seed the worker, bound its torch threads and, if cores are given, pin it to
+    its own slice of threads_per_worker cores
+    """
+    np.random.seed(12 + worker_id)
+    torch.set_num_threads(threads_per_worker)
+    if cores and hasattr(os, "sched_setaffinity"):
+        n = min(max(threads_per_worker, 1), len(cores))
+        start = worker_id * n % len(cores)
+        os.sched_setaffinity(0, {cores[(start + i) % len(cores)] for i in range(n)})
+
+
+def to_device(item, device, non_blocking=False):
+    """
+    recursively move the tensors in a collated batch to the device
+    """
+    if isinstance(item, torch.Tensor):
+        return item.to(device, non_blocking=non_blocking)
+    elif isinstance(item, dict):
+        return {
+            key: to_device(_item, device, non_blocking) for key, _item in item.items()
+        }
+    elif isinstance(item, (list, tuple)):
+        return type(item)(to_device(_item, device, non_blocking) for _item in item)
+    return item
+
+
+def record_stream(item, stream):
+    """
+    recursively mark the tensors in a batch as used by the stream, so the caching
+    allocator does not reuse their memory before the work queued on it is done
+    """
+    if isinstance(item, torch.Tensor):
+        if item.is_cuda:
+            item.record_stream(stream)
+    elif isinstance(item, dict):
+        for _item in item.values():
+            record_stream(_item, stream)
+    elif isinstance(item, (list, tuple)):
+        for _item in item:
+            record_stream(_item, stream)
+
+
+class BatchPrefetcher(object):
+    """
+    iterate a dataloader while a background thread moves the next batches onto the device,
+    so the host-to-device transfer overlaps with the compute of the current batch
+    on gpu, the copy is issued on a side stream from pinned memory
+    """
+
+    def __init__(self, dataloader, device, num_prefetch=2):
+        self.dataloader = dataloader
+        self.device = torch.device(device)
+        self.num_prefetch = num_prefetch
+
+    @property
+    def dataset(self):
+        return self.dataloader.dataset
+
+    def __len__(self):
+        return len(self.dataloader)
+
+    def _load(self, queue, stop):
+        use_stream = self.device.type == "cuda"
+        stream = torch.cuda.Stream(self.device) if use_stream else None
+        try:
+            for batch in self.dataloader:
+                event = None
+                if use_stream:
+                    with torch.cuda.stream(stream):
+                        batch = to_device(batch, self.device, non_blocking=True)
+                        event = torch.cuda.Event()
+                        event.record(stream)
+                else:
+                    batch = to_device(batch, self.device)
+                if not self._put(queue, stop, (batch, event, None)):
+                    return
+            self._put(queue, stop, (None, None, None))
+        except Exception as e:
+            self._put(queue, stop, (None, None, e))
+
+    @staticmethod
+    def _put(queue, stop, item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def __iter__(self):
+        queue = Queue(maxsize=max(self.num_prefetch, 1))
+        stop = threading.Event()
+        thread = threading.Thread(target=self._load, args=(queue, stop), daemon=True)
+        thread.start()
+        try:
+            while True:
+                batch, event, error = queue.get()
+                if error is not None:
+                    raise error
+                if batch is None:
+                    break
+                if event is not None:
+                    current_stream = torch.cuda.current_stream(self.device)
+                    current_stream.wait_event(event)
+                    # the batch was allocated on the side stream
+                    record_stream(batch, current_stream)
+                yield batch
+        finally:
+            stop.set()
+            try:
+                while True:
+                    queue.get_nowait()
+            except Empty:
+                pass
+            thread.join()
+
+
 # todo reformat the import style
 class DataManager(object):
     def __init__(
@@ -32,23 +184,94 @@ class DataManager(object):
         """
         self.data_opt = data_opt
 
-    def init_dataset_loader(self, transformed_dataset, batch_size):
+    def get_loader_setting(self):
+        """
+        get the dataloader settings, workers set to -1 are auto-sized from the available cores
+        :return: dict of dataloader settings
+        """
+        phases = ["train", "val", "test", "debug"]
+        loader_opt = self.data_opt[("loader", {}, "settings for the dataloaders")]
+        num_workers = loader_opt[
+            (
+                "num_workers",
+                [-1, -1, -1, -1],
+                "num of workers for train|val|test|debug, -1 for auto-sizing from the available cores",
+            )
+        ]
+        main_threads = loader_opt[
+            (
+                "main_threads",
+                1,
+                "num of cores reserved for the main process when auto-sizing the workers",
+            )
+        ]
+        threads_per_worker = loader_opt[
+            ("threads_per_worker", 1, "num of torch threads in each worker")
+        ]
+        max_workers = loader_opt[
+            ("max_workers", 32, "upper bound of the auto-sized worker number")
+        ]
+        pin_memory = loader_opt[
+            ("pin_memory", "auto", "pin memory, 'auto' pins it when cuda is available")
+        ]
+        persistent_workers = loader_opt[
+            ("persistent_workers", False, "keep the workers alive between epochs")
+        ]
+        prefetch_factor = loader_opt[
+            ("prefetch_factor", 2, "num of batches loaded in advance by each worker")
+        ]
+        worker_affinity = loader_opt[
+            ("worker_affinity", False, "pin each worker to one of the free cores")
+        ]
+        prefetch_to_device = loader_opt[
+            (
+                "prefetch_to_device",
+                False,
+                "move the next batches to the device in a background thread",
+            )
+        ]
+        num_workers = (
+            [num_workers] * 4 if not isinstance(num_workers, list) else num_workers
+        )
+        cores = get_available_cores()
+        # the debug phase is light, give it half of the free cores
+        ratio = {"train": 1.0, "val": 1.0, "test": 1.0, "debug": 0.5}
+        num_workers = {
+            phase: num_workers[i]
+            if num_workers[i] >= 0
+            else auto_num_workers(
+                len(cores), main_threads, threads_per_worker, max_workers, ratio[phase]
+            )
+            for i, phase in enumerate(phases)
+        }
+        if pin_memory == "auto":
+            pin_memory = torch.cuda.is_available()
+        return {
+            "num_workers": num_workers,
+            "threads_per_worker": threads_per_worker,
+            "pin_memory": pin_memory,
+            "persistent_workers": persistent_workers,
+            "prefetch_factor": prefetch_factor,
+            "worker_cores": cores[main_threads:] if worker_affinity else None,
+            "prefetch_to_device": prefetch_to_device,
+        }
+
+    def init_dataset_loader(self, transformed_dataset, batch_size, device=None):
         """
         initialize the data loaders: set work number, set work type( shuffle for trainning, order for others)
         :param transformed_dataset:
         :param batch_size: the batch size of each iteration
+        :param device: if given and prefetch_to_device is on, batches are moved to the device in background
         :return: dict of dataloaders for train|val|test|debug
         """
-
-        def _init_fn(worker_id):
-            np.random.seed(12 + worker_id)
-
-        num_workers_reg = {
-            "train": 8,
-            "val": 8,
-            "test": 8,
-            "debug": 4,
-        }  # {'train':0,'val':0,'test':0,'debug':0}#{'train':8,'val':4,'test':4,'debug':4}
+        loader_setting = self.get_loader_setting()
+        num_workers_reg = loader_setting["num_workers"]
+        print("dataloader workers: {}".format(num_workers_reg))
+        init_fn = partial(
+            _worker_init_fn,
+            threads_per_worker=loader_setting["threads_per_worker"],
+            cores=loader_setting["worker_cores"],
+        )
         shuffle_list = {"train": True, "val": False, "test": False, "debug": False}
         batch_size = (
             [batch_size] * 4 if not isinstance(batch_size, list) else batch_size
@@ -59,24 +282,39 @@ class DataManager(object):
             "test": batch_size[2],
             "debug": batch_size[3],
         }
+
+        def worker_args(phase):
+            if num_workers_reg[phase] == 0:
+                return {}
+            return {
+                "persistent_workers": loader_setting["persistent_workers"],
+                "prefetch_factor": loader_setting["prefetch_factor"],
+            }
+
         dataloaders = {
             x: torch.utils.data.DataLoader(
                 transformed_dataset[x],
                 batch_size=batch_size[x],
                 shuffle=shuffle_list[x],
                 num_workers=num_workers_reg[x],
-                worker_init_fn=_init_fn,
-                pin_memory=True,
+                worker_init_fn=init_fn,
+                pin_memory=loader_setting["pin_memory"],
+                **worker_args(x)
             )
             for x in self.phases
         }
+        if device is not None and loader_setting["prefetch_to_device"]:
+            dataloaders = {
+                x: BatchPrefetcher(dataloaders[x], device) for x in self.phases
+            }
         return dataloaders
 
-    def build_data_loaders(self, batch_size=20, is_train=True):
+    def build_data_loaders(self, batch_size=20, is_train=True, device=None):
         """
         build the data_loaders for the train phase and the test phase
         :param batch_size: the batch size for each iteration
         :param is_train: in train mode or not
+        :param device: the device the batches are prefetched to, if prefetch_to_device is on
         :return: dict of dataloaders for train phase or the test phase
         """
         if is_train:
@@ -98,7 +336,7 @@ class DataManager(object):
                 phase: partial_obj_factory(dataset_opt["name"])(self.data_path, dataset_opt, phase=phase)
                 for phase in self.phases
             }
-        dataloaders = self.init_dataset_loader(transformed_dataset, batch_size)
+        dataloaders = self.init_dataset_loader(transformed_dataset, batch_size, device)
         dataloaders["data_size"] = {
             phase: len(dataloaders[phase]) for phase in self.phases
         }
@@ -6,7 +6,7 @@ import random
 import time
 from robot.experiments.datasets.lung.lung_data_analysis import *
 from robot.global_variable import *
-from robot.datasets.data_aug import SplineAug, PointAug
+from robot.datasets.data_aug import SplineAug, BatchSplineAug, PointAug
 from robot.utils.module_parameters import ParameterDict
 from robot.utils.utils import enlarge_by_factor
 from functools import partial
@@ -61,7 +61,11 @@ def flyingkitti_nonocc_synth_data(**kwargs):
     rigid_aug_settings["scale_range"] = [0.8, 1.2]
     rigid_aug_settings["translation_range"] = [-10, 10]
 
-    spline_aug = SplineAug(aug_settings)
+    # the batch version deforms the collated batch at once, instead of sample by sample
+    batch_spline_aug = kwargs.get("batch_spline_aug", False)
+    spline_aug = (
+        BatchSplineAug(aug_settings) if batch_spline_aug else SplineAug(aug_settings)
+    )
 
     points_aug = aug_settings[
         ("points_aug", {}, "settings for remove or add noise points")
@@ -142,7 +146,11 @@ def flyingkitti_nonocc_aug_data(**kwargs):
     rigid_aug_settings["scale_range"] = [0.95, 1.05]
     rigid_aug_settings["translation_range"] = [-0.5, 0.5]
 
-    spline_aug = SplineAug(aug_settings)
+    # the batch version deforms the collated batch at once, instead of sample by sample
+    batch_spline_aug = kwargs.get("batch_spline_aug", False)
+    spline_aug = (
+        BatchSplineAug(aug_settings) if batch_spline_aug else SplineAug(aug_settings)
+    )
 
     points_aug = aug_settings[
         ("points_aug", {}, "settings for remove or add noise points")
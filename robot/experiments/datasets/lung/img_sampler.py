@@ -3,8 +3,11 @@ image sampler code is clone from
 https://raw.githubusercontent.com/acil-bwh/ChestImagingPlatform/develop/cip_python/dcnn/data/data_processing.py
 """
 import math
+import itertools
 import vtk
 import numpy as np
+import torch
+import torch.nn.functional as F
 import SimpleITK as sitk
 from PIL import Image
 from scipy.ndimage.filters import gaussian_filter
@@ -12,6 +15,138 @@ from scipy.ndimage.interpolation import map_coordinates
 import scipy.ndimage.interpolation as scipy_interpolation
 
 
+def _cubic_bspline(t):
+    """
+    centered cubic B-spline kernel
+    """
+    t = t.abs()
+    return torch.where(
+        t < 1,
+        (4 - 6 * t ** 2 + 3 * t ** 3) / 6,
+        torch.where(t < 2, (2 - t) ** 3 / 6, torch.zeros_like(t)),
+    )
+
+
+def _mirror_index(index, size):
+    """
+    whole-sample symmetric boundary (as itk::BSplineInterpolateImageFunction)
+    """
+    if size == 1:
+        return torch.zeros_like(index)
+    period = 2 * (size - 1)
+    index = index.abs() % period
+    return torch.where(index >= size, period - index, index)
+
+
+def _bspline_prefilter_matrix(size, dtype=torch.float64):
+    """
+    the cubic B-spline interpolation coefficients along an axis of length size are prefilter_matrix @ samples
+    (mirror boundary, as itk::BSplineDecompositionImageFilter)
+    """
+    if size == 1:
+        return torch.ones(1, 1, dtype=dtype)
+    index = torch.arange(size)
+    sampling = torch.zeros(size, size, dtype=dtype)
+    sampling[index, index] = 4.0 / 6
+    for shift in [-1, 1]:
+        sampling.index_put_(
+            (index, _mirror_index(index + shift, size)),
+            torch.full((size,), 1.0 / 6, dtype=dtype),
+            accumulate=True,
+        )
+    return torch.linalg.inv(sampling)
+
+
+def _interpolation_matrix(position, size, interpolator, dtype=torch.float64):
+    """
+    the values of a signal of length size sampled at the continuous indices position are
+    interpolation_matrix @ samples, also returns a mask of the positions inside [-0.5, size-0.5]
+    """
+    n = len(position)
+    position = position.to(dtype)
+    matrix = torch.zeros(n, size, dtype=dtype)
+    rows = torch.arange(n)
+    if interpolator == "nearest":
+        matrix[rows, torch.floor(position + 0.5).long().clamp(0, size - 1)] = 1
+    elif interpolator == "linear":
+        floor = torch.floor(position)
+        weight = position - floor
+        floor = floor.long()
+        matrix.index_put_(
+            (rows, floor.clamp(0, size - 1)), 1 - weight, accumulate=True
+        )
+        matrix.index_put_(
+            (rows, (floor + 1).clamp(0, size - 1)), weight, accumulate=True
+        )
+    elif interpolator == "bspline":
+        start = torch.floor(position).long() - 1
+        for k in range(4):
+            index = start + k
+            matrix.index_put_(
+                (rows, _mirror_index(index, size)),
+                _cubic_bspline(position - index.to(dtype)),
+                accumulate=True,
+            )
+        matrix = matrix @ _bspline_prefilter_matrix(size, dtype)
+    else:
+        raise ValueError("unknown interpolator {}".format(interpolator))
+    inside = (position >= -0.5) & (position <= size - 0.5)
+    return matrix, inside
+
+
+def _apply_axis_matrices(image, matrices):
+    """
+    apply one matrix per spatial axis to a BxCxDxHxW (or BxCxHxW) image
+    """
+    for axis, matrix in enumerate(matrices):
+        image = torch.movedim(image, axis + 2, -1)
+        image = image @ matrix.t().to(image.dtype).to(image.device)
+        image = torch.movedim(image, -1, axis + 2)
+    return image.contiguous()
+
+
+def _bspline_grid(size, mesh_size):
+    """
+    continuous index of the first control point and the control point spacing (in voxels) of a B-spline transform
+    covering an axis of length size with mesh_size cells, the same grid as sitk.BSplineTransformInitializer
+    """
+    grid_spacing = (size + 0.25) / mesh_size
+    return -0.625 - grid_spacing, grid_spacing
+
+
+def _bspline_weights(position, size, mesh_size):
+    """
+    indices (Nx4) and weights (Nx4) of the control points supporting the continuous indices position
+    """
+    grid_start, grid_spacing = _bspline_grid(size, mesh_size)
+    grid_position = (position - grid_start) / grid_spacing
+    index = (torch.floor(grid_position).long() - 1)[:, None] + torch.arange(
+        4, device=position.device
+    )
+    weight = _cubic_bspline(grid_position[:, None] - index.to(position.dtype))
+    return index.clamp(0, mesh_size + 2), weight
+
+
+def _bspline_sample(coefficients, position):
+    """
+    evaluate a cubic B-spline defined by its (prefiltered) coefficients BxCxDxHxW at continuous indices BxNx3
+    """
+    B, C = coefficients.shape[:2]
+    size = coefficients.shape[2:]
+    dim = len(size)
+    start = torch.floor(position).long() - 1
+    flat = coefficients.view(B, C, -1)
+    output = torch.zeros(B, C, position.shape[1], dtype=coefficients.dtype, device=coefficients.device)
+    for offset in itertools.product(range(4), repeat=dim):
+        index = start + torch.tensor(offset, device=position.device)
+        weight = _cubic_bspline(position - index.to(position.dtype)).prod(-1)
+        flat_index = torch.zeros_like(index[..., 0])
+        for d in range(dim):
+            flat_index = flat_index * size[d] + _mirror_index(index[..., d], size[d])
+        output += weight[:, None] * torch.gather(flat, 2, flat_index[:, None].expand(-1, C, -1))
+    return output
+
+
 class DataProcessing(object):
     @classmethod
     def resample_image_itk(
@@ -119,6 +254,288 @@ class DataProcessing(object):
         resampler.SetOutputOrigin(output_origin)
         return resampler.Execute(image)
 
+    @classmethod
+    def resample_image_torch_by_spacing_and_size(
+        cls,
+        image,
+        spacing,
+        output_spacing,
+        output_size,
+        interpolator="bspline",
+        padding_value=0.0,
+        output_offset=None,
+    ):
+        """
+        Batched image resampling in torch, the counterpart of the SimpleITK resample_image_itk* functions for
+        images with an identity direction. The resampling is separable and computed with one matrix per axis, so
+        it runs multi-threaded on CPU (torch intra-op threads) or on GPU.
+        Spatial quantities are given in the array axis order of the tensor (z, y, x for sitk.GetArrayFromImage)
+        :param image: torch tensor BxCxDxHxW (or BxCxHxW)
+        :param spacing: input spacing
+        :param output_spacing: output spacing
+        :param output_size: output size
+        :param interpolator: str. nearest | linear | bspline (cubic B-spline, as sitk.sitkBSpline)
+        :param padding_value: pixel value when a transformed pixel is outside of the image
+        :param output_offset: physical position of the output origin relative to the input origin (default: 0)
+        :return: torch tensor BxCx(output_size)
+        """
+        dim = len(output_size)
+        output_offset = [0.0] * dim if output_offset is None else output_offset
+        matrices, insides = [], []
+        for d in range(dim):
+            position = (
+                output_offset[d] + torch.arange(int(output_size[d])) * output_spacing[d]
+            ) / spacing[d]
+            matrix, inside = _interpolation_matrix(
+                position, image.shape[d + 2], interpolator
+            )
+            matrices.append(matrix)
+            insides.append(inside.to(image.device))
+        output = _apply_axis_matrices(image, matrices)
+        inside = insides[0]
+        for d in range(1, dim):
+            inside = inside[..., None] & insides[d]
+        return torch.where(
+            inside, output, torch.full_like(output, float(padding_value))
+        )
+
+    @classmethod
+    def resample_image_torch(
+        cls, image, spacing, output_size, interpolator="bspline", padding_value=0.0
+    ):
+        """
+        Batched image resampling in torch, see resample_image_itk
+        :param image: torch tensor BxCxDxHxW
+        :param spacing: input spacing (array axis order)
+        :param output_size: output size
+        :param interpolator: str. nearest | linear | bspline
+        :return: tuple with the resampled tensor and array with the resulting output spacing
+        """
+        output_size = np.array(output_size)
+        factor = np.asarray(image.shape[2:]) / output_size.astype(np.float32)
+        output_spacing = np.asarray(spacing) * factor
+        output = cls.resample_image_torch_by_spacing_and_size(
+            image, spacing, output_spacing, output_size, interpolator, padding_value
+        )
+        return output, output_spacing
+
+    @classmethod
+    def resample_image_torch_by_spacing(
+        cls, image, spacing, output_spacing, interpolator="bspline", padding_value=0.0
+    ):
+        """
+        Batched image resampling in torch, see resample_image_itk_by_spacing
+        :param image: torch tensor BxCxDxHxW
+        :param spacing: input spacing (array axis order)
+        :param output_spacing: output spacing
+        :param interpolator: str. nearest | linear | bspline
+        :return: resampled tensor
+        """
+        output_spacing = np.asarray(output_spacing)
+        factor = np.asarray(spacing) / output_spacing.astype(np.float32)
+        output_size = np.round(np.asarray(image.shape[2:]) * factor + 0.0005).astype(
+            np.uint32
+        )
+        return cls.resample_image_torch_by_spacing_and_size(
+            image, spacing, output_spacing, output_size, interpolator, padding_value
+        )
+
+    @classmethod
+    def bspline_displacement_torch(cls, coefficients, image_size, spacing, points=None):
+        """
+        Displacement of a cubic B-spline transform, with the control grid of sitk.BSplineTransformInitializer
+        :param coefficients: torch tensor Bxdimx(mesh_size+3), physical displacements of the control points,
+            channels and axes in the array axis order
+        :param image_size: size of the image domain (array axis order)
+        :param spacing: image spacing (array axis order)
+        :param points: torch tensor BxNxdim continuous indices, if None the displacement is computed on the image grid
+        :return: physical displacement, Bxdimx(image_size) or BxNxdim
+        """
+        dim = len(image_size)
+        mesh_size = [s - 3 for s in coefficients.shape[2:]]
+        if points is None:
+            matrices = []
+            for d in range(dim):
+                position = torch.arange(image_size[d], dtype=torch.float64)
+                index, weight = _bspline_weights(position, image_size[d], mesh_size[d])
+                matrix = torch.zeros(image_size[d], mesh_size[d] + 3, dtype=torch.float64)
+                matrix.scatter_add_(1, index, weight)
+                matrices.append(matrix)
+            return _apply_axis_matrices(coefficients, matrices)
+        B, N, _ = points.shape
+        indices, weights = [], []
+        for d in range(dim):
+            index, weight = _bspline_weights(
+                points[..., d].reshape(-1), image_size[d], mesh_size[d]
+            )
+            indices.append(index.view(B, N, 4))
+            weights.append(weight.view(B, N, 4))
+        flat = coefficients.reshape(B, dim, -1)
+        displacement = torch.zeros_like(points)
+        for offset in itertools.product(range(4), repeat=dim):
+            flat_index = torch.zeros_like(indices[0][..., 0])
+            weight = torch.ones_like(weights[0][..., 0])
+            for d in range(dim):
+                flat_index = flat_index * (mesh_size[d] + 3) + indices[d][..., offset[d]]
+                weight = weight * weights[d][..., offset[d]]
+            value = torch.gather(flat, 2, flat_index[:, None].expand(-1, dim, -1))
+            displacement += weight[..., None] * value.transpose(1, 2)
+        return displacement
+
+    @classmethod
+    def warp_image_torch(
+        cls, image, displacement, spacing, interpolator="linear", padding_value=0.0
+    ):
+        """
+        Warp a batch of images, output(x) = image(x + displacement(x)), as sitk.Resample with a displacement transform
+        :param image: torch tensor BxCxDxHxW
+        :param displacement: torch tensor Bx3xDxHxW, physical displacement (array axis order)
+        :param spacing: image spacing (array axis order)
+        :param interpolator: str. nearest | linear | bspline
+        :param padding_value: pixel value when a transformed pixel is outside of the image
+        :return: warped tensor BxCxDxHxW
+        """
+        B, C = image.shape[:2]
+        size = image.shape[2:]
+        dim = len(size)
+        grid = torch.stack(
+            torch.meshgrid(
+                *[torch.arange(s, dtype=image.dtype, device=image.device) for s in size]
+            ),
+            0,
+        )
+        spacing = torch.tensor(spacing, dtype=image.dtype, device=image.device)
+        position = grid[None] + displacement.to(image.dtype) / spacing.view(1, dim, *[1] * dim)
+        position = position.view(B, dim, -1).transpose(1, 2)
+        size_t = torch.tensor(size, dtype=image.dtype, device=image.device)
+        inside = ((position >= -0.5) & (position <= size_t - 0.5)).all(-1)
+        if interpolator == "bspline":
+            coefficients = _apply_axis_matrices(
+                image, [_bspline_prefilter_matrix(s) for s in size]
+            )
+            output = _bspline_sample(coefficients, position)
+        elif interpolator in ["linear", "nearest"]:
+            # grid_sample expects normalized (x, y, z) coordinates
+            normalized = (position / (size_t - 1).clamp(min=1) * 2 - 1).flip(-1)
+            output = F.grid_sample(
+                image,
+                normalized.view(B, -1, *[1] * (dim - 1), dim),
+                mode="bilinear" if interpolator == "linear" else "nearest",
+                padding_mode="border",
+                align_corners=True,
+            ).view(B, C, -1)
+        else:
+            raise ValueError("unknown interpolator {}".format(interpolator))
+        output = torch.where(
+            inside[:, None], output, torch.full_like(output, float(padding_value))
+        )
+        return output.view(B, C, *size)
+
+    @classmethod
+    def random_bspline_elastic_deformation_torch(
+        cls,
+        image,
+        spacing,
+        mesh_size=(4, 4, 4),
+        magnitude=5.0,
+        interpolator="linear",
+        padding_value=0.0,
+        generator=None,
+    ):
+        """
+        Batched random B-spline elastic deformation, the control point displacements are uniform in
+        [-magnitude, magnitude] (physical units); equivalent to sitk.Resample with a sitk.BSplineTransform
+        initialized by sitk.BSplineTransformInitializer(image, mesh_size) and the same coefficients
+        :param image: torch tensor BxCxDxHxW
+        :param spacing: image spacing (array axis order)
+        :param mesh_size: number of B-spline cells per axis (array axis order)
+        :param magnitude: float. Maximum displacement of the control points
+        :param generator: torch.Generator, for reproducible deformations
+        :return: tuple with the warped tensor and the B-spline coefficients (see bspline_displacement_torch,
+                 which also transforms the coordinates of points in the warped image)
+        """
+        B = image.shape[0]
+        dim = len(mesh_size)
+        coefficients = (
+            torch.rand(
+                B, dim, *[m + 3 for m in mesh_size], generator=generator, dtype=torch.float64
+            )
+            * 2
+            - 1
+        ) * magnitude
+        coefficients = coefficients.to(image.device)
+        displacement = cls.bspline_displacement_torch(
+            coefficients, image.shape[2:], spacing
+        )
+        warped = cls.warp_image_torch(
+            image, displacement, spacing, interpolator, padding_value
+        )
+        return warped, coefficients
+
+    @classmethod
+    def random_bspline_elastic_deformation(
+        cls,
+        image,
+        mesh_size=(4, 4, 4),
+        magnitude=5.0,
+        interpolator=sitk.sitkLinear,
+        padding_value=0.0,
+        use_torch=False,
+        generator=None,
+    ):
+        """
+        Random B-spline elastic deformation of a SimpleITK image, the control point displacements are uniform in
+        [-magnitude, magnitude] (physical units) on the grid of sitk.BSplineTransformInitializer(image, mesh_size)
+        :param image: simpleITK image, with an identity direction
+        :param mesh_size: number of B-spline cells per axis (x, y, z order, as sitk)
+        :param magnitude: float. Maximum displacement of the control points
+        :param interpolator: simpleITK interpolator, sitkNearestNeighbor | sitkLinear | sitkBSpline
+        :param padding_value: pixel value when a transformed pixel is outside of the image
+        :param use_torch: warp with warp_image_torch instead of sitk.Resample, same result
+        :param generator: torch.Generator, for reproducible deformations
+        :return: tuple with the warped simpleITK image and the sitk.BSplineTransform
+        """
+        dim = image.GetDimension()
+        transform = sitk.BSplineTransformInitializer(image, list(mesh_size))
+        # drawn in the array axis order of bspline_displacement_torch
+        coefficients = (
+            torch.rand(
+                dim,
+                *[m + 3 for m in mesh_size[::-1]],
+                generator=generator,
+                dtype=torch.float64
+            )
+            * 2
+            - 1
+        ) * magnitude
+        # sitk parameters: the x, y, z displacements, each over the x-fastest control grid
+        transform.SetParameters(coefficients.flip(0).reshape(-1).tolist())
+        if not use_torch:
+            warped = sitk.Resample(
+                image, image, transform, interpolator, padding_value
+            )
+            return warped, transform
+        torch_interpolator = {
+            sitk.sitkNearestNeighbor: "nearest",
+            sitk.sitkLinear: "linear",
+            sitk.sitkBSpline: "bspline",
+        }[interpolator]
+        array = sitk.GetArrayFromImage(image)
+        spacing = image.GetSpacing()[::-1]
+        displacement = cls.bspline_displacement_torch(
+            coefficients[None], array.shape, spacing
+        )
+        warped = cls.warp_image_torch(
+            torch.from_numpy(array.astype(np.float64))[None, None],
+            displacement,
+            spacing,
+            torch_interpolator,
+            padding_value,
+        )
+        warped = sitk.GetImageFromArray(warped[0, 0].numpy().astype(array.dtype))
+        warped.CopyInformation(image)
+        return warped, transform
+
     @classmethod
     def reslice_3D_image_vtk(
         cls, image, x_axis, y_axis, z_axis, center_point, target_size, output_spacing
@@ -53,35 +53,45 @@ def pdist2(x, y, p=2):
 #### thin plate spline #####
 
 class TPS:
+    """
+    thin plate spline in 3D, all methods accept either unbatched (NxD) or batched (BxNxD) inputs
+    """
+
     @staticmethod
     def fit(c, f, lambd=0.):
-        device = c.device
-
-        n = c.size(0)
-        f_dim = f.size(1)
+        """
+        :param c: control points, NxD or BxNxD
+        :param f: values at the control points, NxF or BxNxF
+        :param lambd: regularization
+        :return: theta, (N+4)xF or Bx(N+4)xF
+        """
+        batched = c.dim() == 3
+        c, f = (c, f) if batched else (c[None], f[None])
+        device, dtype = c.device, c.dtype
+        B, n, f_dim = c.shape[0], c.shape[1], f.shape[-1]
 
         U = TPS.u(TPS.d(c, c))
-        K = U + torch.eye(n).to(device) * lambd
+        K = U + torch.eye(n, device=device, dtype=dtype) * lambd
 
-        P = torch.ones((n, 4)).to(device)
-        P[:, 1:] = c
+        P = torch.ones((B, n, 4), device=device, dtype=dtype)
+        P[..., 1:] = c
 
-        v = torch.zeros((n + 4, f_dim)).to(device)
-        v[:n, :] = f
+        v = torch.zeros((B, n + 4, f_dim), device=device, dtype=dtype)
+        v[:, :n, :] = f
 
-        A = torch.zeros((n + 4, n + 4)).to(device)
-        A[:n, :n] = K
-        A[:n, -4:] = P
-        A[-4:, :n] = P.t()
+        A = torch.zeros((B, n + 4, n + 4), device=device, dtype=dtype)
+        A[:, :n, :n] = K
+        A[:, :n, -4:] = P
+        A[:, -4:, :n] = P.transpose(1, 2)
 
-        theta, _ = torch.solve(v, A)
-        return theta
+        theta = torch.linalg.solve(A, v)
+        return theta if batched else theta[0]
 
     @staticmethod
     def d(a, b):
-        ra = (a ** 2).sum(dim=1).view(-1, 1)
-        rb = (b ** 2).sum(dim=1).view(1, -1)
-        dist = ra + rb - 2.0 * torch.mm(a, b.permute(1, 0))
+        ra = (a ** 2).sum(dim=-1).unsqueeze(-1)
+        rb = (b ** 2).sum(dim=-1).unsqueeze(-2)
+        dist = ra + rb - 2.0 * torch.matmul(a, b.transpose(-1, -2))
         dist = torch.clamp(dist, 0.0, np.inf)
         return torch.sqrt(dist)
 
@@ -91,11 +101,15 @@ class TPS:
 
     @staticmethod
     def z(x, c, theta):
+        """
+        :param x: query points, MxD or BxMxD
+        :param c: control points, NxD or BxNxD
+        :param theta: output of fit, (N+4)xF or Bx(N+4)xF
+        :return: MxF or BxMxF
+        """
         U = TPS.u(TPS.d(x, c))
-        w, a = theta[:-4], theta[-4:]
-        b = torch.matmul(U, w)
-        return (a[0].unsqueeze(1) + a[1].unsqueeze(1) * x[:, 0] + a[2].unsqueeze(1) * x[:, 1] + a[3].unsqueeze(1) * x[:,
-                                                                                                                    2] + b.t()).t()
+        w, a = theta[..., :-4, :], theta[..., -4:, :]
+        return torch.matmul(U, w) + a[..., :1, :] + torch.matmul(x, a[..., 1:, :])
 
 
 def thin_plate(x1, y1, x2, lambd=0.):
@@ -105,25 +119,70 @@ def thin_plate(x1, y1, x2, lambd=0.):
     return y2
 
 
-def thin_plate_dense(x1, y1, shape, lambd=0., unroll_factor=100):
+def tps_chunk_size(nbatch, ncontrol, memory_budget_mb=512, nbuffer=3, dtype_size=4):
+    """
+    number of query points evaluated at once so that the nbuffer BxchunkxN temporaries fit in the budget
+    """
+    return max(int(memory_budget_mb * 1024 ** 2 / (nbuffer * dtype_size * nbatch * ncontrol)), 1)
+
+
+def tps_evaluate(x, c, theta, memory_budget_mb=512):
+    """
+    evaluate the TPS on BxMxD query points in chunks bounded by memory_budget_mb
+    """
+    chunk = tps_chunk_size(x.shape[0], c.shape[1], memory_budget_mb, dtype_size=x.element_size())
+    return torch.cat([TPS.z(x[:, i:i + chunk], c, theta) for i in range(0, x.shape[1], chunk)], 1)
+
+
+def thin_plate_dense(x1, y1, shape, lambd=0., unroll_factor=None, memory_budget_mb=512, coarse_factor=1,
+                     return_error=False, num_error_samples=4096):
+    """
+    fit the TPS on keypoint displacements and evaluate it densely on the image grid, all cases of the batch at once
+
+    :param x1: keypoints in [-1, 1] (x, y, z order), BxNx3
+    :param y1: keypoint displacements in [-1, 1], BxNx3
+    :param shape: D, H, W
+    :param lambd: TPS regularization
+    :param unroll_factor: number of grid chunks, if None, the chunk size is chosen from memory_budget_mb
+    :param memory_budget_mb: memory budget of the intermediate BxchunkxN kernel matrices
+    :param coarse_factor: if > 1, evaluate on a grid coarsened by this factor and trilinearly upsample
+    :param return_error: also return the error (in voxels) of the upsampled field, measured at num_error_samples
+        random voxels against the exact TPS, None if coarse_factor is 1
+    :return: dense displacement Bx3xDxHxW (in [-1, 1] units), and the error dict if return_error
+    """
     D, H, W = shape
     device = x1.device
+    B = x1.shape[0]
 
-    grid = torch.stack(torch.meshgrid(torch.linspace(0, D - 1, D),
-                                      torch.linspace(0, H - 1, H),
-                                      torch.linspace(0, W - 1, W))).permute(1, 2, 3, 0).view(-1, 3).to(device)
+    def make_grid(size):
+        return torch.stack(torch.meshgrid(*[torch.linspace(0, s - 1, n) for s, n in zip(shape, size)],
+                                          indexing='ij'), -1).view(1, -1, 3).to(device)
 
-    tps = TPS()
-    theta = tps.fit(kpts_world(x1, (D, H, W)).squeeze(0),
-                    (y1.flip(-1) * (torch.Tensor([D, H, W]).to(device) - 1) / 2).squeeze(0), lambd)
+    kpts = kpts_world(x1, (D, H, W))
+    theta = TPS.fit(kpts, y1.flip(-1) * (torch.Tensor([D, H, W]).to(device) - 1) / 2, lambd)
 
-    y2 = torch.zeros(D * H * W, 3).to(device)
-    split = np.array_split(np.arange(D * H * W), unroll_factor)
-    for i in range(unroll_factor):
-        y2[split[i], :] = tps.z(grid[split[i], :], kpts_world(x1, (D, H, W)).squeeze(0), theta)
+    grid_size = [max(int(np.ceil((s - 1) / coarse_factor)) + 1, 2) for s in shape] if coarse_factor > 1 else shape
+    grid = make_grid(grid_size).expand(B, -1, -1)
+    if unroll_factor is None:
+        y2 = tps_evaluate(grid, kpts, theta, memory_budget_mb)
+    else:
+        y2 = torch.cat([TPS.z(grid[:, split], kpts, theta)
+                        for split in np.array_split(np.arange(grid.shape[1]), unroll_factor)], 1)
+    y2 = y2.permute(0, 2, 1).reshape(B, 3, *grid_size)
+
+    error = None
+    if coarse_factor > 1:
+        y2 = F.interpolate(y2, size=(D, H, W), mode='trilinear', align_corners=True)
+        if return_error:
+            idx = torch.randint(0, D * H * W, (num_error_samples,), device=device)
+            samples = torch.stack([idx // (H * W), (idx // W) % H, idx % W], -1).to(grid.dtype)
+            exact = TPS.z(samples[None].expand(B, -1, -1), kpts, theta)
+            approx = y2.view(B, 3, -1)[:, :, idx].permute(0, 2, 1)
+            diff = (exact - approx).norm(dim=-1)
+            error = {'mean': diff.mean().item(), 'max': diff.max().item()}
 
-    return (y2.permute(1, 0).view(1, 3, D, H, W)).flip(1) * 2 / (torch.Tensor([W, H, D]).to(device) - 1).view(1, -1, 1,
-                                                                                                              1, 1)
+    dense = y2.flip(1) * 2 / (torch.Tensor([W, H, D]).to(device) - 1).view(1, -1, 1, 1, 1)
+    return (dense, error) if return_error else dense
 
 
 #### pca #####
@@ -232,9 +291,7 @@ def minconv(input, l_width):
 
 #### feature #####
 
-def mindssc(img, delta=1, sigma=0.8):
-    # see http://mpheinrich.de/pub/miccai2013_943_mheinrich.pdf for details on the MIND-SSC descriptor
-
+def _mindssc_patch_ssd(img, delta, sigma):
     device = img.device
     dtype = img.dtype
 
@@ -263,19 +320,90 @@ def mindssc(img, delta=1, sigma=0.8):
     rpad = nn.ReplicationPad3d(delta)
 
     # compute patch-ssd
-    ssd = smooth(((F.conv3d(rpad(img), mshift1, dilation=delta) - F.conv3d(rpad(img), mshift2, dilation=delta)) ** 2),
-                 sigma)
+    return smooth(((F.conv3d(rpad(img), mshift1, dilation=delta) - F.conv3d(rpad(img), mshift2, dilation=delta)) ** 2),
+                  sigma)
+
+
+def _mindssc_var(ssd):
+    return torch.mean(ssd - torch.min(ssd, 1, keepdim=True)[0], 1, keepdim=True)
 
+
+def _mindssc_from_patch_ssd(ssd, var_mean, dtype):
     # MIND equation
     mind = ssd - torch.min(ssd, 1, keepdim=True)[0]
     mind_var = torch.mean(mind, 1, keepdim=True)
-    mind_var = torch.clamp(mind_var, mind_var.mean() * 0.001, mind_var.mean() * 1000)
+    mind_var = torch.clamp(mind_var, var_mean * 0.001, var_mean * 1000)
     mind /= mind_var
     mind = torch.exp(-mind).to(dtype)
 
     # permute to have same ordering as C++ code
-    mind = mind[:, torch.Tensor([6, 8, 1, 11, 2, 10, 0, 7, 9, 4, 5, 3]).long(), :, :, :]
+    return mind[:, torch.Tensor([6, 8, 1, 11, 2, 10, 0, 7, 9, 4, 5, 3]).long(), :, :, :]
+
+
+def mindssc_halo(delta=1, sigma=0.8):
+    """number of voxels a MIND-SSC descriptor depends on along each axis, on each side"""
+    return delta + int(np.ceil(sigma * 3.0 / 2.0))
+
+
+def depth_tiles(D, tile_depth, halo):
+    """
+    split [0, D) into tiles of tile_depth voxels, each extended by halo voxels (clipped to the volume)
+
+    :return: list of (core_start, core_end, slab_start, slab_end)
+    """
+    tiles = []
+    for d0 in range(0, D, tile_depth):
+        d1 = min(d0 + tile_depth, D)
+        tiles.append((d0, d1, max(d0 - halo, 0), min(d1 + halo, D)))
+    return tiles
+
+
+def mindssc_tile_depth(img, memory_budget_mb, halo, nbuffer=80):
+    """
+    depth of a tile so that the ~nbuffer single channel temporaries of a slab fit in memory_budget_mb
+    """
+    B, _, D, H, W = img.shape
+    slab_depth = int(memory_budget_mb * 1024 ** 2 / (nbuffer * B * H * W * img.element_size()))
+    return min(max(slab_depth - 2 * halo, 1), D)
+
+
+def mindssc_var_mean(img, delta=1, sigma=0.8, memory_budget_mb=1024):
+    """
+    the global mean of the MIND variance used to clamp the local variance, computed tile by tile
+    """
+    D = img.shape[2]
+    halo = mindssc_halo(delta, sigma)
+    var_sum = 0.
+    for d0, d1, s0, s1 in depth_tiles(D, mindssc_tile_depth(img, memory_budget_mb, halo), halo):
+        var = _mindssc_var(_mindssc_patch_ssd(img[:, :, s0:s1], delta, sigma))
+        var_sum = var_sum + var[:, :, d0 - s0:d1 - s0].sum()
+    return var_sum / (img.shape[0] * img[0, 0].numel())
+
 
+def mindssc(img, delta=1, sigma=0.8, memory_budget_mb=None, var_mean=None):
+    """
+    MIND-SSC descriptor, see http://mpheinrich.de/pub/miccai2013_943_mheinrich.pdf for details
+
+    :param img: Bx1xDxHxW
+    :param memory_budget_mb: if given, the descriptor is computed in depth tiles with halos, so that the peak
+        memory besides the output is bounded by the budget, the result is the same as the untiled one
+    :param var_mean: optional precomputed mindssc_var_mean, the global statistic of the whole image
+    :return: Bx12xDxHxW
+    """
+    dtype = img.dtype
+    if memory_budget_mb is None:
+        ssd = _mindssc_patch_ssd(img, delta, sigma)
+        var_mean = _mindssc_var(ssd).mean() if var_mean is None else var_mean
+        return _mindssc_from_patch_ssd(ssd, var_mean, dtype)
+
+    B, _, D, H, W = img.shape
+    halo = mindssc_halo(delta, sigma)
+    if var_mean is None:
+        var_mean = mindssc_var_mean(img, delta, sigma, memory_budget_mb)
+    mind = torch.empty(B, 12, D, H, W, dtype=dtype, device=img.device)
+    for d0, d1, s0, s1 in depth_tiles(D, mindssc_tile_depth(img, memory_budget_mb, halo), halo):
+        ssd = _mindssc_patch_ssd(img[:, :, s0:s1], delta, sigma)[:, :, d0 - s0:d1 - s0]
+        mind[:, :, d0:d1] = _mindssc_from_patch_ssd(ssd, var_mean, dtype)
     return mind
 
 
@@ -292,21 +420,15 @@ def warp_img(img, disp, mode='bilinear', padding_mode='border'):
 
 #### similarity metrics #####
 
-def ssd(kpts_fixed, feat_fixed, feat_moving, orig_shape, disp_radius=16, disp_step=2, patch_radius=2, alpha=1.5,
-        unroll_factor=50):
-    _, N, _ = kpts_fixed.shape
-    device = kpts_fixed.device
-    D, H, W = orig_shape
-    C = feat_fixed.shape[1]
-    dtype = feat_fixed.dtype
-
+def _ssd_offsets(disp_radius, disp_step, patch_radius):
+    """
+    patch and displacement offsets in voxels, (x, y, z) ordered, of shape 1x1xPx1x3 and 1x1xQx1x3
+    """
     patch_step = disp_step  # same stride necessary for fast implementation
     patch = torch.stack(torch.meshgrid(torch.arange(0, 2 * patch_radius + 1, patch_step),
                                        torch.arange(0, 2 * patch_radius + 1, patch_step),
-                                       torch.arange(0, 2 * patch_radius + 1, patch_step))).permute(1, 2, 3,
-                                                                                                   0).contiguous().view(
+                                       torch.arange(0, 2 * patch_radius + 1, patch_step))).permute(1, 2, 3, 0).contiguous().view(
         1, 1, -1, 1, 3).float() - patch_radius
-    patch = (patch.flip(-1) * 2 / (torch.tensor([W, H, D]) - 1)).to(dtype).to(device)
 
     patch_width = round(patch.shape[2] ** (1.0 / 3))
 
@@ -315,37 +437,132 @@ def ssd(kpts_fixed, feat_fixed, feat_moving, orig_shape, disp_radius=16, disp_st
     else:
         pad = [(patch_width - 1) // 2, (patch_width - 1) // 2]
 
-    disp = torch.stack(torch.meshgrid(torch.arange(- disp_step * (disp_radius + ((pad[0] + pad[1]) / 2)),
-                                                   (disp_step * (disp_radius + ((pad[0] + pad[1]) / 2))) + 1,
-                                                   disp_step),
-                                      torch.arange(- disp_step * (disp_radius + ((pad[0] + pad[1]) / 2)),
-                                                   (disp_step * (disp_radius + ((pad[0] + pad[1]) / 2))) + 1,
-                                                   disp_step),
-                                      torch.arange(- disp_step * (disp_radius + ((pad[0] + pad[1]) / 2)),
-                                                   (disp_step * (disp_radius + ((pad[0] + pad[1]) / 2))) + 1,
-                                                   disp_step))).permute(1, 2, 3, 0).contiguous().view(1, 1, -1, 1,
-                                                                                                      3).float()
-    disp = (disp.flip(-1) * 2 / (torch.tensor([W, H, D]) - 1)).to(dtype).to(device)
+    disp_range = torch.arange(- disp_step * (disp_radius + ((pad[0] + pad[1]) / 2)),
+                              (disp_step * (disp_radius + ((pad[0] + pad[1]) / 2))) + 1,
+                              disp_step)
+    disp = torch.stack(torch.meshgrid(disp_range, disp_range, disp_range)).permute(
+        1, 2, 3, 0).contiguous().view(1, 1, -1, 1, 3).float()
+    return patch.flip(-1), disp.flip(-1), patch_width, pad
+
+
+def _ssd_chunk(feat_fixed, feat_moving, kpts, patch, disp, patch_width, disp_width, pad):
+    """
+    ssd cost volume of a chunk of keypoints, kpts (1xnx3), patch and disp are normalized to the feature grid
+    """
+    n = kpts.shape[1]
+    C = feat_fixed.shape[1]
+    width = disp_width + pad[0] + pad[1]
+    feat_fixed_patch = F.grid_sample(feat_fixed, kpts.view(1, -1, 1, 1, 3) + patch,
+                                     padding_mode='border', align_corners=True)
+    feat_moving_disp = F.grid_sample(feat_moving, kpts.view(1, -1, 1, 1, 3) + disp,
+                                     padding_mode='border', align_corners=True)
+    corr = F.conv3d(feat_moving_disp.view(1, -1, width, width, width),
+                    feat_fixed_patch.view(-1, 1, patch_width, patch_width, patch_width),
+                    groups=C * n).view(C, n, -1)
+    patch_sum = (feat_fixed_patch ** 2).squeeze(0).squeeze(3).sum(dim=2, keepdims=True)
+    disp_sum = (patch_width ** 3) * F.avg_pool3d((feat_moving_disp ** 2).view(C, -1, width, width, width),
+                                                 patch_width, stride=1).view(C, n, -1)
+    return (- 2 * corr + patch_sum + disp_sum).sum(0)
+
+
+def ssd_chunk_size(C, disp_width, pad, memory_budget_mb, nbuffer=4, dtype_size=4):
+    """
+    number of keypoints per chunk so that the ~nbuffer C x width^3 temporaries per keypoint fit in the budget
+    """
+    width = disp_width + pad[0] + pad[1]
+    return max(int(memory_budget_mb * 1024 ** 2 / (nbuffer * C * width ** 3 * dtype_size)), 1)
+
+
+def ssd(kpts_fixed, feat_fixed, feat_moving, orig_shape, disp_radius=16, disp_step=2, patch_radius=2, alpha=1.5,
+        unroll_factor=50, memory_budget_mb=None):
+    """
+    :param kpts_fixed: keypoints in [-1, 1], 1xNx3
+    :param feat_fixed: 1xCxDxHxW
+    :param feat_moving: 1xCxDxHxW
+    :param unroll_factor: number of keypoint chunks, ignored if memory_budget_mb is given
+    :param memory_budget_mb: if given, the keypoint chunk size is chosen so that the temporaries fit in the budget
+    :return: ssd cost volume 1xNx(2*disp_radius+1)^3
+    """
+    _, N, _ = kpts_fixed.shape
+    device = kpts_fixed.device
+    D, H, W = orig_shape
+    C = feat_fixed.shape[1]
+    dtype = feat_fixed.dtype
+
+    patch, disp, patch_width, pad = _ssd_offsets(disp_radius, disp_step, patch_radius)
+    patch = (patch * 2 / (torch.tensor([W, H, D]) - 1)).to(dtype).to(device)
+    disp = (disp * 2 / (torch.tensor([W, H, D]) - 1)).to(dtype).to(device)
 
     disp_width = disp_radius * 2 + 1
     ssd = torch.zeros(1, N, disp_width ** 3).to(dtype).to(device)
-    split = np.array_split(np.arange(N), unroll_factor)
-    for i in range(unroll_factor):
-        feat_fixed_patch = F.grid_sample(feat_fixed, kpts_fixed[:, split[i], :].view(1, -1, 1, 1, 3).to(dtype) + patch,
-                                         padding_mode='border', align_corners=True)
-        feat_moving_disp = F.grid_sample(feat_moving, kpts_fixed[:, split[i], :].view(1, -1, 1, 1, 3).to(dtype) + disp,
-                                         padding_mode='border', align_corners=True)
-        corr = F.conv3d(feat_moving_disp.view(1, -1, disp_width + pad[0] + pad[1], disp_width + pad[0] + pad[1],
-                                              disp_width + pad[0] + pad[1]),
-                        feat_fixed_patch.view(-1, 1, patch_width, patch_width, patch_width),
-                        groups=C * split[i].shape[0]).view(C, split[i].shape[0], -1)
-        patch_sum = (feat_fixed_patch ** 2).squeeze(0).squeeze(3).sum(dim=2, keepdims=True)
-        disp_sum = (patch_width ** 3) * F.avg_pool3d(
-            (feat_moving_disp ** 2).view(C, -1, disp_width + pad[0] + pad[1], disp_width + pad[0] + pad[1],
-                                         disp_width + pad[0] + pad[1]), patch_width, stride=1).view(C,
-                                                                                                    split[i].shape[0],
-                                                                                                    -1)
-        ssd[0, split[i], :] = ((- 2 * corr + patch_sum + disp_sum)).sum(0)
+    if memory_budget_mb is not None:
+        chunk = ssd_chunk_size(C, disp_width, pad, memory_budget_mb, dtype_size=feat_fixed.element_size())
+        split = [np.arange(i, min(i + chunk, N)) for i in range(0, N, chunk)]
+    else:
+        split = np.array_split(np.arange(N), unroll_factor)
+    for idx in split:
+        if len(idx) == 0:
+            continue
+        ssd[0, idx, :] = _ssd_chunk(feat_fixed, feat_moving, kpts_fixed[:, idx, :].to(dtype), patch, disp,
+                                    patch_width, disp_width, pad)
+
+    ssd *= (alpha / (patch_width ** 3))
+
+    return ssd
+
+
+def ssd_streaming(kpts_fixed, img_fixed, img_moving, disp_radius=16, disp_step=2, patch_radius=2, alpha=1.5,
+                  delta=1, sigma=0.8, memory_budget_mb=1024):
+    """
+    same as ssd(kpts_fixed, mindssc(img_fixed), mindssc(img_moving), ...) but the MIND-SSC descriptors are only
+    computed on depth slabs around the keypoints of each tile, so the full-image descriptors are never stored
+
+    :param kpts_fixed: keypoints in [-1, 1], 1xNx3
+    :param img_fixed: 1x1xDxHxW
+    :param img_moving: 1x1xDxHxW
+    :param memory_budget_mb: bounds the descriptor slabs and the keypoint chunks
+    :return: ssd cost volume 1xNx(2*disp_radius+1)^3
+    """
+    _, N, _ = kpts_fixed.shape
+    device = kpts_fixed.device
+    D, H, W = img_fixed.shape[2:]
+    dtype = img_fixed.dtype
+    size = torch.tensor([W, H, D]).to(device)
+
+    patch, disp, patch_width, pad = _ssd_offsets(disp_radius, disp_step, patch_radius)
+    patch, disp = patch.to(dtype).to(device), disp.to(dtype).to(device)
+    disp_width = disp_radius * 2 + 1
+    # voxels along z read around a keypoint, +1 for the trilinear interpolation
+    reach = int(np.ceil(max(patch[..., 2].abs().max().item(), disp[..., 2].abs().max().item()))) + 1
+    mind_halo = mindssc_halo(delta, sigma)
+
+    var_mean_fixed = mindssc_var_mean(img_fixed, delta, sigma, memory_budget_mb)
+    var_mean_moving = mindssc_var_mean(img_moving, delta, sigma, memory_budget_mb)
+
+    kpts = ((kpts_fixed[0].to(dtype) + 1) / 2) * (size - 1)  # Nx3 voxel coordinates
+    tile_depth = mindssc_tile_depth(img_fixed, memory_budget_mb, reach + mind_halo)
+    chunk = ssd_chunk_size(12, disp_width, pad, memory_budget_mb, dtype_size=img_fixed.element_size())
+
+    ssd = torch.zeros(1, N, disp_width ** 3).to(dtype).to(device)
+    kpts_depth = kpts[:, 2].floor().long().clamp(0, D - 1)
+    for d0, d1, s0, s1 in depth_tiles(D, tile_depth, reach):
+        kpts_index = torch.nonzero((kpts_depth >= d0) & (kpts_depth < d1)).view(-1)
+        if len(kpts_index) == 0:
+            continue
+        # at least two slices so that the slab grid can be normalized
+        s0, s1 = (max(s1 - 2, 0), max(s1, 2)) if s1 - s0 < 2 else (s0, s1)
+        m0, m1 = max(s0 - mind_halo, 0), min(s1 + mind_halo, D)
+        feat_fixed = mindssc(img_fixed[:, :, m0:m1], delta, sigma, var_mean=var_mean_fixed)[:, :, s0 - m0:s1 - m0]
+        feat_moving = mindssc(img_moving[:, :, m0:m1], delta, sigma, var_mean=var_mean_moving)[:, :, s0 - m0:s1 - m0]
+        slab_size = torch.tensor([W, H, s1 - s0]).to(device)
+        slab_offset = torch.tensor([0, 0, s0]).to(dtype).to(device)
+        patch_slab = patch * 2 / (slab_size - 1)
+        disp_slab = disp * 2 / (slab_size - 1)
+        for i in range(0, len(kpts_index), chunk):
+            idx = kpts_index[i:i + chunk]
+            kpts_slab = ((kpts[idx] - slab_offset) * 2 / (slab_size - 1) - 1)[None]
+            ssd[0, idx, :] = _ssd_chunk(feat_fixed, feat_moving, kpts_slab, patch_slab, disp_slab,
+                                        patch_width, disp_width, pad)
 
     ssd *= (alpha / (patch_width ** 3))
 
@@ -20,6 +20,7 @@ LOSS_POOL = {
     "current": CurrentDistance,
     "varifold": VarifoldDistance,
     "geomloss": GeomDistance,
+    "sliced_wasserstein": SlicedWassersteinDistance,
     "l2": L2Distance,
     "localreg": LocalReg,
     "gmm": GMMLoss,
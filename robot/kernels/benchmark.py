@@ -0,0 +1,90 @@
+"""
+benchmark of the fused multi-sigma keops reductions
+
+    python -m robot.kernels.benchmark --npoints 20000 --repeat 5
+
+compares the fused normalized_multi_gauss kernel (one reduction for every sigma and its normalizer)
+with the per-sigma sumsoftmaxweight loop, forward and forward+backward
+"""
+import argparse
+import time
+
+import torch
+
+from robot.kernels.keops_kernels import LazyKeopsKernel
+
+
+def _synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+
+
+def make_inputs(npoints, device, dtype=torch.float32):
+    x = torch.rand(1, npoints, 3, device=device, dtype=dtype, requires_grad=True)
+    y = torch.rand(1, npoints, 3, device=device, dtype=dtype)
+    b = torch.rand(1, npoints, 3, device=device, dtype=dtype, requires_grad=True)
+    return x, y, b
+
+
+def timing(func, inputs, repeat, backward=False):
+    def run_once():
+        res = func(*inputs)
+        if backward:
+            torch.autograd.grad(res.sum(), (inputs[0], inputs[2]))
+
+    run_once()
+    _synchronize(inputs[0].device)
+    start = time.time()
+    for _ in range(repeat):
+        run_once()
+    _synchronize(inputs[0].device)
+    return (time.time() - start) / repeat * 1000
+
+
+def run(npoints, repeat, sigma_list, device):
+    weight_list = [1.0 / len(sigma_list)] * len(sigma_list)
+    fused = LazyKeopsKernel(
+        "normalized_multi_gauss", sigma_list=sigma_list, weight_list=weight_list
+    )
+
+    def loop(x, y, b):
+        return LazyKeopsKernel.normalized_multi_gauss_loop(
+            x, y, b, sigma_list, weight_list
+        )
+
+    inputs = make_inputs(npoints, device)
+    err = (fused(*inputs) - loop(*inputs)).abs().max().item()
+    print(
+        "{} points, {} sigmas on {}, max abs. difference {:.2e}".format(
+            npoints, len(sigma_list), device, err
+        )
+    )
+    for name, func in [("fused", fused), ("loop", loop)]:
+        print(
+            "  {:<8s} forward {:10.2f} ms   forward+backward {:10.2f} ms".format(
+                name,
+                timing(func, inputs, repeat),
+                timing(func, inputs, repeat, backward=True),
+            )
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="fused multi-sigma kernel benchmark")
+    parser.add_argument("--npoints", type=int, default=20000, help="number of points")
+    parser.add_argument("--repeat", type=int, default=5, help="number of timed runs")
+    parser.add_argument(
+        "--sigma_list",
+        type=float,
+        nargs="+",
+        default=[0.02, 0.05, 0.1],
+        help="sigmas of the multi-scale kernel",
+    )
+    parser.add_argument(
+        "--device",
+        type=str,
+        default="cuda:0" if torch.cuda.is_available() else "cpu",
+        help="cuda:0 / cpu",
+    )
+    args = parser.parse_args()
+    run(args.npoints, args.repeat, args.sigma_list, torch.device(args.device))
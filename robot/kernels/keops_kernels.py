@@ -1,6 +1,34 @@
 import numpy as np
 import torch
 from pykeops.torch import Vi, Vj, Pm, LazyTensor
+from robot.utils.utils import get_compute_dtype
+
+
+def keops_acc_args(x):
+    """
+    reduction arguments that accumulate float16 reductions in float32
+    """
+    return {"dtype_acc": "float32"} if x.dtype == torch.float16 else {}
+
+
+def aniso_sqdist(x, y, gamma, self_center=False):
+    """
+    anisotropic squared distance (x-y)^T gamma (x-y) in LazyTensor
+
+    :param x: torch.Tensor, BxNxD
+    :param y: torch.Tensor, BxMxD
+    :param gamma: BxMxDxD  if not self_center  else BxNxDxD, symmetric
+    :param self_center: bool, gamma is defined on x instead of y
+    :return: LazyTensor BxNxM squared distance, LazyTensor BxNxMxD gamma(x-y)
+    """
+    B, D = gamma.shape[0], x.shape[-1]
+    gamma = gamma.reshape(B, -1, D * D)
+    gamma = LazyTensor(gamma[:, :, None] if self_center else gamma[:, None])
+    x = LazyTensor(x[:, :, None])  # BxNx1xD
+    y = LazyTensor(y[:, None])  # Bx1xMxD
+    diff = x - y
+    gamma_diff = gamma.matvecmult(diff)  # BxNxMxD
+    return (diff | gamma_diff), gamma_diff
 
 ##################  Lazy Tensor  #######################
 
@@ -8,22 +36,28 @@ from pykeops.torch import Vi, Vj, Pm, LazyTensor
 class LazyKeopsKernel(object):
     """
     LazyTensor formulaton in Keops,  support batch
+
+    with precision="float16", the inputs on gpu are cast to float16, the reduction is accumulated
+    in float32 and the output is cast back to the input dtype; on cpu keops runs in float32
     """
 
-    def __init__(self, kernel_type="gauss", **kernel_args):
+    def __init__(self, kernel_type="gauss", precision="float32", **kernel_args):
         assert kernel_type in [
             "gauss",
             "multi_gauss",
             "normalized_gauss",
             "normalized_multi_gauss",
             "gauss_lin",
+            "multi_gauss_lin",
             "gauss_grad",
             "multi_gauss_grad",
-            "gauss_lin",
             "aniso_gauss",
             "aniso_multi_gauss",
+            "aniso_gauss_grad",
+            "aniso_multi_gauss_grad",
         ]
         self.kernel_type = kernel_type
+        self.precision = precision
         self.kernels = {
             "gauss": self.gauss_kernel,
             "normalized_gauss": self.normalized_gauss_kernel,
@@ -32,8 +66,11 @@ class LazyKeopsKernel(object):
             "gauss_grad": self.gaussian_gradient,
             "multi_gauss_grad": self.multi_gaussian_gradient,
             "gauss_lin": self.gauss_lin_kernel,
+            "multi_gauss_lin": self.multi_gauss_lin_kernel,
             "aniso_gauss": self.aniso_gauss_kernel,
             "aniso_multi_gauss": self.aniso_multi_gauss_kernel,
+            "aniso_gauss_grad": self.aniso_gaussian_gradient,
+            "aniso_multi_gauss_grad": self.aniso_multi_gaussian_gradient,
         }
         self.kernel = self.kernels[self.kernel_type](**kernel_args)
 
@@ -53,12 +90,13 @@ class LazyKeopsKernel(object):
             :param b: torch.Tensor, BxMxd, input val
             :return:torch.Tensor, BxNxd, output
             """
+            acc_args = keops_acc_args(b)
             x = LazyTensor(x[:, :, None] / sig2)  # BxNx1xD
             y = LazyTensor(y[:, None] / sig2)  # Bx1xMxD
             b = LazyTensor(b[:, None])  # Bx1xMxd
             dist2 = x.sqdist(y)
             kernel = (-dist2).exp()  # BxNxM
-            return (kernel * b).sum_reduction(axis=2)
+            return (kernel * b).sum_reduction(axis=2, **acc_args)
 
         return conv
 
@@ -78,11 +116,12 @@ class LazyKeopsKernel(object):
             :return:torch.Tensor, BxNxd, output
             """
             sig2 = sigma * (2 ** (1 / 2))
+            acc_args = keops_acc_args(b)
             x = LazyTensor(x[:, :, None] / sig2)  # BxNx1xD
             y = LazyTensor(y[:, None] / sig2)  # Bx1xMxD
             b = LazyTensor(b[:, None])  # Bx1xMxd
             dist2 = -x.sqdist(y)
-            return dist2.sumsoftmaxweight(b, axis=2)
+            return dist2.sumsoftmaxweight(b, axis=2, **acc_args)
 
         return conv
 
@@ -121,11 +160,16 @@ class LazyKeopsKernel(object):
             :param b: torch.Tensor, BxMxd, input val
             :return:torch.Tensor, BxNxd, output
             """
-            B, device = x.shape[0], x.device
+            B, device, dtype = x.shape[0], x.device, x.dtype
             K = len(sigma_list)
-            gammas = torch.tensor(gamma_list, device=device).view(1, 1, 1, K)
+            acc_args = keops_acc_args(b)
+            gammas = torch.tensor(gamma_list, device=device, dtype=dtype).view(
+                1, 1, 1, K
+            )
             log_ws = LazyTensor(
-                torch.tensor(log_weight_list, device=device).view(1, 1, 1, K)
+                torch.tensor(log_weight_list, device=device, dtype=dtype).view(
+                    1, 1, 1, K
+                )
             )
             x = LazyTensor(x[:, :, None])
             y = LazyTensor(y[:, None])
@@ -133,13 +177,42 @@ class LazyKeopsKernel(object):
             dist2 = x.sqdist(y)
             dist2 = dist2 * gammas
             kernel = (log_ws - dist2).exp().sum(3)
-            return (kernel * b).sum_reduction(axis=2)
+            return (kernel * b).sum_reduction(axis=2, **acc_args)
 
         return conv
 
+    @staticmethod
+    def normalized_multi_gauss_loop(x, y, b, sigma_list, weight_list):
+        """
+        reference implementation of normalized_multi_gauss, one keops reduction per sigma
+
+        :param x: torch.Tensor, BxNxD,  input position1
+        :param y: torch.Tensor, BxMxD input position2
+        :param b: torch.Tensor, BxMxd, input val
+        :return:torch.Tensor, BxNxd, output
+        """
+        acc_args = keops_acc_args(b)
+        x = LazyTensor(x[:, :, None])  # BxNx1xD
+        y = LazyTensor(y[:, None])  # Bx1xMxD
+        b = LazyTensor(b[:, None])  # Bx1xMxd
+        res = 0
+        D = x.shape[-1]
+
+        for sigma, weight in zip(sigma_list, weight_list):
+            sig2 = sigma * (2 ** (1 / D))
+            dist2 = -(x / sig2).sqdist(y / sig2)
+            res += weight * dist2.sumsoftmaxweight(b, axis=2, **acc_args)
+        return res
+
     @staticmethod
     def normalized_multi_gauss_kernel(sigma_list=None, weight_list=None):
         """
+        every sigma and its normalizer are evaluated in a single keops reduction,
+        as in sumsoftmaxweight, the exponents are shifted by the square distance of each
+        x to its nearest y, so every normalizer is at least 1 and never underflows,
+        float16 inputs fall back to one sumsoftmaxweight per sigma
+        (normalized_multi_gauss_loop)
+
         :param sigma_list: a list of sigma
         :param weight_list: corresponding list of weight, sum(weight_list)=1
         :return:
@@ -153,17 +226,29 @@ class LazyKeopsKernel(object):
             :param b: torch.Tensor, BxMxd, input val
             :return:torch.Tensor, BxNxd, output
             """
-            x = LazyTensor(x[:, :, None])  # BxNx1xD
-            y = LazyTensor(y[:, None])  # Bx1xMxD
-            b = LazyTensor(b[:, None])  # Bx1xMxd
-            res = 0
-            D = x.shape[-1]
-
-            for sigma, weight in zip(sigma_list, weight_list):
-                sig2 = sigma * (2 ** (1 / D))
-                dist2 = -(x / sig2).sqdist(y / sig2)
-                res += weight * dist2.sumsoftmaxweight(b, axis=2)
-            return res
+            if b.dtype == torch.float16:
+                return LazyKeopsKernel.normalized_multi_gauss_loop(
+                    x, y, b, sigma_list, weight_list
+                )
+            (B, N, D), d, K = x.shape, b.shape[-1], len(sigma_list)
+            device, dtype = x.device, x.dtype
+            gammas = torch.tensor(
+                [1 / (sigma * (2 ** (1 / D))) ** 2 for sigma in sigma_list],
+                device=device,
+                dtype=dtype,
+            ).view(1, 1, 1, K)
+            x_i = LazyTensor(x[:, :, None])  # BxNx1xD
+            y_j = LazyTensor(y[:, None])  # Bx1xMxD
+            b_j = LazyTensor(b[:, None])  # Bx1xMxd
+            dist2 = x_i.sqdist(y_j)  # BxNxM
+            # the normalized kernel does not depend on the shift, it is left out of the graph
+            shift_i = LazyTensor(dist2.min(dim=2).detach()[:, :, None])  # BxNx1x1
+            kernel = (-(dist2 - shift_i) * gammas).exp()  # BxNxMxK
+            res = kernel.tensorprod(b_j).concat(kernel).sum_reduction(axis=2)
+            numerator = res[..., : K * d].view(B, N, K, d)
+            normalizer = res[..., K * d :].view(B, N, K, 1)
+            weights = torch.tensor(weight_list, device=device, dtype=dtype)
+            return (weights.view(1, 1, K, 1) * numerator / normalizer).sum(2)
 
         return conv
 
@@ -181,6 +266,7 @@ class LazyKeopsKernel(object):
                 y = x
             if py is None:
                 py = px
+            acc_args = keops_acc_args(x)
             x = LazyTensor(x[:, :, None] / sigma)  # BxNx1xD
             y = LazyTensor(y[:, None] / sigma)  # Bx1xMxD
             px = LazyTensor(px[:, :, None])  # BxNx1xD
@@ -189,7 +275,9 @@ class LazyKeopsKernel(object):
             kernel = (-dist2 * 0.5).exp()
             diff_kernel = (x - y) * kernel  # BxNxMxD
             pyx = (py * px).sum()  # BxNxM
-            return (-1 / sigma) * (diff_kernel * pyx).sum_reduction(axis=2)
+            return (-1 / sigma) * (diff_kernel * pyx).sum_reduction(
+                axis=2, **acc_args
+            )
 
         return conv
 
@@ -215,6 +303,7 @@ class LazyKeopsKernel(object):
             if py is None:
                 py = px
             kernel = 0.0
+            acc_args = keops_acc_args(x)
             x = LazyTensor(x[:, :, None])  # BxNx1xD
             y = LazyTensor(y[:, None])  # Bx1xMxD
             px = LazyTensor(px[:, :, None])  # BxNx1xD
@@ -224,7 +313,7 @@ class LazyKeopsKernel(object):
                 kernel += ((-dist2 * gamma).exp()) * gamma * weight  # BxNxMx1
             diff_kernel = (x - y) * kernel  # BxNxMxD
             pyx = (py * px).sum(-1)  # BxNxM
-            return (-2) * (diff_kernel * pyx).sum_reduction(axis=2)
+            return (-2) * (diff_kernel * pyx).sum_reduction(axis=2, **acc_args)
 
         return conv
 
@@ -245,6 +334,7 @@ class LazyKeopsKernel(object):
             :param b: torch.Tensor, BxMxd, input scalar vector
             :return: torch.Tensor, BxNxd, output
             """
+            acc_args = keops_acc_args(b)
             x = LazyTensor(x[:, :, None] / sig2)
             y = LazyTensor(y[:, None] / sig2)
             u = LazyTensor(u[:, :, None])
@@ -252,84 +342,212 @@ class LazyKeopsKernel(object):
             b = LazyTensor(b[:, None])  # Bx1xMxd
             dist2 = x.sqdist(y)
             kernel = (-dist2).exp() * ((u | v).square())  # BxNxMx1
-            return (kernel * b).sum_reduction(axis=2)
+            return (kernel * b).sum_reduction(axis=2, **acc_args)
+
+        return conv
+
+    @staticmethod
+    def multi_gauss_lin_kernel(sigma_list=None, weight_list=None):
+        """
+        multi-scale gauss_lin kernel, all sigmas are summed in a single keops reduction
+        :param sigma_list: a list of sigma
+        :param weight_list: corresponding list of weight, sum(weight_list)=1
+        :return:
+        """
+        log_weight_list = [float(np.log(weight)) for weight in weight_list]
+        gamma_list = [1 / (2 * sigma * sigma) for sigma in sigma_list]
+
+        def conv(x, y, u, v, b):
+            """
+            :param x: torch.Tensor, BxNxD,  input position1
+            :param y: torch.Tensor, BxMxD input position2
+            :param u: torch.Tensor, BxNxD, input val1
+            :param v: torch.Tensor, BxMxD, input val2
+            :param b: torch.Tensor, BxMxd, input scalar vector
+            :return: torch.Tensor, BxNxd, output
+            """
+            device, dtype = x.device, x.dtype
+            K = len(sigma_list)
+            acc_args = keops_acc_args(b)
+            gammas = torch.tensor(gamma_list, device=device, dtype=dtype).view(
+                1, 1, 1, K
+            )
+            log_ws = LazyTensor(
+                torch.tensor(log_weight_list, device=device, dtype=dtype).view(
+                    1, 1, 1, K
+                )
+            )
+            x = LazyTensor(x[:, :, None])
+            y = LazyTensor(y[:, None])
+            u = LazyTensor(u[:, :, None])
+            v = LazyTensor(v[:, None])
+            b = LazyTensor(b[:, None])  # Bx1xMxd
+            dist2 = x.sqdist(y) * gammas
+            kernel = (log_ws - dist2).exp().sum(3) * ((u | v).square())  # BxNxMx1
+            return (kernel * b).sum_reduction(axis=2, **acc_args)
 
         return conv
 
     def __call__(self, *data_args):
-        return self.kernel(*data_args)
+        dtype, device = data_args[0].dtype, data_args[0].device
+        compute_dtype = get_compute_dtype(self.precision, device, backend="keops")
+        if compute_dtype in [torch.float32, dtype]:
+            return self.kernel(*data_args)
+        data_args = [
+            arg.to(compute_dtype) if arg is not None else arg for arg in data_args
+        ]
+        return self.kernel(*data_args).to(dtype)
 
     @staticmethod
     def aniso_gauss_kernel(self_center=False):
         """
-        anisotropic rbf interpolation kernel,
+        anisotropic rbf kernel, k(x,y) = exp(-(x-y)^T gamma (x-y)/2),
+        gamma is attached to y, or to x if self_center
+
+        :param self_center: bool, gamma is defined on x instead of y
+        :return:
         """
-        assert False, "not test yet"
 
         def conv(x, y, b, gamma):
             """
             :param x: torch.Tensor, BxNxD,
             :param y: torch.Tensor, BxMxD,
-            :param gamma: BxMxDxD  if not self_center  else BxNxDxD
             :param b: torch.Tensor, BxMxd, input val
+            :param gamma: BxMxDxD  if not self_center  else BxNxDxD
             :return: torch.Tensor, BxNxd, output
             """
-
-            sqrt2 = 2 ** (1 / 2)
-            x_i = LazyTensor(x[:, None, :] / sqrt2)  # (N, 1, D)  "column"
-            y_j = LazyTensor(y[None, :, :] / sqrt2)  # (1, M, D)  "line"
-            if not self_center:
-                gamma = LazyTensor(
-                    gamma.view(gamma.shape[0], gamma.shape[1], -1)[:, None]
-                )  # Bx1xMxD*D
-            else:
-                gamma = LazyTensor(
-                    gamma.view(gamma.shape[0], gamma.shape[1], -1)[:, :, None]
-                )  # BxNx1xD*D
-            D_ij = (x_i - y_j) | gamma.matvecmult(x_i - y_j)  # (N, M) squared distances
-            K_ij = (-D_ij).exp()  # (N, M)  kernel matrix
-            b_j = LazyTensor((b)[:, None, :, :])  # (B,1, M, D)
-            return (K_ij * b_j).sum(dim=2)  # BxNxd
+            acc_args = keops_acc_args(b)
+            dist2, _ = aniso_sqdist(x, y, gamma, self_center)  # BxNxM
+            kernel = (-dist2 * 0.5).exp()
+            b = LazyTensor(b[:, None])  # Bx1xMxd
+            return (kernel * b).sum_reduction(axis=2, **acc_args)
 
         return conv
 
     @staticmethod
-    def aniso_multi_gauss_kernel(relative_scale_list, weight_list, self_center=False):
+    def aniso_multi_gauss_kernel(
+        relative_scale_list=None, weight_list=None, self_center=False
+    ):
         """
-        anisotropic rbf interpolation kernel,
+        multi-scale anisotropic rbf kernel,
+        k(x,y) = sum_s weight_s * exp(-(x-y)^T gamma (x-y)/(2 rscale_s^2))
+
+        :param relative_scale_list: a list of scale relative to gamma
+        :param weight_list: corresponding list of weight, sum(weight_list)=1
+        :param self_center: bool, gamma is defined on x instead of y
+        :return:
         """
-        assert False, "not test yet"
+        log_weight_list = [float(np.log(weight)) for weight in weight_list]
+        gamma_list = [1 / (2 * rscale ** 2) for rscale in relative_scale_list]
 
         def conv(x, y, b, gamma):
             """
             :param x: torch.Tensor, BxNxD,
             :param y: torch.Tensor, BxMxD,
-            :param gamma: BxMxDxD  if not self_center  else BxNxDxD
             :param b: torch.Tensor, BxMxd, input val
+            :param gamma: BxMxDxD  if not self_center  else BxNxDxD
             :return: torch.Tensor, BxNxd, output
             """
-            kernel = 0
-            sqrt2 = 2 ** (1 / 2)
-            x_i = LazyTensor(x[:, None, :] / sqrt2)  # (N, 1, D)  "column"
-            y_j = LazyTensor(y[None, :, :] / sqrt2)  # (1, M, D)  "line"
-            b_j = LazyTensor((b)[:, None, :, :])  # (B,1, M, D
-
-            for rscale, weight in zip(relative_scale_list, weight_list):
-                gamma = gamma * (1 / rscale ** 2)
-                if not self_center:
-                    gamma = LazyTensor(
-                        gamma.view(gamma.shape[0], gamma.shape[1], -1)[:, None]
-                    )  # Bx1xMxD*D
-                else:
-                    gamma = LazyTensor(
-                        gamma.view(gamma.shape[0], gamma.shape[1], -1)[:, :, None]
-                    )  # BxNx1xD*D
-                D_ij = (x_i - y_j) | gamma.matvecmult(
-                    x_i - y_j
-                )  # (N, M) squared distances
-                K_ij = (-D_ij).exp()  # (N, M)  kernel matrix
-                kernel += weight * K_ij
-            return (kernel * b_j).sum(dim=2)
+            device, dtype = x.device, x.dtype
+            K = len(relative_scale_list)
+            acc_args = keops_acc_args(b)
+            gammas = torch.tensor(gamma_list, device=device, dtype=dtype).view(
+                1, 1, 1, K
+            )
+            log_ws = LazyTensor(
+                torch.tensor(log_weight_list, device=device, dtype=dtype).view(
+                    1, 1, 1, K
+                )
+            )
+            dist2, _ = aniso_sqdist(x, y, gamma, self_center)  # BxNxM
+            kernel = (log_ws - dist2 * gammas).exp().sum(3)
+            b = LazyTensor(b[:, None])  # Bx1xMxd
+            return (kernel * b).sum_reduction(axis=2, **acc_args)
+
+        return conv
+
+    @staticmethod
+    def aniso_gaussian_gradient(self_center=False):
+        """
+        gradient of the anisotropic rbf kernel w.r.t. its first argument,
+        the anisotropic counterpart of gauss_grad
+
+        :param self_center: bool, gamma is defined on x instead of y
+        :return:
+        """
+
+        def conv(px, x, py=None, y=None, gamma=None):
+            """
+            :param px: torch.Tensor, BxNxD,  input val1
+            :param x: torch.Tensor, BxNxD, input position1
+            :param py: torch.Tensor, BxMxD, input val2
+            :param y: torch.Tensor, BxMxD, input position2
+            :param gamma: BxMxDxD  if not self_center  else BxNxDxD
+            :return: torch.Tensor, BxNxD, output
+            """
+            if y is None:
+                y = x
+            if py is None:
+                py = px
+            acc_args = keops_acc_args(x)
+            dist2, gamma_diff = aniso_sqdist(x, y, gamma, self_center)
+            kernel = (-dist2 * 0.5).exp()  # BxNxM
+            px = LazyTensor(px[:, :, None])  # BxNx1xD
+            py = LazyTensor(py[:, None])  # Bx1xMxD
+            pyx = (py * px).sum()  # BxNxM
+            return -(gamma_diff * (kernel * pyx)).sum_reduction(axis=2, **acc_args)
+
+        return conv
+
+    @staticmethod
+    def aniso_multi_gaussian_gradient(
+        relative_scale_list=None, weight_list=None, self_center=False
+    ):
+        """
+        gradient of the multi-scale anisotropic rbf kernel w.r.t. its first argument
+
+        :param relative_scale_list: a list of scale relative to gamma
+        :param weight_list: corresponding list of weight, sum(weight_list)=1
+        :param self_center: bool, gamma is defined on x instead of y
+        :return:
+        """
+        # d/dx exp(-q/(2r^2)) = -exp(-q/(2r^2)) gamma(x-y)/r^2, 1/r^2 joins the log weight
+        log_weight_list = [
+            float(np.log(weight) - 2 * np.log(rscale))
+            for rscale, weight in zip(relative_scale_list, weight_list)
+        ]
+        gamma_list = [1 / (2 * rscale ** 2) for rscale in relative_scale_list]
+
+        def conv(px, x, py=None, y=None, gamma=None):
+            """
+            :param px: torch.Tensor, BxNxD,  input val1
+            :param x: torch.Tensor, BxNxD, input position1
+            :param py: torch.Tensor, BxMxD, input val2
+            :param y: torch.Tensor, BxMxD, input position2
+            :param gamma: BxMxDxD  if not self_center  else BxNxDxD
+            :return: torch.Tensor, BxNxD, output
+            """
+            if y is None:
+                y = x
+            if py is None:
+                py = px
+            device, dtype = x.device, x.dtype
+            K = len(relative_scale_list)
+            acc_args = keops_acc_args(x)
+            gammas = torch.tensor(gamma_list, device=device, dtype=dtype).view(
+                1, 1, 1, K
+            )
+            log_ws = LazyTensor(
+                torch.tensor(log_weight_list, device=device, dtype=dtype).view(
+                    1, 1, 1, K
+                )
+            )
+            dist2, gamma_diff = aniso_sqdist(x, y, gamma, self_center)
+            kernel = (log_ws - dist2 * gammas).exp().sum(3)  # BxNxM
+            px = LazyTensor(px[:, :, None])  # BxNx1xD
+            py = LazyTensor(py[:, None])  # Bx1xMxD
+            pyx = (py * px).sum()  # BxNxM
+            return -(gamma_diff * (kernel * pyx)).sum_reduction(axis=2, **acc_args)
 
         return conv
 
@@ -1,27 +1,59 @@
 import torch
+from robot.utils.utils import get_compute_dtype
+
+
+def aniso_sqdist(x, y, gamma, self_center=False):
+    """
+    dense anisotropic squared distance (x-y)^T gamma (x-y)
+
+    :param x: torch.Tensor, BxNxD
+    :param y: torch.Tensor, BxKxD
+    :param gamma: BxKxDxD  if not self_center  else BxNxDxD, symmetric
+    :param self_center: bool, gamma is defined on x instead of y
+    :return: BxNxK squared distance, BxNxKxD gamma(x-y)
+    """
+    diff = x[:, :, None] - y[:, None]  # BxNxKxD
+    # BxNx1xDxD if self_center else Bx1xKxDxD
+    gamma = gamma[:, :, None] if self_center else gamma[:, None]
+    gamma_diff = (gamma @ diff[..., None])[..., 0]
+    return (diff * gamma_diff).sum(-1), gamma_diff
 
 
 class TorchKernel(object):
     """
     Torch Kernel,  support batch
+
+    with precision="float16"/"bfloat16", the kernel and its reduction are evaluated
+    in the low precision dtype, only the output is cast back to the input dtype,
+    so its values carry the low precision rounding
     """
 
-    def __init__(self, kernel_type="gauss", **kernel_args):
+    def __init__(self, kernel_type="gauss", precision="float32", **kernel_args):
         assert kernel_type in [
             "gauss",
             "multi_gauss",
             "gauss_lin",
+            "multi_gauss_lin",
             "gauss_grad",
             "multi_gauss_grad",
-            "gauss_lin",
+            "aniso_gauss",
+            "aniso_multi_gauss",
+            "aniso_gauss_grad",
+            "aniso_multi_gauss_grad",
         ]
         self.kernel_type = kernel_type
+        self.precision = precision
         self.kernels = {
             "gauss": self.gauss_kernel,
             "multi_gauss": self.multi_gauss_kernel,
             "gauss_grad": self.gaussian_gradient,
             "multi_gauss_grad": self.multi_gaussian_gradient,
             "gauss_lin": self.gauss_lin_kernel,
+            "multi_gauss_lin": self.multi_gauss_lin_kernel,
+            "aniso_gauss": self.aniso_gauss_kernel,
+            "aniso_multi_gauss": self.aniso_multi_gauss_kernel,
+            "aniso_gauss_grad": self.aniso_gaussian_gradient,
+            "aniso_multi_gauss_grad": self.aniso_multi_gaussian_gradient,
         }
         self.kernel = self.kernels[self.kernel_type](**kernel_args)
 
@@ -154,5 +186,120 @@ class TorchKernel(object):
 
         return reduce
 
+    @staticmethod
+    def multi_gauss_lin_kernel(sigma_list=None, weight_list=None):
+        """
+        :param sigma_list: a list of sigma
+        :param weight_list: corresponding list of weight, sum(weight_list)=1
+        :return:
+        """
+        gamma_list = [1 / (2 * sigma * sigma) for sigma in sigma_list]
+
+        def reduce(x, y, u, v, b):
+            """
+            :param x: torch.Tensor, BxNxD,  input position1
+            :param y: torch.Tensor, BxKxD input position2
+            :param u: torch.Tensor, BxNxD, input val1
+            :param v: torch.Tensor, BxKxD, input val2
+            :param b: torch.Tensor, BxKxd, input scalar vector
+            :return: torch.Tensor, BxNxd, output
+            """
+            kernel = 0.0
+            x = x[:, :, None]
+            y = y[:, None]
+            u = u[:, :, None]
+            v = v[:, None]
+            b = b[:, None]  # Bx1xKxD
+            dist2 = ((x - y) ** 2).sum(-1, keepdim=True)  # BxNxKx1
+            for gamma, weight in zip(gamma_list, weight_list):
+                kernel += (-dist2 * gamma).exp() * weight
+            kernel = kernel * ((u * v).sum(-1, keepdim=True) ** 2)  # BxNxKx1
+            return (kernel * b).sum(axis=2)
+
+        return reduce
+
+    @staticmethod
+    def aniso_gauss_kernel(self_center=False):
+        """
+        :param self_center: bool, gamma is defined on x instead of y
+        :return:
+        """
+        return TorchKernel.aniso_multi_gauss_kernel([1.0], [1.0], self_center)
+
+    @staticmethod
+    def aniso_multi_gauss_kernel(
+        relative_scale_list=None, weight_list=None, self_center=False
+    ):
+        """
+        :param relative_scale_list: a list of scale relative to gamma
+        :param weight_list: corresponding list of weight, sum(weight_list)=1
+        :param self_center: bool, gamma is defined on x instead of y
+        :return:
+        """
+
+        def reduce(x, y, b, gamma):
+            """
+            :param x: torch.Tensor, BxNxD,
+            :param y: torch.Tensor, BxKxD,
+            :param b: torch.Tensor, BxKxd, input val
+            :param gamma: BxKxDxD  if not self_center  else BxNxDxD
+            :return: torch.Tensor, BxNxd, output
+            """
+            dist2, _ = aniso_sqdist(x, y, gamma, self_center)  # BxNxK
+            kernel = 0.0
+            for rscale, weight in zip(relative_scale_list, weight_list):
+                kernel += (-dist2 / (2 * rscale ** 2)).exp() * weight
+            return torch.bmm(kernel, b)
+
+        return reduce
+
+    @staticmethod
+    def aniso_gaussian_gradient(self_center=False):
+        """
+        :param self_center: bool, gamma is defined on x instead of y
+        :return:
+        """
+        return TorchKernel.aniso_multi_gaussian_gradient([1.0], [1.0], self_center)
+
+    @staticmethod
+    def aniso_multi_gaussian_gradient(
+        relative_scale_list=None, weight_list=None, self_center=False
+    ):
+        """
+        :param relative_scale_list: a list of scale relative to gamma
+        :param weight_list: corresponding list of weight, sum(weight_list)=1
+        :param self_center: bool, gamma is defined on x instead of y
+        :return:
+        """
+
+        def reduce(px, x, py=None, y=None, gamma=None):
+            """
+            :param px: torch.Tensor, BxNxD,  input val1
+            :param x: torch.Tensor, BxNxD, input position1
+            :param py: torch.Tensor, BxKxD, input val2
+            :param y: torch.Tensor, BxKxD, input position2
+            :param gamma: BxKxDxD  if not self_center  else BxNxDxD
+            :return: torch.Tensor, BxNxD, output
+            """
+            if y is None:
+                y = x
+            if py is None:
+                py = px
+            dist2, gamma_diff = aniso_sqdist(x, y, gamma, self_center)
+            kernel = 0.0
+            for rscale, weight in zip(relative_scale_list, weight_list):
+                kernel += (-dist2 / (2 * rscale ** 2)).exp() * (weight / rscale ** 2)
+            pyx = torch.bmm(px, py.transpose(1, 2))  # BxNxK
+            return -((kernel * pyx)[..., None] * gamma_diff).sum(2)
+
+        return reduce
+
     def __call__(self, *data_args):
-        return self.kernel(*data_args)
+        dtype, device = data_args[0].dtype, data_args[0].device
+        compute_dtype = get_compute_dtype(self.precision, device, backend="torch")
+        if compute_dtype in [torch.float32, dtype]:
+            return self.kernel(*data_args)
+        data_args = [
+            arg.to(compute_dtype) if arg is not None else arg for arg in data_args
+        ]
+        return self.kernel(*data_args).to(dtype)
@@ -0,0 +1,106 @@
+"""
+benchmark of the GeomDistance backends on large point clouds
+
+    python -m robot.metrics.benchmark --npoints 100000 --batch 2 --repeat 3
+
+compares the online keops backend with the multiscale backend (clustered inputs, kernel truncation),
+with and without the cached target clusters, runtime of a forward+backward pass and peak memory
+(allocated cuda memory on gpu, peak resident memory of the process on cpu)
+"""
+import argparse
+import resource
+import time
+
+import torch
+
+from robot.global_variable import LOSS_POOL
+from robot.utils.module_parameters import ParameterDict
+
+
+class _Shape(object):
+    def __init__(self, points):
+        self.points = points
+        self.weights = torch.ones_like(points[..., :1]) / points.shape[1]
+
+
+def make_loss(backend, blur, cluster_scale, cache):
+    opt = ParameterDict()
+    geom_obj = "geomloss.SamplesLoss(loss='sinkhorn',blur={}, scaling=0.8, debias=False, backend='{}'{})"
+    opt["geom_obj"] = geom_obj.format(
+        blur,
+        backend,
+        ", cluster_scale={}".format(cluster_scale) if cluster_scale > 0 else "",
+    )
+    opt["cache_target_clusters"] = cache
+    opt.print_settings_off()
+    return LOSS_POOL["geomloss"](opt)
+
+
+def peak_memory_mb(device):
+    if device.type == "cuda":
+        return torch.cuda.max_memory_allocated(device) / 1024 ** 2
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def timing(loss_fn, flowed, target, repeat):
+    device = flowed.points.device
+    loss = loss_fn(flowed, target)
+    torch.autograd.grad(loss.sum(), flowed.points)
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats(device)
+    start = time.time()
+    for _ in range(repeat):
+        loss = loss_fn(flowed, target)
+        torch.autograd.grad(loss.sum(), flowed.points)
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    return (time.time() - start) / repeat * 1000, loss, peak_memory_mb(device)
+
+
+def run(npoints, batch, repeat, blur, cluster_scale, device):
+    points = torch.rand(batch, npoints, 3, device=device)
+    flowed = _Shape(points.clone().requires_grad_())
+    target = _Shape(points + 0.05 * torch.randn_like(points))
+    print("{} x {} points on {}".format(batch, npoints, device))
+    for name, backend, cache in [
+        ("online", "online", False),
+        ("multiscale", "multiscale", False),
+        ("multiscale (cached)", "multiscale", True),
+    ]:
+        loss_fn = make_loss(backend, blur, cluster_scale, cache)
+        time_ms, loss, memory = timing(loss_fn, flowed, target, repeat)
+        print(
+            "  {:<20s} {:10.2f} ms   peak memory {:10.1f} MB   loss {}".format(
+                name, time_ms, memory, ["{:.4e}".format(l) for l in loss.tolist()]
+            )
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="geomloss backend benchmark")
+    parser.add_argument("--npoints", type=int, default=100000, help="points per cloud")
+    parser.add_argument("--batch", type=int, default=2, help="batch size")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs")
+    parser.add_argument("--blur", type=float, default=0.01, help="geomloss blur")
+    parser.add_argument(
+        "--cluster_scale",
+        type=float,
+        default=-1,
+        help="cluster size of the multiscale backend, geomloss heuristic if <=0",
+    )
+    parser.add_argument(
+        "--device",
+        type=str,
+        default="cuda:0" if torch.cuda.is_available() else "cpu",
+        help="cuda:0 / cpu",
+    )
+    args = parser.parse_args()
+    run(
+        args.npoints,
+        args.batch,
+        args.repeat,
+        args.blur,
+        args.cluster_scale,
+        torch.device(args.device),
+    )
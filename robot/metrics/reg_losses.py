@@ -2,27 +2,57 @@
 the code is largely borrowed from deformetrica
 here turns it into a batch version
 """
+import ast
+import weakref
 import torch
 from pykeops.torch import LazyTensor
-from robot.kernels.keops_kernels import LazyKeopsKernel
+from robot.kernels.keops_kernels import LazyKeopsKernel, keops_acc_args
 from robot.kernels.torch_kernels import TorchKernel
 from robot.modules_reg.networks.pointconv_util import index_points_group
 from robot.utils.obj_factory import obj_factory
 from robot.global_variable import Shape
-from robot.utils.utils import sigmoid_decay
+from robot.utils.utils import sigmoid_decay, get_compute_dtype, memory_sort_index
+
+
+def build_scale_kernel(opt, kernel_type, precision):
+    """
+    single scale kernel built from 'sigma', or a multi-scale kernel built from 'sigma_list'/'weight_list',
+    all the scales of the multi-scale kernel are summed in a single reduction
+    """
+    kernel_backend = opt[
+        ("kernel_backend", "torch", "kernel backend can either be 'torch'/'keops'")
+    ]
+    sigma = opt[("sigma", 0.1, "the sigma in gaussian kernel")]
+    sigma_list = opt[
+        ("sigma_list", [], "multi-scale sigmas, if not empty, replace the 'sigma'")
+    ]
+    weight_list = opt[
+        ("weight_list", [], "weight of each sigma in sigma_list, uniform if empty")
+    ]
+    kernel = LazyKeopsKernel if kernel_backend == "keops" else TorchKernel
+    if len(sigma_list) == 0:
+        return kernel(kernel_type, precision=precision, sigma=sigma)
+    if len(weight_list) == 0:
+        weight_list = [1.0 / len(sigma_list)] * len(sigma_list)
+    assert len(weight_list) == len(sigma_list)
+    return kernel(
+        "multi_" + kernel_type,
+        precision=precision,
+        sigma_list=list(sigma_list),
+        weight_list=list(weight_list),
+    )
 
 
 class CurrentDistance(object):
     def __init__(self, opt):
-        kernel_backend = opt[
-            ("kernel_backend", "torch", "kernel backend can either be 'torch'/'keops'")
+        precision = opt[
+            (
+                "precision",
+                "float32",
+                "precision of the kernel reduction: float32/float16/bfloat16, accumulated in float32",
+            )
         ]
-        sigma = opt[("sigma", 0.1, "the sigma in gaussian kernel")]
-        self.kernel = (
-            LazyKeopsKernel("gauss", sigma=sigma)
-            if kernel_backend == "keops"
-            else TorchKernel("gauss", sigma=sigma)
-        )
+        self.kernel = build_scale_kernel(opt, "gauss", precision)
 
     def __call__(self, flowed, target):
         assert flowed.type == "PolyLine"
@@ -46,15 +76,14 @@ class CurrentDistance(object):
 
 class VarifoldDistance(object):
     def __init__(self, opt):
-        kernel_backend = opt[
-            ("kernel_backend", "torch", "kernel backend can either be 'torch'/'keops'")
+        precision = opt[
+            (
+                "precision",
+                "float32",
+                "precision of the kernel reduction: float32/float16/bfloat16, accumulated in float32",
+            )
         ]
-        sigma = opt[("sigma", 0.1, "the sigma in gaussian lin kernel")]
-        self.kernel = (
-            LazyKeopsKernel("gauss_lin", sigma=sigma)
-            if kernel_backend == "keops"
-            else TorchKernel("gauss_lin", sigma=sigma)
-        )
+        self.kernel = build_scale_kernel(opt, "gauss_lin", precision)
 
     def __call__(self, flowed, target, epoch=None):
         assert flowed.type == "SurfaceMesh"
@@ -90,12 +119,57 @@ class L2Distance(object):
                 "compute distance on the specific class attribute: 'ponts','landmarks','pointfea",
             )
         ]
+        self.precision = opt[
+            (
+                "precision",
+                "float32",
+                "precision of the difference: float32/float16/bfloat16, accumulated in float32",
+            )
+        ]
 
     def __call__(self, flowed, target, epoch=None):
         batch = flowed.nbatch
         attr1 = getattr(flowed, self.attr)
         attr2 = getattr(target, self.attr)
-        return ((attr1.view(batch, -1) - attr2.view(batch, -1)) ** 2).mean(-1)  # B
+        dtype = attr1.dtype
+        compute_dtype = get_compute_dtype(self.precision, attr1.device)
+        if compute_dtype in [torch.float32, dtype]:
+            return ((attr1.view(batch, -1) - attr2.view(batch, -1)) ** 2).mean(-1)  # B
+        attr1, attr2 = attr1.to(compute_dtype), attr2.to(compute_dtype)
+        return (
+            ((attr1.view(batch, -1) - attr2.view(batch, -1)) ** 2)
+            .mean(-1, dtype=torch.float32)
+            .to(dtype)
+        )  # B
+
+
+def validate_loss_precision(loss_fn, ref_loss_fn, flowed, target):
+    """
+    compare a (low precision) loss against its full precision reference
+
+    :param loss_fn: loss to validate, e.g. built with precision="bfloat16"
+    :param ref_loss_fn: the same loss built with precision="float32"
+    :param flowed: shape, the gradient is taken w.r.t. its points
+    :param target: shape
+    :return: (max relative loss error over the batch, relative l2 error of the gradient)
+    """
+    loss_list, grad_list = [], []
+    grad_enable_record = torch.is_grad_enabled()
+    torch.set_grad_enabled(True)
+    for fn in [loss_fn, ref_loss_fn]:
+        points = flowed.points.detach().clone().requires_grad_()
+        cur_flowed = type(flowed)().set_data_with_refer_to(points, flowed)
+        loss = fn(cur_flowed, target)
+        loss_list.append(loss.detach())
+        grad_list.append(torch.autograd.grad(loss.sum(), points)[0])
+    torch.set_grad_enabled(grad_enable_record)
+    loss, ref_loss = loss_list
+    grad_points, ref_grad_points = grad_list
+    loss_err = ((loss - ref_loss).abs() / ref_loss.abs().clamp(min=1e-12)).max()
+    grad_err = (grad_points - ref_grad_points).norm() / ref_grad_points.norm().clamp(
+        min=1e-12
+    )
+    return loss_err.item(), grad_err.item()
 
 
 class LocalReg(object):
@@ -159,6 +233,13 @@ class GMMLoss:
                 "neglog_likelihood/sym_neglog_likelihood/log_sum_likelihood",
             )
         ]
+        self.precision = opt[
+            (
+                "precision",
+                "float32",
+                "precision of the keops reduction: float32/float16 (gpu only), accumulated in float32",
+            )
+        ]
 
     def update_sigma(self, epoch):
 
@@ -196,11 +277,19 @@ class GMMLoss:
     def neglog_likelihood(self, attr1, attr2, weight1, weight2):
         D = float(attr1.shape[-1])
         sigma = self.sigma
+        dtype = attr1.dtype
+        compute_dtype = get_compute_dtype(self.precision, attr1.device, backend="keops")
+        if compute_dtype not in [torch.float32, dtype]:
+            attr1, attr2 = attr1.to(compute_dtype), attr2.to(compute_dtype)
+            weight2 = weight2.to(compute_dtype)
+        acc_args = keops_acc_args(attr1)
         attr1 = LazyTensor(attr1[:, :, None] / (sigma * (2 ** (1 / 2))))
         attr2 = LazyTensor(attr2[:, None] / (sigma * (2 ** (1 / 2))))
         dist = attr1.sqdist(attr2)
         logw_j = LazyTensor(weight2.log()[:, None])  # (B,1,M,1)
-        scores_i = ((logw_j - dist).logsumexp(dim=2)) * (sigma ** D)  # (B,N, 1)
+        scores_i = (logw_j - dist).logsumexp(dim=2, **acc_args).to(dtype) * (
+            sigma ** D
+        )  # (B,N, 1)
         loss = -torch.sum(weight1 * scores_i, 1)
         return loss
 
@@ -223,6 +312,90 @@ class GMMLoss:
         return fn(attr1, attr2, weight1, weight2)
 
 
+def parse_geom_obj(geom_obj, resolved_keywords=()):
+    """
+    split a geomloss expression, e.g. "geomloss.SamplesLoss(loss='sinkhorn',blur=0.01)",
+    into the object name and its keyword arguments,
+    the keyword values must be python literals, unless they are resolved elsewhere
+    (e.g. 'blur=blurplaceholder' with the blur set in the 'geom_param' category)
+
+    :param geom_obj: str, geomloss object expression
+    :param resolved_keywords: keywords whose value is set elsewhere, they are left out
+    :return: (object name, keyword argument dict)
+    """
+    geom_obj = geom_obj.strip()
+    if "(" not in geom_obj:
+        return geom_obj, {}
+    obj_name = geom_obj[: geom_obj.find("(")]
+    call = ast.parse(geom_obj, mode="eval").body
+    geom_param = {}
+    for keyword in call.keywords:
+        if keyword.arg in resolved_keywords:
+            continue
+        try:
+            geom_param[keyword.arg] = ast.literal_eval(keyword.value)
+        except ValueError:
+            raise ValueError(
+                "the value of the keyword '{}' in {} is not a python literal, "
+                "set it in the 'geom_param' setting instead".format(
+                    keyword.arg, geom_obj
+                )
+            )
+    return obj_name, geom_param
+
+
+def get_geom_param(opt):
+    """
+    get the geomloss object name and keyword arguments from the setting,
+    the keyword arguments in the 'geom_obj' expression are updated by the 'geom_param' category,
+    so blur/reach can be set as data, e.g. opt["geom_param"]["blur"] = 0.01
+
+    :param opt: ParameterDict, geomloss setting
+    :return: (object name, keyword argument dict)
+    """
+    geom_obj = opt[
+        (
+            "geom_obj",
+            "geomloss.SamplesLoss(loss='sinkhorn',blur=0.01, scaling=0.8, debias=False)",
+            "blur argument in ot",
+        )
+    ]
+    overwrite_param = opt[
+        (
+            "geom_param",
+            {},
+            "geomloss keyword arguments that overwrite those in geom_obj, e.g. blur, reach",
+        )
+    ].ext
+    obj_name, geom_param = parse_geom_obj(geom_obj, list(overwrite_param.keys()))
+    geom_param.update(overwrite_param)
+    return obj_name, geom_param
+
+
+def set_geom_placeholders(opt, **values):
+    """
+    set the keywords written as placeholders in the 'geom_obj' expression,
+    e.g. 'blur=blurplaceholder', in the 'geom_param' category,
+    the keywords without a placeholder keep the value given in geom_obj (or its default)
+
+    :param opt: ParameterDict, geomloss setting
+    :param values: keyword -> value, e.g. blur=0.01, reach=None
+    :return: opt
+    """
+    geom_obj = opt[("geom_obj", "", "blur argument in ot")]
+    geom_param = opt[
+        (
+            "geom_param",
+            {},
+            "geomloss keyword arguments that overwrite those in geom_obj, e.g. blur, reach",
+        )
+    ]
+    for key, value in values.items():
+        if "{}placeholder".format(key) in geom_obj:
+            geom_param[key] = value
+    return opt
+
+
 class GeomDistance(object):
     def __init__(self, opt):
         self.attr = opt[
@@ -232,14 +405,130 @@ class GeomDistance(object):
                 "compute distance on the specific class attribute: 'ponts','landmarks','pointfea",
             )
         ]
-        geom_obj = opt[
+        self.geom_obj_name, self.geom_param = get_geom_param(opt)
+        self.gemoloss = obj_factory(self.geom_obj_name, **self.geom_param)
+        self.cache_target_clusters = opt[
             (
-                "geom_obj",
-                "geomloss.SamplesLoss(loss='sinkhorn',blur=0.01, scaling=0.8, debias=False)",
-                "blur argument in ot",
+                "cache_target_clusters",
+                True,
+                "multiscale backend: reuse the cluster labels of the target while it is unchanged",
+            )
+        ]
+        # (weakref of the target, (version, cluster scale), list of per batch labels)
+        self.target_clusters = None
+
+    def update_geom_param(self, **geom_param):
+        """
+        update the geomloss setting (e.g. blur, reach) in place, the loss object is not rebuilt
+        """
+        self.geom_param.update(geom_param)
+        for key, value in geom_param.items():
+            setattr(self.gemoloss, key, value)
+
+    def multi_blur(self, flowed, target, blur_list):
+        """
+        evaluate the loss at several blur levels, return BxK
+
+        the entropic ot cost is homogeneous, OT(x, y; blur) = s^p * OT(x/s, y/s; blur/s),
+        so without reach/diameter/cost, each blur level is a rescaled copy of the pair
+        and all levels are solved in one batched call; otherwise the levels are looped over
+
+        the batched call is not bit-identical to separate calls, geomloss estimates a single
+        diameter over the whole K*B stack, the largest rescaled copy sets it, so the
+        eps-scaling schedule of the other levels starts at a larger eps and takes more
+        steps, the final eps is unchanged and the losses agree up to the sinkhorn
+        convergence (~1e-3 relative)
+        """
+        attr1 = getattr(flowed, self.attr)
+        attr2 = getattr(target, self.attr)
+        weight1 = flowed.weights[:, :, 0]  # remove the last dim
+        weight2 = target.weights[:, :, 0]  # remove the last dim
+        B, K = attr1.shape[0], len(blur_list)
+        grad_enable_record = torch.is_grad_enabled()
+        batchable = all(
+            self.geom_param.get(key, None) is None
+            for key in ["reach", "diameter", "cost"]
+        ) and self.geom_param.get("backend", "auto") not in ["multiscale"]
+        if not batchable:
+            blur_record = self.gemoloss.blur
+            loss_list = []
+            for blur in blur_list:
+                self.gemoloss.blur = blur
+                loss_list.append(self.gemoloss(weight1, attr1, weight2, attr2))
+            self.gemoloss.blur = blur_record
+            torch.set_grad_enabled(grad_enable_record)
+            return torch.stack(loss_list, 1)
+        p = self.gemoloss.p
+        blur_ref = self.gemoloss.blur
+        scale = torch.tensor(
+            [blur_ref / blur for blur in blur_list],
+            dtype=attr1.dtype,
+            device=attr1.device,
+        )  # K
+        attr1 = (attr1[None] * scale.view(K, 1, 1, 1)).view(K * B, *attr1.shape[1:])
+        attr2 = (attr2[None] * scale.view(K, 1, 1, 1)).view(K * B, *attr2.shape[1:])
+        weight1, weight2 = weight1.repeat(K, 1), weight2.repeat(K, 1)
+        loss = self.gemoloss(weight1, attr1, weight2, attr2).view(K, B)
+        torch.set_grad_enabled(grad_enable_record)
+        return (loss / scale.view(K, 1) ** p).t()
+
+    def get_cluster_scale(self, points):
+        """
+        cluster size of the multiscale backend, if not set, the geomloss heuristic
+        (diameter/(sqrt(D)*2000^(1/D))) is evaluated once on the first given cloud and kept,
+        so that the cached target clusters stay valid
+        """
+        if self.gemoloss.cluster_scale is None:
+            D = points.shape[-1]
+            extent = points.max(-2)[0] - points.min(-2)[0]  # BxD
+            diameter = extent.norm(dim=-1).max().item()
+            self.gemoloss.cluster_scale = diameter / (D ** 0.5 * 2000 ** (1 / D))
+        return self.gemoloss.cluster_scale
+
+    def cluster(self, points, cluster_scale, cache=False):
+        """
+        grid cluster labels of each batch, the labels of a static cloud (the target) can be cached,
+        the cache is keyed on the tensor object itself (a weak reference) and its version counter,
+        a new target tensor, even one allocated at the same address, is clustered again
+
+        :param points: BxNxD tensor
+        :param cluster_scale: size of the cubic clusters
+        :param cache: reuse the labels computed on the same, unmodified tensor
+        :return: list of B N-sized cluster labels
+        """
+        cached = self.target_clusters
+        if (
+            cache
+            and cached is not None
+            and cached[0]() is points
+            and cached[1] == (points._version, cluster_scale)
+        ):
+            return cached[2]
+        _, labels, _ = memory_sort_index(points.detach(), cluster_scale, mode="grid")
+        labels = list(labels)
+        if cache:
+            self.target_clusters = (
+                weakref.ref(points),
+                (points._version, cluster_scale),
+                labels,
+            )
+        return labels
+
+    def multiscale_loss(self, weight1, attr1, weight2, attr2):
+        """
+        geomloss multiscale backend, it works on single measures, so the batch is looped over,
+        the clouds are clustered here at 'cluster_scale' and the labels are passed to geomloss
+        """
+        cluster_scale = self.get_cluster_scale(attr2)
+        labels1 = self.cluster(attr1, cluster_scale)
+        labels2 = self.cluster(attr2, cluster_scale, cache=self.cache_target_clusters)
+        loss = [
+            self.gemoloss(
+                labels1[b], weight1[b], attr1[b], labels2[b], weight2[b], attr2[b]
             )
+            for b in range(attr1.shape[0])
         ]
-        self.gemoloss = obj_factory(geom_obj)
+        return torch.stack(loss).view(-1)
 
     def __call__(self, flowed, target, epoch=None):
         attr1 = getattr(flowed, self.attr)
@@ -247,11 +536,109 @@ class GeomDistance(object):
         weight1 = flowed.weights[:, :, 0]  # remove the last dim
         weight2 = target.weights[:, :, 0]  # remove the last dim
         grad_enable_record = torch.is_grad_enabled()
-        loss = self.gemoloss(weight1, attr1, weight2, attr2)
+        if self.geom_param.get("backend", "auto") == "multiscale":
+            loss = self.multiscale_loss(weight1, attr1, weight2, attr2)
+        else:
+            loss = self.gemoloss(weight1, attr1, weight2, attr2)
         torch.set_grad_enabled(grad_enable_record)
         return loss
 
 
+def sliced_wasserstein(x, y, weight_x, weight_y, projections, p=2):
+    """
+    sliced wasserstein distance SW_p^p between two batched weighted point clouds,
+    each 1d problem is solved by matching the quantile functions, O((N+M)log(N+M)) per projection
+
+    :param x: BxNxD tensor
+    :param y: BxMxD tensor
+    :param weight_x: BxN tensor, normalized to sum to one
+    :param weight_y: BxM tensor, normalized to sum to one
+    :param projections: DxP tensor, unit projection directions
+    :param p: order of the wasserstein distance
+    :return: B tensor, SW_p^p averaged over the projections
+    """
+    B, N, M, P = x.shape[0], x.shape[1], y.shape[1], projections.shape[1]
+    proj_x, order_x = (x @ projections).transpose(1, 2).sort(-1)  # BxPxN
+    proj_y, order_y = (y @ projections).transpose(1, 2).sort(-1)  # BxPxM
+    weight_x = weight_x / weight_x.sum(-1, keepdim=True)
+    weight_y = weight_y / weight_y.sum(-1, keepdim=True)
+    if N == M and (weight_x == weight_x[:, :1]).all() and torch.equal(weight_x, weight_y):
+        # uniform weights of the same size, the sorted points are matched one to one
+        return ((proj_x - proj_y).abs() ** p).mean(-1).mean(-1)
+    cdf_x = weight_x[:, None].expand(B, P, N).gather(-1, order_x).cumsum(-1)
+    cdf_y = weight_y[:, None].expand(B, P, M).gather(-1, order_y).cumsum(-1)
+    # the quantile functions are piecewise constant between the merged cdf levels,
+    # the quantile index of each level is the number of levels of the same cloud before it
+    levels, order = torch.cat([cdf_x, cdf_y], -1).sort(-1)  # BxPx(N+M)
+    mass = torch.diff(levels, dim=-1, prepend=torch.zeros_like(levels[..., :1]))
+    from_x = (order < N).long()
+    index_x = from_x.cumsum(-1) - from_x
+    index_y = (1 - from_x).cumsum(-1) - (1 - from_x)
+    quantile_x = proj_x.gather(-1, index_x.clamp(max=N - 1))
+    quantile_y = proj_y.gather(-1, index_y.clamp(max=M - 1))
+    cost = (quantile_x - quantile_y).abs() ** p
+    return (cost * mass).sum(-1).mean(-1)
+
+
+class SlicedWassersteinDistance(object):
+    """
+    sliced wasserstein distance, a cheap alternative of the sinkhorn based GeomDistance,
+    e.g. for the coarse scales of the multi-scale solver
+
+    the projections are drawn at every call from an explicit, seeded generator,
+    either uniformly on the sphere ('random') or from a scrambled sobol sequence ('sobol')
+    """
+
+    def __init__(self, opt):
+        self.attr = opt[
+            (
+                "attr",
+                "points",
+                "compute distance on the specific class attribute: 'ponts','landmarks','pointfea",
+            )
+        ]
+        self.num_projections = opt[
+            ("num_projections", 64, "number of projection directions")
+        ]
+        self.projection = opt[
+            ("projection", "random", "projection generator: 'random' / 'sobol'")
+        ]
+        self.p = opt[("p", 2, "order of the wasserstein distance")]
+        self.seed = opt[("seed", 0, "seed of the projection generator")]
+        assert self.projection in ["random", "sobol"]
+        self.generator = torch.Generator().manual_seed(self.seed)
+        self.sobol_engine = None
+
+    def draw_projections(self, dim):
+        """
+        draw dim x num_projections unit directions, on cpu
+        """
+        if self.projection == "random":
+            directions = torch.randn(
+                self.num_projections, dim, generator=self.generator, dtype=torch.float64
+            )
+        else:
+            if self.sobol_engine is None or self.sobol_engine.dimension != dim:
+                self.sobol_engine = torch.quasirandom.SobolEngine(
+                    dim, scramble=True, seed=self.seed
+                )
+            uniform = self.sobol_engine.draw(self.num_projections, dtype=torch.float64)
+            uniform = uniform.clamp(1e-7, 1 - 1e-7)
+            directions = 2 ** 0.5 * torch.erfinv(2 * uniform - 1)  # gaussian
+        directions = directions / directions.norm(dim=1, keepdim=True).clamp(min=1e-12)
+        return directions.t()
+
+    def __call__(self, flowed, target, epoch=None):
+        attr1 = getattr(flowed, self.attr)
+        attr2 = getattr(target, self.attr)
+        weight1 = flowed.weights[:, :, 0]  # remove the last dim
+        weight2 = target.weights[:, :, 0]  # remove the last dim
+        projections = self.draw_projections(attr1.shape[-1]).to(
+            device=attr1.device, dtype=attr1.dtype
+        )
+        return sliced_wasserstein(attr1, attr2, weight1, weight2, projections, self.p)
+
+
 class CurvatureReg(object):
     def __init__(self, opt):
         opt.print_settings_off()
@@ -343,7 +730,7 @@ class Loss:
             (
                 "loss_list",
                 ["l2"],
-                "a list of loss name to compute: l2, geomloss, current, varifold",
+                "a list of loss name to compute: l2, geomloss, sliced_wasserstein, current, varifold",
             )
         ]
         loss_weight_strategy = opt[
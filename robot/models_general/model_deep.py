@@ -173,7 +173,7 @@ class DeepModel(ModelBase):
         loss, shape_data_dict = self.forward(input_data)
         loss = loss.mean()
         self.backward_net(loss / self.criticUpdates)
-        self.loss = loss.item()
+        self.loss = loss.detach()
         update_lr, lr = self._model.module.check_if_update_lr()
         if update_lr:
             self.update_learning_rate(lr)
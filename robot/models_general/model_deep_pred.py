@@ -1,4 +1,5 @@
 from robot.modules_general.module_deep_landmark import *
+from robot.utils.tensorboard_logger import log_buffer
 from robot.utils.utils import sigmoid_decay
 
 DEEP_PREDICTOR = {"pointconv_landmark_predictor": PointConvLandmarkPredictor}
@@ -123,17 +124,17 @@ class DeepPredictor(nn.Module):
         sim_loss = sim_loss * sim_factor
         reg_loss = reg_loss * reg_factor
         loss = sim_loss + reg_loss
-        if self.local_iter % self.print_step == 0:
-            print(
-                "{} th step, {} sim_loss is {}, reg_loss is {}, sim_factor is {}, reg_factor is {}".format(
-                    self.local_iter.item(),
-                    "synth_data" if batch_info["is_synth"] else "real_data",
-                    sim_loss.mean().item(),
-                    reg_loss.mean().item(),
-                    sim_factor,
-                    reg_factor,
-                )
-            )
-            # self.debug_mode(shape_pair)
+        log_buffer.print(
+            "{} th step, {} sim_loss is {}, reg_loss is {}, sim_factor is {}, reg_factor is {}",
+            self.local_iter,
+            "synth_data" if batch_info["is_synth"] else "real_data",
+            sim_loss.mean(),
+            reg_loss.mean(),
+            sim_factor,
+            reg_factor,
+            step=self.local_iter,
+            print_step=self.print_step,
+        )
+        # self.debug_mode(shape_pair)
         self.local_iter += 1
         return loss, self.decompose_shape_into_dict(output_shape)
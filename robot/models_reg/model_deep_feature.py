@@ -1,6 +1,7 @@
 from copy import deepcopy
 from robot.modules_reg.module_deep_feature import *
 from robot.modules_reg.module_gradient_flow import point_based_gradient_flow_guide
+from robot.utils.tensorboard_logger import log_buffer
 from robot.utils.utils import sigmoid_decay
 from robot.metrics.reg_losses import Loss
 
@@ -84,6 +85,8 @@ class DeepFeature(nn.Module):
         self.register_buffer("local_iter", torch.Tensor([0]))
         self.print_step = self.opt[("print_step", 5, "print every n iteration")]
         self.buffer = {}
+        # read-only view for the settings queried every iteration
+        self.frozen_opt = self.opt.freeze()
 
     def check_if_update_lr(self):
         return None, None
@@ -223,14 +226,14 @@ class DeepFeature(nn.Module):
 
         :return:
         """
-        sim_factor = self.opt[("sim_factor", 1, "similarity factor")]
-        reg_factor_init = self.opt[
+        sim_factor = self.frozen_opt[("sim_factor", 1, "similarity factor")]
+        reg_factor_init = self.frozen_opt[
             ("reg_factor_init", 100, "initial regularization factor")
         ]
-        reg_factor_decay = self.opt[
+        reg_factor_decay = self.frozen_opt[
             ("reg_factor_decay", 6, "regularization decay factor")
         ]
-        static_epoch = self.opt[
+        static_epoch = self.frozen_opt[
             ("static_epoch", 5, "first # epoch the factor doesn't change")
         ]
         min_threshold = 0
@@ -266,23 +269,18 @@ class DeepFeature(nn.Module):
         loss = sim_loss + reg_loss
         shape_pair.source = cur_source
 
-        if self.local_iter % self.print_step == 0:
-            # print(
-            #     "debugging: feature norm {}".format(
-            #         shape_pair.source.pointfea.norm(2, 2).mean(1)
-            #     )
-            # )
-            print(
-                "{} th step, {} sim_loss is {}, reg_loss is {}, sim_factor is {}, reg_factor is {}".format(
-                    self.local_iter.item(),
-                    "synth_data" if batch_info["is_synth"] else "real_data",
-                    sim_loss.mean().item(),
-                    reg_loss.mean().item(),
-                    sim_factor,
-                    reg_factor,
-                )
-            )
-            # self.debug_mode(shape_pair)
+        log_buffer.print(
+            "{} th step, {} sim_loss is {}, reg_loss is {}, sim_factor is {}, reg_factor is {}",
+            self.local_iter,
+            "synth_data" if batch_info["is_synth"] else "real_data",
+            sim_loss.mean(),
+            reg_loss.mean(),
+            sim_factor,
+            reg_factor,
+            step=self.local_iter,
+            print_step=self.print_step,
+        )
+        # self.debug_mode(shape_pair)
         self.local_iter += 1
 
         return loss, self.decompose_shape_pair_into_dict(shape_pair)
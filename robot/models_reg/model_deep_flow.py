@@ -2,6 +2,8 @@ from robot.modules_reg.deep_flowed_eval import deep_flow_model_eval
 from robot.modules_reg.module_gradflow_prealign import GradFlowPreAlign
 from robot.modules_reg.module_gradient_flow import point_based_gradient_flow_guide
 from robot.modules_reg.module_teaser import Teaser
+from robot.utils.module_parameters import ParameterDict
+from robot.utils.tensorboard_logger import log_buffer
 from robot.utils.utils import sigmoid_decay
 from robot.modules_reg.module_deep_flow import *
 
@@ -207,7 +209,8 @@ class DeepDiscreteFlow(nn.Module):
         )
         self.prealign_module.set_mode("prealign")
 
-    def apply_prealign_transform(self, prealign_param, points):
+    @staticmethod
+    def apply_prealign_transform(prealign_param, points):
         """
         :param prealign_param: Bx(D+1)xD: BxDxD transfrom matrix and Bx1xD translation
         :param points: BxNxD
@@ -286,26 +289,145 @@ class DeepDiscreteFlow(nn.Module):
         self.buffer["reg_loss"] = reg_loss.detach()
         sim_loss = sim_loss * sim_factor
         reg_loss = reg_loss * reg_factor
-        if self.local_iter % self.print_step == 0:
-            # if debug_reg_param<-5 or debug_reg_param>5:
-            #     print("the  average abs mean of the  average abs mean of the reg_param is {}, please adjust the 'reg_param_scale', best make it in [-1,1]".format(debug_reg_param))
-            # else:
-            #     print("the average abs mean of the reg_param is {}, best in [-1,1]".format(debug_reg_param))
-            print(
-                "the average abs mean of the reg_param is {}, best in range [-1,1]".format(
-                    debug_reg_param_list
-                )
-            )
-            print(
-                "{} th step, {} sim_loss is {}, reg_loss is {}, sim_factor is {}, reg_factor is {}".format(
-                    self.local_iter.item(),
-                    "synth_data" if batch_info["is_synth"] else "real_data",
-                    sim_loss.mean().item(),
-                    reg_loss.mean().item(),
-                    sim_factor,
-                    reg_factor,
-                )
-            )
+        log_buffer.print(
+            "the average abs mean of the reg_param is {}, best in range [-1,1]",
+            debug_reg_param_list,
+            step=self.local_iter,
+            print_step=self.print_step,
+        )
+        log_buffer.print(
+            "{} th step, {} sim_loss is {}, reg_loss is {}, sim_factor is {}, reg_factor is {}",
+            self.local_iter,
+            "synth_data" if batch_info["is_synth"] else "real_data",
+            sim_loss.mean(),
+            reg_loss.mean(),
+            sim_factor,
+            reg_factor,
+            step=self.local_iter,
+            print_step=self.print_step,
+        )
         loss = sim_loss + reg_loss
         self.local_iter += 1
         return loss, self.decompose_shape_pair_into_dict(shape_pair)
+
+
+class DeepDiscreteFlowInference(nn.Module):
+    """
+    inference view of a trained DeepDiscreteFlow, it shares the prealign module, the deep
+    reg_param generator and the flow model, the settings are resolved once at construction,
+    the loss, the regularization, the buffer and the step logging are left out
+
+    the output dict is the same as the one returned by DeepDiscreteFlow.forward
+    """
+
+    def __init__(self, model):
+        super(DeepDiscreteFlowInference, self).__init__()
+        model = getattr(model, "module", model)
+        self.create_shape_pair_from_data_dict = model.create_shape_pair_from_data_dict
+        self.decompose_shape_pair_into_dict = model.decompose_shape_pair_into_dict
+        self.use_prealign = model.use_prealign
+        if self.use_prealign:
+            self.prealign_module = model.prealign_module
+        self.deep_regparam_generator = model.deep_regparam_generator
+        self.flow_model = model.flow_model
+        self.n_step = model.n_step
+        self.reg_param_scale = model.opt[
+            ("reg_param_scale", 1, "reg param factor to adjust the reg param scale")
+        ]
+        self.use_aniso_postgradientflow = self.flow_model.use_aniso_postgradientflow
+        self.eval()
+
+    def prealign(self, shape_pair):
+        source = shape_pair.source
+        prealign_param = self.prealign_module(
+            source, shape_pair.target, shape_pair.reg_param
+        )
+        flowed_points = DeepDiscreteFlow.apply_prealign_transform(
+            prealign_param, source.points
+        )
+        return Shape().set_data_with_refer_to(flowed_points, source)
+
+    def flow_step(self, moving, shape_pair, additional_param):
+        flowed_points, _ = self.flow_model.flow_model(
+            moving, shape_pair, additional_param
+        )
+        flowed = Shape().set_data_with_refer_to(flowed_points, moving)
+        if self.use_aniso_postgradientflow:
+            flowed = self.flow_model.aniso_postgradientflow(flowed, shape_pair.target)
+        return flowed
+
+    def forward(self, input_data):
+        """
+        :param input_data: shape data dict, same as the input of DeepDiscreteFlow.forward
+        :return: shape data dict with the flowed shape
+        """
+        with torch.no_grad():
+            shape_pair = self.create_shape_pair_from_data_dict(input_data)
+            moving = (
+                self.prealign(shape_pair) if self.use_prealign else shape_pair.source
+            )
+            for _ in range(self.n_step):
+                shape_pair, additional_param = self.deep_regparam_generator(
+                    moving, shape_pair
+                )
+                shape_pair.reg_param = shape_pair.reg_param * self.reg_param_scale
+                flowed = self.flow_step(moving, shape_pair, additional_param)
+                moving = Shape().set_data_with_refer_to(flowed.points, flowed)
+            shape_pair.flowed = flowed
+        return self.decompose_shape_pair_into_dict(shape_pair)
+
+
+def export_deep_flow_inference(model, export_path, checkpoint_path=""):
+    """
+    export a trained DeepDiscreteFlow into a single file with its settings and the weights
+    of its inference view, the loss weights are dropped and the generators are not asked
+    to reload their pretrained weights, see load_deep_flow_inference
+
+    :param model: DeepDiscreteFlow (or its DataParallel wrapper)
+    :param export_path: str, path of the exported file
+    :param checkpoint_path: str, optional training checkpoint to load into the model first
+    """
+    model = getattr(model, "module", model)
+    if len(checkpoint_path):
+        state_dict = torch.load(checkpoint_path, map_location="cpu")["state_dict"]
+        state_dict = {
+            (key[len("module.") :] if key.startswith("module.") else key): value
+            for key, value in state_dict.items()
+        }
+        model.load_state_dict(state_dict)
+    settings = deepcopy(model.opt.ext)
+    for generator_name in DEEP_REGPARAM_GENERATOR:
+        generator_settings = settings.get(generator_name, None)
+        if isinstance(generator_settings, dict):
+            generator_settings["load_pretrained_model"] = False
+    # the inference view switches the shared modules into eval mode
+    training = {module: module.training for module in model.modules()}
+    inference_model = DeepDiscreteFlowInference(model)
+    for module, module_training in training.items():
+        module.training = module_training
+    inference_state_dict = inference_model.state_dict()
+    # only the training states, the step counter and the loss weights, are left out
+    ignored = [key for key in model.state_dict() if key not in inference_state_dict]
+    assert all(
+        key == "local_iter" or key.startswith("loss.") for key in ignored
+    ), "unexpected states left out of the inference model: {}".format(ignored)
+    state_dict = {
+        key: value.detach().cpu() for key, value in inference_state_dict.items()
+    }
+    torch.save({"settings": settings, "state_dict": state_dict}, export_path)
+
+
+def load_deep_flow_inference(export_path, device=torch.device("cpu")):
+    """
+    load the file written by export_deep_flow_inference
+
+    :param export_path: str, path of the exported file
+    :param device: torch.device
+    :return: DeepDiscreteFlowInference
+    """
+    exported = torch.load(export_path, map_location="cpu")
+    opt = ParameterDict(printSettings=False)
+    opt.ext = exported["settings"]
+    model = DeepDiscreteFlowInference(DeepDiscreteFlow(opt))
+    model.load_state_dict(exported["state_dict"])
+    return model.to(device)
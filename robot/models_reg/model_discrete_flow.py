@@ -3,9 +3,10 @@ from copy import deepcopy
 import torch
 import torch.nn as nn
 from robot.global_variable import Shape
-from robot.metrics.reg_losses import Loss, GeomDistance
+from robot.metrics.reg_losses import Loss, GeomDistance, set_geom_placeholders
 from robot.modules_reg.opt_flowed_eval import opt_flow_model_eval
 from robot.utils.obj_factory import obj_factory, partial_obj_factory
+from robot.utils.tensorboard_logger import log_buffer
 from robot.utils.utils import sigmoid_decay
 from robot.modules_reg.module_gradient_flow import (
     gradient_flow_guide,
@@ -110,9 +111,13 @@ class DiscreteFlowOPT(nn.Module):
             else None
         )
         self.drift_buffer = {}
+        # read-only view for the settings queried every iteration
+        self.frozen_opt = self.opt.freeze()
         if self.gradient_flow_mode:
             print("in gradient flow mode, points drift every iteration")
             self.drift_every_n_iter = 1
+        # the drift buffers hold the full batch, the solver can not evaluate a sub-batch
+        self.supports_pair_compaction = self.drift_every_n_iter == -1
 
     def set_record_path(self, record_path):
         self.record_path = record_path
@@ -191,12 +196,14 @@ class DiscreteFlowOPT(nn.Module):
 
         :return:
         """
-        sim_factor = self.opt[("sim_factor", 100, "similarity factor")]
-        init_reg_factor = self.opt[("init_reg_factor", 100, "regularization factor")]
-        min_reg_factor = self.opt[
+        sim_factor = self.frozen_opt[("sim_factor", 100, "similarity factor")]
+        init_reg_factor = self.frozen_opt[
+            ("init_reg_factor", 100, "regularization factor")
+        ]
+        min_reg_factor = self.frozen_opt[
             ("min_reg_factor", init_reg_factor / 10, "min_reg_factor")
         ]
-        decay_factor = self.opt[("decay_factor", 8, "decay_factor")]
+        decay_factor = self.frozen_opt[("decay_factor", 8, "decay_factor")]
         sim_factor = sim_factor
         reg_factor_init = init_reg_factor  # self.initial_reg_factor
         static_epoch = 10
@@ -361,18 +368,20 @@ class DiscreteFlowOPT(nn.Module):
         sim_factor, reg_factor = self.get_factor()
         sim_loss = sim_loss * sim_factor
         reg_loss = reg_loss * reg_factor
+        log_buffer.print(
+            "{} th step, sim_loss is {}, reg_loss is {}, sim_factor is {}, reg_factor is {}",
+            self.local_iter,
+            sim_loss.mean(),
+            reg_loss.mean(),
+            sim_factor,
+            reg_factor,
+            step=self.local_iter,
+            print_step=30,
+        )
         if self.local_iter % 30 == 0:
-            print(
-                "{} th step, sim_loss is {}, reg_loss is {}, sim_factor is {}, reg_factor is {}".format(
-                    self.local_iter.item(),
-                    sim_loss.item(),
-                    reg_loss.item(),
-                    sim_factor,
-                    reg_factor,
-                )
-            )
             if self.running_result_visualize or self.saving_running_result_visualize:
                 self.visualize_discreteflow(shape_pair)
+        # one energy per pair, the solver tracks the convergence of each pair
         loss = sim_loss + reg_loss
         self.local_iter += 1
         self.global_iter += 1
@@ -409,10 +418,9 @@ class DiscreteFlowOPT(nn.Module):
         """
         wassersten gradient flow has a reasonable behavior only when set self.pair_feature_extractor = None
         """
-        gradflow_guided_opt = deepcopy(
-            self.opt[("gradflow_guided", {}, "settings for gradflow guidance")]
-        )
-        gradflow_guided_opt.print_settings_off()
+        gradflow_guided_opt = self.frozen_opt[
+            ("gradflow_guided", {}, "settings for gradflow guidance")
+        ]
         post_kernel_obj = gradflow_guided_opt[
             ("post_kernel_obj", "", "shape interpolator")
         ]
@@ -485,13 +493,8 @@ class DiscreteFlowOPT(nn.Module):
         geomloss_setting = deepcopy(self.opt["gradflow_guided"]["geomloss"])
         geomloss_setting.print_settings_off()
 
-        geomloss_setting["geom_obj"] = geomloss_setting["geom_obj"].replace(
-            "blurplaceholder", str(cur_blur)
-        )
-        geomloss_setting["geom_obj"] = geomloss_setting["geom_obj"].replace(
-            "reachplaceholder", str(cur_reach) if cur_reach else "None"
-        )
-        print(geomloss_setting["geom_obj"])
+        set_geom_placeholders(geomloss_setting, blur=cur_blur, reach=cur_reach)
+        print(geomloss_setting["geom_obj"], geomloss_setting["geom_param"].ext)
         guide_fn = gradient_flow_guide(gradflow_mode)
         flowed_weights_cp = flowed.weights
         if pair_shape_transformer_obj:
@@ -4,9 +4,10 @@ import torch.nn as nn
 from robot.modules_reg.module_lddmm import LDDMMHamilton, LDDMMVariational
 from robot.modules_reg.module_gradient_flow import gradient_flow_guide
 from robot.global_variable import Shape
-from robot.metrics.reg_losses import Loss
+from robot.metrics.reg_losses import Loss, set_geom_placeholders
 from robot.modules_reg.ode_int import ODEBlock
 from robot.modules_reg.opt_flowed_eval import opt_flow_model_eval
+from robot.utils.tensorboard_logger import log_buffer
 from robot.utils.utils import sigmoid_decay
 from robot.utils.obj_factory import obj_factory
 
@@ -73,6 +74,8 @@ class LDDMMOPT(nn.Module):
             )
         ]
         self.gradflow_guided_buffer = {}
+        # the guidance buffer holds the full batch, the solver can not evaluate a sub-batch
+        self.supports_pair_compaction = not self.use_gradflow_guided
         self.geom_loss_opt_for_eval = opt[
             (
                 "geom_loss_opt_for_eval",
@@ -314,12 +317,7 @@ class LDDMMOPT(nn.Module):
             else:
                 cur_reach = None
             geomloss_setting = deepcopy(self.opt["gradflow_guided"]["geomloss"])
-            geomloss_setting["geom_obj"] = geomloss_setting["geom_obj"].replace(
-                "blurplaceholder", str(cur_blur)
-            )
-            geomloss_setting["geom_obj"] = geomloss_setting["geom_obj"].replace(
-                "reachplaceholder", str(cur_reach) if cur_reach else "None"
-            )
+            set_geom_placeholders(geomloss_setting, blur=cur_blur, reach=cur_reach)
             geomloss_setting["mode"] = "soft"
             geomloss_setting["attr"] = "pointfea"
             guide_fn = gradient_flow_guide(gradflow_mode)
@@ -364,18 +362,19 @@ class LDDMMOPT(nn.Module):
         sim_factor, reg_factor = self.get_factor()
         sim_loss = sim_loss * sim_factor
         reg_loss = reg_loss * reg_factor
-        if self.local_iter % self.print_step == 0:
-            print(
-                "{} th step, sim_loss is {}, reg_loss is {}, sim_factor is {}, reg_factor is {}".format(
-                    self.local_iter.item(),
-                    sim_loss.item(),
-                    reg_loss.item(),
-                    sim_factor,
-                    reg_factor,
-                )
-            )
-            # if self.local_iter%10==0:
-            #     self.debug(shape_pair.source, shape_pair.flowed, shape_pair.target, alias="{}_{}".format(shape_pair.pair_name[0], int(self.local_iter.item())))
+        log_buffer.print(
+            "{} th step, sim_loss is {}, reg_loss is {}, sim_factor is {}, reg_factor is {}",
+            self.local_iter,
+            sim_loss.mean(),
+            reg_loss.mean(),
+            sim_factor,
+            reg_factor,
+            step=self.local_iter,
+            print_step=self.print_step,
+        )
+        # if self.local_iter%10==0:
+        #     self.debug(shape_pair.source, shape_pair.flowed, shape_pair.target, alias="{}_{}".format(shape_pair.pair_name[0], int(self.local_iter.item())))
+        # one energy per pair, the solver tracks the convergence of each pair
         loss = sim_loss + reg_loss
         self.local_iter += 1
         self.global_iter += 1
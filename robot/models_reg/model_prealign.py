@@ -10,6 +10,7 @@ from robot.global_variable import Shape
 from robot.metrics.reg_losses import Loss
 from robot.utils.utils import sigmoid_decay
 from robot.utils.obj_factory import obj_factory
+from robot.utils.tensorboard_logger import log_buffer
 from robot.utils.utils import timming
 
 
@@ -82,7 +83,10 @@ class PrealignOPT(nn.Module):
         for i in range(dim):
             reg_param[:, i, i] = 1.0
         reg_param.requires_grad_()
-        self.identity_param = reg_param.clone().detach()
+        # shared by all pairs, so that a sub-batch of the pairs can be regularized
+        self.identity_param = torch.zeros([1, dim + 1, dim], device=device)
+        for i in range(dim):
+            self.identity_param[:, i, i] = 1.0
         shape_pair.set_reg_param(reg_param)
 
     def set_loss_fn(self, loss_fn):
@@ -134,7 +138,9 @@ class PrealignOPT(nn.Module):
         if self.call_thirdparty_package:
             return torch.tensor(-1)
         else:
-            return torch.norm(prealign_params - self.identity_param)
+            # one norm per pair
+            diff = prealign_params - self.identity_param
+            return diff.view(diff.shape[0], -1).norm(dim=1)
 
     def get_factor(self):
         """
@@ -175,16 +181,16 @@ class PrealignOPT(nn.Module):
         sim_factor, reg_factor = self.get_factor()
         sim_loss = sim_loss * sim_factor
         reg_loss = reg_loss * reg_factor
-        if self.local_iter % 10 == 0:
-            print(
-                "{} th step, sim_loss is {}, reg_loss is {}, sim_factor is {}, reg_factor is {}".format(
-                    self.local_iter.item(),
-                    sim_loss.item(),
-                    reg_loss.item(),
-                    sim_factor,
-                    reg_factor,
-                )
-            )
+        log_buffer.print(
+            "{} th step, sim_loss is {}, reg_loss is {}, sim_factor is {}, reg_factor is {}",
+            self.local_iter,
+            sim_loss.mean(),
+            reg_loss.mean(),
+            sim_factor,
+            reg_factor,
+            step=self.local_iter,
+            print_step=10,
+        )
         loss = sim_loss + reg_loss
         self.local_iter += 1
         self.global_iter += 1
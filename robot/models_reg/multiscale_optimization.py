@@ -1,9 +1,10 @@
 import os
 from copy import deepcopy
+import torch
 from robot.modules_reg.optimizer import optimizer_builder
 from robot.modules_reg.scheduler import scheduler_builder
 from robot.global_variable import SHAPE_SAMPLER_POOL
-from robot.shape.shape_pair_utils import create_shape_pair
+from robot.shape.shape_pair_utils import create_shape_pair, select_shape_pair
 from robot.utils.shape_visual_utils import save_shape_pair_into_files
 from robot.utils.obj_factory import obj_factory
 from tqdm import tqdm
@@ -140,6 +141,13 @@ def build_single_scale_general_solver(
     general solver where the param needs to optimize iteratively
     this is typically required by native displacement method, lddmm method,
 
+    the pairs of a batch are independent, if the model returns one energy per pair,
+    the convergence (rel_ftol, patient) is tracked per pair, a converged pair is frozen and,
+    if 'compact_converged_pairs' is set and the model keeps no batch state between the
+    iterations (model.supports_pair_compaction), removed from the batch the model is
+    evaluated on,
+    the iteration where each pair stops is recorded in shape_pair.extra_info["stop_iter"]
+
     :param opt:
     :param model:
     :param num_iter:
@@ -166,6 +174,20 @@ def build_single_scale_general_solver(
             "factory object for 2d capture plot",
         )
     ]
+    compact_converged_pairs = opt[
+        (
+            "compact_converged_pairs",
+            False,
+            "remove the converged pairs from the batch the model is evaluated on",
+        )
+    ]
+    supports_pair_compaction = getattr(model, "supports_pair_compaction", False)
+    if compact_converged_pairs and not supports_pair_compaction:
+        print(
+            "the model keeps full batch states between the iterations, "
+            "the converged pairs are not removed from the batch"
+        )
+        compact_converged_pairs = False
     capture_plotter = obj_factory(capture_plotter_obj)
     record_path = opt[("record_path", "", "record path")]
     record_path = os.path.join(record_path, "scale_{}".format(scale))
@@ -182,31 +204,65 @@ def build_single_scale_general_solver(
     opt_scheduler = opt[("scheduler", {}, "setting for the scheduler")]
     """settings for the scheduler"""
 
+    def stitch_flowed(shape_pair, active_pair, active, flowed_buffer):
+        """copy the outputs of the active pairs into the full batch buffers"""
+        for name in ["flowed", "flowed_control_points"]:
+            output = getattr(active_pair, name)
+            if output is None:
+                continue
+            points = output.points if name == "flowed" else output
+            if name not in flowed_buffer:
+                flowed_buffer[name] = points.detach().clone()
+            elif active_pair is not shape_pair:
+                flowed_buffer[name][active] = points.detach()
+
     def solve(shape_pair):
         model.init_reg_param(shape_pair)
         ######################################3
         shape_pair.reg_param.register_hook(silent_grad_hook)
         ############################################3
-        optimizer = optimizer_builder(opt_optim)([shape_pair.reg_param])
+        reg_param = shape_pair.reg_param
+        optimizer = optimizer_builder(opt_optim)([reg_param])
         lr_scheduler = scheduler_builder(opt_scheduler)(optimizer)
         """initialize the optimizer and scheduler"""
-        last_energy = 0.0
-        patient_count = 0
-        previous_converged_iter = 0.0
+        nbatch = reg_param.shape[0]
+        last_energy = torch.zeros(nbatch, dtype=torch.float64)
+        patient_count = torch.zeros(nbatch, dtype=torch.long)
+        previous_converged_iter = torch.zeros(nbatch, dtype=torch.long)
+        stop_iter = torch.full((nbatch,), num_iter - 1, dtype=torch.long)
+        is_active = torch.ones(nbatch, dtype=torch.bool)
+        active = torch.arange(nbatch)
+        active_pair = shape_pair
+        frozen_reg_param = reg_param.detach().clone()
+        flowed_buffer = {}
+        energy_record = []
 
         def closure():
             optimizer.zero_grad()
-            cur_energy = model(shape_pair)
-            cur_energy.backward()
-            return cur_energy
-        pbar=tqdm(range(num_iter))
+            if active_pair is not shape_pair:
+                active_pair.set_reg_param(reg_param[active.to(reg_param.device)])
+            cur_energy = model(active_pair)
+            cur_energy.sum().backward()
+            energy_record.append(cur_energy.detach().view(-1))
+            return cur_energy.sum()
+
+        pbar = tqdm(range(num_iter))
         for iter in pbar:
-            cur_energy = optimizer.step(closure)
+            energy_record.clear()
+            optimizer.step(closure)
             lr_scheduler.step(iter)
-            cur_energy = cur_energy.item()
-            rel_f = abs(last_energy - cur_energy) / (abs(cur_energy))
-            pbar.set_description(f"Current grad: {rel_f}")
-            last_energy = cur_energy
+            if not bool(is_active.all()):
+                # converged pairs stay where they stopped
+                with torch.no_grad():
+                    frozen = (~is_active).to(reg_param.device)
+                    reg_param[frozen] = frozen_reg_param[frozen]
+            cur_energy = energy_record[0].double().cpu()
+            if cur_energy.numel() != len(active):
+                # the model only returns the aggregated energy, the batch converges as a whole
+                cur_energy = cur_energy.sum().expand(len(active))
+            rel_f = (last_energy[active] - cur_energy).abs() / cur_energy.abs()
+            pbar.set_description(f"Current grad: {rel_f.max().item()}")
+            last_energy[active] = cur_energy
             if (
                 save_res
                 and shape_pair.dimension == 3
@@ -216,8 +272,8 @@ def build_single_scale_general_solver(
                 save_shape_pair_into_files(
                     shape_folder_3d,
                     "iter_{}".format(iter),
-                    shape_pair.get_pair_name(),
-                    shape_pair,
+                    active_pair.get_pair_name(),
+                    active_pair,
                 )
             if (
                 save_res
@@ -227,19 +283,47 @@ def build_single_scale_general_solver(
                 capture_plotter(
                     shape_folder_2d,
                     "iter_{}".format(iter),
-                    shape_pair.get_pair_name(),
-                    shape_pair,
+                    active_pair.get_pair_name(),
+                    active_pair,
                 )
-            if rel_f < rel_ftol:
-                print("the converge rate: {} is too small".format(rel_f))
-                patient_count = (
-                    patient_count + 1 if (iter - previous_converged_iter) == 1 else 0
+            # without compaction, the converged pairs are still evaluated, skip them
+            below_tol = (rel_f < rel_ftol) & is_active[active]
+            if not bool(below_tol.any()):
+                continue
+            below_index = active[below_tol]
+            print("the converge rate: {} is too small".format(rel_f[below_tol].tolist()))
+            patient_count[below_index] = torch.where(
+                iter - previous_converged_iter[below_index] == 1,
+                patient_count[below_index] + 1,
+                torch.zeros_like(patient_count[below_index]),
+            )
+            previous_converged_iter[below_index] = iter
+            converged = below_index[patient_count[below_index] > patient]
+            if len(converged) == 0:
+                continue
+            print(
+                "pairs {} reached relative function tolerance of = {}".format(
+                    converged.tolist(), rel_ftol
                 )
-                previous_converged_iter = iter
-                if patient_count > patient:
-                    print("Reached relative function tolerance of = " + str(rel_ftol))
-                    break
+            )
+            stop_iter[converged] = iter
+            is_active[converged] = False
+            with torch.no_grad():
+                frozen_reg_param[converged] = reg_param[converged.to(reg_param.device)]
+            if not bool(is_active.any()):
+                break
+            if compact_converged_pairs:
+                stitch_flowed(shape_pair, active_pair, active, flowed_buffer)
+                active = torch.nonzero(is_active).view(-1)
+                active_pair = select_shape_pair(shape_pair, active.to(reg_param.device))
         pbar.close()
+        if active_pair is not shape_pair:
+            stitch_flowed(shape_pair, active_pair, active, flowed_buffer)
+            shape_pair.flowed.points = flowed_buffer["flowed"]
+            if "flowed_control_points" in flowed_buffer:
+                shape_pair.set_flowed_control_points(flowed_buffer["flowed_control_points"])
+        shape_pair.set_reg_param(reg_param)
+        shape_pair.set_extra_info(stop_iter.tolist(), "stop_iter")
         if save_res:
             save_shape_pair_into_files(
                 record_path, "iter_last", shape_pair.get_pair_name(), shape_pair
@@ -302,7 +386,7 @@ def build_single_scale_model_embedded_solver(
         pbar=tqdm(range(num_iter))
         for iter in pbar:
             cur_energy = model(shape_pair)
-            cur_energy = cur_energy.item()
+            cur_energy = cur_energy.sum().item()
             rel_f = abs(last_energy - cur_energy) / (abs(cur_energy))
             pbar.set_description(f"Current grad: {rel_f}")
             last_energy = cur_energy
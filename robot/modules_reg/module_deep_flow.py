@@ -291,6 +291,13 @@ class FLOTRegParam(nn.Module):
         self.opt = opt
         self.input_channel = self.opt[("input_channel", 1, "input channel")]
         self.nb_iter = self.opt[("nb_iter", 1, "# iter for solving the ot problem")]
+        self.use_keops = self.opt[
+            (
+                "use_keops",
+                False,
+                "solve the ot problem with the KeOps log-domain sinkhorn, for large point clouds",
+            )
+        ]
         self.predict_at_low_resl = False
         local_pair_feature_extractor_obj = self.opt[
             (
@@ -326,7 +333,9 @@ class FLOTRegParam(nn.Module):
             ("pretrained_model_path", "", "path of pretrained model")
         ]
         self.flow_predictor = FLOT(
-            nb_iter=self.nb_iter, initial_channel=self.input_channel
+            nb_iter=self.nb_iter,
+            initial_channel=self.input_channel,
+            use_keops=self.use_keops,
         )
         if self.load_pretrained_model:
             checkpoint = torch.load(self.pretrained_model_path, map_location="cpu")
@@ -3,7 +3,7 @@ import numpy as np
 import torch
 from robot.global_variable import Shape
 from robot.utils.obj_factory import obj_factory
-from robot.metrics.reg_losses import GeomDistance
+from robot.metrics.reg_losses import GeomDistance, get_geom_param
 from torch.autograd import grad
 
 
@@ -42,24 +42,60 @@ def point_based_gradient_flow_guide(
         return cur_source_clone.points, loss
 
 
-def wasserstein_barycenter_mapping(cur_source, target, gemloss_setting):
-    from pykeops.torch import LazyTensor
+def _rows_per_block(nbatch, ncol, memory_budget_mb, nbuffer=3, dtype_size=4):
+    """
+    number of rows of a BxNxM block that fits into the memory budget,
+    nbuffer counts the dense temporaries alive at the same time (cost, log plan, plan)
+    """
+    budget = int(memory_budget_mb * 1024 ** 2)
+    nrow = budget // max(nbatch * ncol * nbuffer * dtype_size, 1)
+    return max(int(nrow), 1)
+
 
+def iter_log_plan_row_blocks(f, g, xx, yy, log_a=None, rows_per_block=1024):
+    """
+    stream the dense log transport plan  log_P_ij = f_i + g_j - |xx_i - yy_j|^2  over row blocks
+
+    :param f: BxN, source log potential (log a_i + F_i/blur^2)
+    :param g: BxM, target log potential (log b_j + G_j/blur^2)
+    :param xx: BxNxD, source attribute scaled by 1/(sqrt(2)*blur)
+    :param yy: BxMxD, target attribute scaled by 1/(sqrt(2)*blur)
+    :param log_a: BxN, if given, the row normalized log probability log_P_ij - log a_i is returned
+    :param rows_per_block: number of source points in each block
+    :return: generator of (row_slice, log_P_block), log_P_block is Bxnxm dense tensor
+    """
+    N = f.shape[1]
+    for start in range(0, N, rows_per_block):
+        end = min(start + rows_per_block, N)
+        C_ij = (
+            torch.cdist(
+                xx[:, start:end], yy, compute_mode="donot_use_mm_for_euclid_dist"
+            )
+            ** 2
+        )  # BxnxM
+        log_P_ij = f[:, start:end, None] + g[:, None] - C_ij
+        if log_a is not None:
+            log_P_ij = log_P_ij - log_a[:, start:end, None]
+        yield slice(start, end), log_P_ij
+
+
+def _compute_log_potentials(cur_source, target, gemloss_setting):
+    """
+    solve the entropic OT between the source and the target attribute
+
+    :return: f (BxN), g (BxM), the log potentials, and xx (BxNxD), yy (BxMxD),
+        the attributes scaled by 1/(sqrt(2)*blur), so that log_P_ij = f_i + g_j - |xx_i - yy_j|^2
+    """
     grad_enable_record = torch.is_grad_enabled()
-    geom_obj = gemloss_setting["geom_obj"].replace(")", ",potentials=True)")
-    blur_arg_filtered = filter(lambda x: "blur" in x, geom_obj.split(","))
-    blur = eval(list(blur_arg_filtered)[0].replace("blur", "").replace("=", ""))
+    geom_obj_name, geom_param = get_geom_param(gemloss_setting)
+    geom_param["potentials"] = True
+    blur = geom_param.get("blur", 0.05)  # the default blur in geomloss
     # though can be generalized to arbitrary order, here we assume the order is 2
-    mode = gemloss_setting[
-        ("mode", "soft", "soft, hard, mapped_index,analysis,trans_plan")
-    ]
-    geomloss = obj_factory(geom_obj)
+    geomloss = obj_factory(geom_obj_name, **geom_param)
     attr = gemloss_setting[("attr", "pointfea", "points/pointfea/landmarks")]
     attr1 = getattr(cur_source, attr)
     attr2 = getattr(target, attr)
-    points1 = cur_source.points
-    points2 = target.points
-    device = points1.device
+    device = attr1.device
     sqrt_const2 = torch.tensor(np.sqrt(2), dtype=torch.float32, device=device)
     weight1 = cur_source.weights[:, :, 0]  # remove the last dim
     weight2 = target.weights[:, :, 0]  # remove the last dim
@@ -68,18 +104,78 @@ def wasserstein_barycenter_mapping(cur_source, target, gemloss_setting):
     )  # todo batch sz of input and output in geomloss is not consistent
     torch.set_grad_enabled(grad_enable_record)
 
-    B, N, M, D = points1.shape[0], points1.shape[1], points2.shape[1], points2.shape[2]
-    a_i, x_i = LazyTensor(cur_source.weights.view(B, N, 1, 1)), LazyTensor(
-        attr1.view(B, N, 1, -1)
-    )
-    b_j, y_j = LazyTensor(target.weights.view(B, 1, M, 1)), LazyTensor(
-        attr2.view(B, 1, M, -1)
+    B, N, M = attr1.shape[0], attr1.shape[1], attr2.shape[1]
+    xx = attr1.view(B, N, -1) / (sqrt_const2 * blur)
+    yy = attr2.view(B, M, -1) / (sqrt_const2 * blur)
+    f = weight1.log() + F_i.view(B, N) / blur ** 2
+    g = weight2.log() + G_j.view(B, M) / blur ** 2
+    return f, g, xx, yy
+
+
+def iter_wasserstein_plan_blocks(cur_source, target, gemloss_setting):
+    """
+    stream the dense transport plan (trans_plan mode) or the row normalized probability
+    (prob mode) between the source and the target over row blocks,
+    the block size is set by the memory budget, the OT is solved before the first block
+
+    :return: generator of (row_slice, P_block, log_P_block), each block is Bxnxm
+    """
+    mode = gemloss_setting[
+        ("mode", "soft", "soft, hard, mapped_index,analysis,trans_plan,prob")
+    ]
+    memory_budget_mb = gemloss_setting[
+        (
+            "memory_budget_mb",
+            512,
+            "memory budget (MB) of a dense row block of the plan in chunked mode",
+        )
+    ]
+    if mode not in ["trans_plan", "prob"]:
+        raise ValueError(
+            "mode {} can not be streamed over blocks, support: trans_plan/ prob".format(
+                mode
+            )
+        )
+    f, g, xx, yy = _compute_log_potentials(cur_source, target, gemloss_setting)
+    B, M = g.shape
+    rows_per_block = _rows_per_block(B, M, memory_budget_mb)
+    log_a = cur_source.weights[:, :, 0].log() if mode == "prob" else None
+    log_P_blocks = iter_log_plan_row_blocks(f, g, xx, yy, log_a, rows_per_block)
+    return (
+        (row_slice, log_P_block.exp(), log_P_block)
+        for row_slice, log_P_block in log_P_blocks
     )
-    F_i, G_j = LazyTensor(F_i.view(B, N, 1, 1)), LazyTensor(G_j.view(B, 1, M, 1))
-    xx_i = x_i / (sqrt_const2 * blur)
-    yy_j = y_j / (sqrt_const2 * blur)
-    f_i = a_i.log() + F_i / blur ** 2
-    g_j = b_j.log() + G_j / blur ** 2  # Bx1xMx1
+
+
+def wasserstein_barycenter_mapping(cur_source, target, gemloss_setting):
+    """
+    map the source onto the target via the entropic OT plan
+
+    the soft/hard/mapped_index/analysis modes are KeOps reductions that never materialize
+    the plan, the trans_plan/prob modes return the plan as LazyTensors, or, in chunked
+    mode, as a generator of dense row blocks bounded by the memory budget,
+    see iter_wasserstein_plan_blocks
+    """
+    from pykeops.torch import LazyTensor
+
+    mode = gemloss_setting[
+        ("mode", "soft", "soft, hard, mapped_index,analysis,trans_plan,prob")
+    ]
+    chunked = gemloss_setting[
+        (
+            "chunked",
+            False,
+            "trans_plan/prob: return the dense row blocks of the plan under a memory budget",
+        )
+    ]
+    if chunked and mode in ["trans_plan", "prob"]:
+        return iter_wasserstein_plan_blocks(cur_source, target, gemloss_setting)
+    f, g, xx, yy = _compute_log_potentials(cur_source, target, gemloss_setting)
+    points2 = target.points
+    B, N, M, D = f.shape[0], f.shape[1], g.shape[1], points2.shape[2]
+    a_i = LazyTensor(cur_source.weights.view(B, N, 1, 1))
+    f_i, g_j = LazyTensor(f.view(B, N, 1, 1)), LazyTensor(g.view(B, 1, M, 1))
+    xx_i, yy_j = LazyTensor(xx.view(B, N, 1, -1)), LazyTensor(yy.view(B, 1, M, -1))
     C_ij = ((xx_i - yy_j) ** 2).sum(-1)  # BxNxMx1
     log_P_ij = (
         f_i + g_j - C_ij
@@ -91,12 +187,9 @@ def wasserstein_barycenter_mapping(cur_source, target, gemloss_setting):
         mapped_mass_ratio = log_P_ij.exp().sum(2) / cur_source.weights
     elif mode == "hard":
         P_i_index = log_P_ij.argmax(dim=2).long().view(B, N)  #  over M,  return (B*N)
-        for i in range(B):  # todo not test yet
-            P_i_index[i] += int(N * i)
-        P_i_index = P_i_index.view(-1)
-        points2_flatten = points2.view(-1, D)
-        mapped_position = points2_flatten[P_i_index]
-        mapped_position = mapped_position.view(B, N, D)
+        mapped_position = torch.gather(
+            points2, 1, P_i_index[..., None].expand(B, N, D)
+        )  # BxNxD
         mapped_mass_ratio = log_P_ij.exp().sum(2) / cur_source.weights
     elif mode == "mapped_index":
         P_i_index = log_P_ij.argmax(dim=2).long().view(B, N)  # over M,  return (B,N)
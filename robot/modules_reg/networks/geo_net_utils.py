@@ -68,12 +68,13 @@ class MultiGaussSpatialConv(nn.Module):
 
 
 class AnisoMultiGaussSpatialConv(nn.Module):
-    def __init__(self, sigma_list, weight_list):
+    def __init__(self, relative_scale_list, weight_list, self_center=False):
         super(AnisoMultiGaussSpatialConv, self).__init__()
         self.kernel = LazyKeopsKernel(
             kernel_type="aniso_multi_gauss",
-            sigma_list=sigma_list,
+            relative_scale_list=relative_scale_list,
             weight_list=weight_list,
+            self_center=self_center,
         )
 
     def forward(self, x, y, y_fea, gamma):
@@ -1,4 +1,6 @@
+import math
 import torch
+from pykeops.torch import LazyTensor
 
 
 def sinkhorn(feature1, feature2, pcloud1, pcloud2, epsilon, gamma, max_iter):
@@ -85,3 +87,104 @@ def sinkhorn(feature1, feature2, pcloud1, pcloud2, epsilon, gamma, max_iter):
     T = torch.mul(torch.mul(a, K), b.transpose(1, 2))
 
     return T
+
+
+def sinkhorn_keops(feature1, feature2, pcloud1, pcloud2, epsilon, gamma, max_iter):
+    """
+    Log-domain Sinkhorn algorithm on KeOps LazyTensors, it reproduces the
+    unbalanced update and the 10 m support mask of sinkhorn, but never
+    materializes the N x M matrices. The unrolled iterations are differentiable.
+
+    Parameters
+    ----------
+    feature1 : torch.Tensor
+        Feature for points cloud 1. Used to computed transport cost.
+        Size B x N x C.
+    feature2 : torch.Tensor
+        Feature for points cloud 2. Used to computed transport cost.
+        Size B x M x C.
+    pcloud1 : torch.Tensor
+        Point cloud 1. Size B x N x 3.
+    pcloud2 : torch.Tensor
+        Point cloud 2. Size B x M x 3.
+    epsilon : torch.Tensor
+        Entropic regularisation. Scalar.
+    gamma : torch.Tensor
+        Mass regularisation. Scalar.
+    max_iter : int
+        Number of unrolled iteration of the Sinkhorn algorithm.
+
+    Returns
+    -------
+    log_a : torch.Tensor
+        Log of the scaling of point cloud 1. Size B x N x 1.
+    log_b : torch.Tensor
+        Log of the scaling of point cloud 2. Size B x M x 1.
+    log_K : LazyTensor
+        Log of the masked Gibbs kernel without the -1/epsilon offset, which
+        is kept in log_a, i.e. log T = log_a + log_K + log_b. Size B x N x M.
+    """
+    # Transport cost 1 - <f1, f2>, the constant -1/epsilon is folded into log_a
+    feature1 = feature1 / torch.sqrt(torch.sum(feature1 ** 2, -1, keepdim=True) + 1e-8)
+    feature2 = feature2 / torch.sqrt(torch.sum(feature2 ** 2, -1, keepdim=True) + 1e-8)
+    feature1_i = LazyTensor((feature1 / epsilon)[:, :, None].contiguous())
+    feature2_j = LazyTensor(feature2[:, None].contiguous())
+    # Force transport to be zero for points further than 10 m apart
+    pcloud1_i = LazyTensor(pcloud1[:, :, None].contiguous())
+    pcloud2_j = LazyTensor(pcloud2[:, None].contiguous())
+    log_support = -1e5 * (pcloud1_i.sqdist(pcloud2_j) - 10 ** 2).step()
+    log_K = (feature1_i | feature2_j) + log_support
+
+    B, N, M = pcloud1.shape[0], pcloud1.shape[1], pcloud2.shape[1]
+    offset = -1.0 / epsilon
+    log_a = offset * torch.ones((B, N, 1), device=feature1.device, dtype=feature1.dtype)
+    log_b = torch.zeros((B, M, 1), device=feature2.device, dtype=feature2.dtype)
+
+    # Early return if no iteration (FLOT_0)
+    if max_iter == 0:
+        return log_a, log_b, log_K
+
+    # Init. of Sinkhorn algorithm
+    power = gamma / (gamma + epsilon)
+    log_prob1, log_prob2 = -math.log(N), -math.log(M)
+    log_stab = torch.tensor(math.log(1e-8), device=feature1.device, dtype=feature1.dtype)
+    log_a = log_a + log_prob1
+
+    # Sinkhorn algorithm
+    for _ in range(max_iter):
+        # Update b
+        log_KTa = (log_K + LazyTensor(log_a[:, :, None])).logsumexp(dim=1)
+        log_b = power * (log_prob2 - torch.logaddexp(log_KTa, log_stab))
+        # Update a, the -1/epsilon offset of K is kept in log_a
+        log_Kb = offset + (log_K + LazyTensor(log_b[:, None])).logsumexp(dim=2)
+        log_a = power * (log_prob1 - torch.logaddexp(log_Kb, log_stab)) + offset
+
+    return log_a, log_b, log_K
+
+
+def keops_transport_flow(log_a, log_b, log_K, pcloud1, pcloud2):
+    """
+    Flow estimated by the transport plan of sinkhorn_keops,
+    (T @ pcloud2) / (T.sum(-1) + 1e-8) - pcloud1, without materializing T
+
+    Parameters
+    ----------
+    log_a, log_b, log_K :
+        Output of sinkhorn_keops.
+    pcloud1 : torch.Tensor
+        Point cloud 1. Size B x N x 3.
+    pcloud2 : torch.Tensor
+        Point cloud 2. Size B x M x 3.
+
+    Returns
+    -------
+    torch.Tensor
+        Flow of size B x N x 3.
+    """
+    log_Kb = log_K + LazyTensor(log_b[:, None])
+    pcloud2_j = LazyTensor(pcloud2[:, None].contiguous())
+    # softmax weighted mean over j, and the log of the row sum of T
+    mean_pcloud2 = log_Kb.sumsoftmaxweight(pcloud2_j, dim=2)
+    log_row_sum = log_a + log_Kb.logsumexp(dim=2)
+    ratio = torch.sigmoid(log_row_sum - math.log(1e-8))
+    return mean_pcloud2 * ratio - pcloud1
@@ -79,24 +79,33 @@ def square_distance(src, dst):
     return dist
 
 
-def knn_point(nsample, xyz, new_xyz):
+def knn_point(nsample, xyz, new_xyz, return_dist=False):
     """
+    K nearest neighbor search by a KeOps reduction, without building the dense
+    BxSxN distance matrix
+
     Input:
         nsample: max sample number in local region
         xyz: all points, [B, N, C]
         new_xyz: query points, [B, S, C]
+        return_dist: also return the square distance to the neighbors
     Return:
         group_idx: grouped points index, [B, S, nsample]
+        group_dist: optional, square distance to the grouped points, [B, S, nsample]
     """
 
-    # sqrdists = square_distance(new_xyz, xyz)
-    # _, group_idx = torch.topk(sqrdists, nsample, dim = -1, largest=False, sorted=False)
-    # return group_idx
-    new_xyz = LazyTensor(new_xyz[:, :, None].contiguous())  # BxSx1xC
-    xyz = LazyTensor(xyz[:, None].contiguous())  # Bx1xNxC
-    dist2 = new_xyz.sqdist(xyz)
-    group_idx = dist2.argKmin(nsample, dim=2)
-    return group_idx
+    new_xyz_i = LazyTensor(new_xyz[:, :, None].contiguous())  # BxSx1xC
+    xyz_j = LazyTensor(xyz[:, None].contiguous())  # Bx1xNxC
+    dist2 = new_xyz_i.sqdist(xyz_j)
+    group_idx = dist2.argKmin(nsample, dim=2).long()
+    if not return_dist:
+        return group_idx
+    B, S, C = new_xyz.shape
+    grouped_xyz = torch.gather(
+        xyz, 1, group_idx.view(B, S * nsample, 1).expand(B, S * nsample, C)
+    ).view(B, S, nsample, C)
+    group_dist = ((grouped_xyz - new_xyz[:, :, None]) ** 2).sum(-1)
+    return group_idx, group_dist
 
 
 def index_points_gather(points, fps_idx):
@@ -23,7 +23,7 @@ from robot.modules_reg.networks.pointconv_util import (
     index_points_gather as index_points,
     index_points_group,
     Conv1d,
-    square_distance,
+    knn_point,
 )
 import time
 from robot.utils.utils import shrink_by_factor
@@ -283,8 +283,7 @@ def multiScaleLoss(pred_flows, gt_flow, fps_idxs, alpha=[0.02, 0.04, 0.08, 0.16]
 def curvature(pc):
     # pc: B 3 N
     pc = pc.permute(0, 2, 1)
-    sqrdist = square_distance(pc, pc)
-    _, kidx = torch.topk(sqrdist, 10, dim=-1, largest=False, sorted=False)  # B N 10 3
+    kidx = knn_point(10, pc, pc)  # B N 10
     grouped_pc = index_points_group(pc, kidx)
     pc_curvature = torch.sum(grouped_pc - pc.unsqueeze(2), dim=2) / 9.0
     return pc_curvature  # B N 3
@@ -297,13 +296,12 @@ def computeChamfer(pc1, pc2):
     """
     pc1 = pc1.permute(0, 2, 1)
     pc2 = pc2.permute(0, 2, 1)
-    sqrdist12 = square_distance(pc1, pc2)  # B N M
 
     # chamferDist
-    dist1, _ = torch.topk(sqrdist12, 1, dim=-1, largest=False, sorted=False)
-    dist2, _ = torch.topk(sqrdist12, 1, dim=1, largest=False, sorted=False)
+    _, dist1 = knn_point(1, pc2, pc1, return_dist=True)  # B N 1
+    _, dist2 = knn_point(1, pc1, pc2, return_dist=True)  # B M 1
     dist1 = dist1.squeeze(2)
-    dist2 = dist2.squeeze(1)
+    dist2 = dist2.squeeze(2)
 
     return dist1, dist2
 
@@ -348,8 +346,7 @@ def curvatureWarp(pc, warped_pc):
 
     warped_pc = warped_pc.permute(0, 2, 1).contiguous()
     pc = pc.permute(0, 2, 1).contiguous()
-    sqrdist = square_distance(pc, pc)
-    _, kidx = torch.topk(sqrdist, 10, dim=-1, largest=False, sorted=False)  # B N 10 3
+    kidx = knn_point(10, pc, pc)  # B N 10
     grouped_pc = index_points_group(warped_pc, kidx)
     pc_curvature = torch.sum(grouped_pc - warped_pc.unsqueeze(2), dim=2) / 9.0
     return pc_curvature  # B N 3
@@ -381,10 +378,9 @@ def computeSmooth(pc1, pred_flow):
 
     pc1 = pc1.permute(0, 2, 1)
     pred_flow = pred_flow.permute(0, 2, 1)
-    sqrdist = square_distance(pc1, pc1)  # B N N
 
     # Smoothness
-    _, kidx = torch.topk(sqrdist, 9, dim=-1, largest=False, sorted=False)
+    kidx = knn_point(9, pc1, pc1)  # B N 9
     grouped_flow = index_points_group(pred_flow, kidx)  # B N 9 3
     diff_flow = (
         torch.norm(grouped_flow - pred_flow.unsqueeze(2), dim=3).sum(dim=2) / 8.0
@@ -420,8 +416,7 @@ def interpolateCurvature(pc1, pc2, pc2_curvature):
     pc2 = pc2.permute(0, 2, 1)
     pc2_curvature = pc2_curvature
 
-    sqrdist12 = square_distance(pc1, pc2)  # B N M
-    dist, knn_idx = torch.topk(sqrdist12, 5, dim=-1, largest=False, sorted=False)
+    knn_idx, dist = knn_point(5, pc2, pc1, return_dist=True)  # B N 5
     grouped_pc2_curvature = index_points_group(pc2_curvature, knn_idx)  # B N 5 3
     norm = torch.sum(1.0 / (dist + 1e-8), dim=2, keepdim=True)
     weight = (1.0 / (dist + 1e-8)) / norm
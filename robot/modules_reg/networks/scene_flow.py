@@ -5,7 +5,7 @@ from robot.modules_reg.networks.gconv import SetConv
 
 
 class FLOT(torch.nn.Module):
-    def __init__(self, nb_iter, initial_channel=3):
+    def __init__(self, nb_iter, initial_channel=3, use_keops=False):
         """
         Construct a model that, once trained, estimate the scene flow between
         two point clouds.
@@ -14,6 +14,9 @@ class FLOT(torch.nn.Module):
         ----------
         nb_iter : int
             Number of iterations to unroll in the Sinkhorn algorithm.
+        use_keops : bool
+            Solve the OT problem with the log-domain KeOps Sinkhorn, which
+            does not store the N x M transport plan.
 
         """
 
@@ -25,6 +28,7 @@ class FLOT(torch.nn.Module):
         # OT parameters
         # Number of unrolled iterations in the Sinkhorn algorithm
         self.nb_iter = nb_iter
+        self.use_keops = use_keops
         # Mass regularisation
         self.gamma = torch.nn.Parameter(torch.zeros(1))
         # Entropic regularisation
@@ -117,7 +121,8 @@ class FLOT(torch.nn.Module):
         feats_1, _ = self.get_features(pc2, 32)
 
         # Optimal transport
-        transport = ot.sinkhorn(
+        sinkhorn = ot.sinkhorn_keops if self.use_keops else ot.sinkhorn
+        transport = sinkhorn(
             feats_0,
             feats_1,
             pc1,
@@ -126,10 +131,13 @@ class FLOT(torch.nn.Module):
             gamma=torch.exp(self.gamma),
             max_iter=self.nb_iter,
         )
-        row_sum = transport.sum(-1, keepdim=True)
 
         # Estimate flow with transport plan
-        ot_flow = (transport @ pc2) / (row_sum + 1e-8) - pc1
+        if self.use_keops:
+            ot_flow = ot.keops_transport_flow(*transport, pc1, pc2)
+        else:
+            row_sum = transport.sum(-1, keepdim=True)
+            ot_flow = (transport @ pc2) / (row_sum + 1e-8) - pc1
 
         # Flow refinement
         refined_flow = self.refine(ot_flow, graph)
@@ -0,0 +1,211 @@
+"""
+validation in a separate process
+
+the training process snapshots the weights at the validation epochs and hands them to a
+validation process, which holds its own copy of the model and of the val dataloader,
+the scores come back with the epoch (and the train step) they belong to, so the training
+process can log them and select the best model as if the validation had run inline
+"""
+import atexit
+import queue
+import traceback
+
+import torch.multiprocessing as mp
+
+from robot.utils.net_utils import snapshot_state, update_res
+from robot.utils.utils import set_seed
+
+
+def run_val_epoch(model, dataloader, device, epoch, max_batch_num, save_fig_on):
+    """
+    evaluate the model on the val dataloader, same steps as the val phase of train_model
+
+    :return: dict, metric name -> list of the batch scores, the score is 'val_score'
+    """
+    model.set_cur_epoch(epoch)
+    set_seed(0)
+    model.set_val()
+    running_val_score = {}
+    num_batch = min(max_batch_num, len(dataloader))
+    for i, data in enumerate(dataloader):
+        input = model.set_input(data, device=device, phase="val")
+        val_res = model.get_evaluation(input)
+        score, detailed_scores = model.analyze_res(val_res, cache_res=True)
+        print("val score of batch {} is {}:".format(model.get_batch_names(), score))
+        print("val detailed scores are {}:".format(detailed_scores))
+        model.save_visual_res(save_fig_on, input, val_res, "val")
+        end_of_epoch = (i + 1) % num_batch == 0
+        model.update_loss(epoch, end_of_epoch)
+        update_res(detailed_scores, running_val_score)
+        update_res({"val_score": [score]}, running_val_score)
+        val_res, input = None, None
+        model.do_some_clean()
+        if end_of_epoch:
+            break
+    model.save_res("val")
+    return running_val_score
+
+
+def _strip_module_prefix(state_dict):
+    """the keys of a DataParallel state dict without the 'module.' prefix"""
+    return {
+        (key[len("module.") :] if key.startswith("module.") else key): value
+        for key, value in state_dict.items()
+    }
+
+
+def _val_worker(
+    opt,
+    dataloader,
+    device,
+    gpus,
+    max_batch_num,
+    save_fig_on,
+    model_builder,
+    task_queue,
+    result_queue,
+):
+    try:
+        if model_builder is None:
+            from robot.pipeline.build_model import build_model as model_builder
+
+        model = model_builder(opt, device, gpus)
+        # the training and the val networks are not necessarily wrapped the same way
+        network = model.get_model()
+        network = getattr(network, "module", network)
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            epoch, state_dict = task
+            network.load_state_dict(_strip_module_prefix(state_dict))
+            state_dict = None
+            running_val_score = run_val_epoch(
+                model, dataloader, device, epoch, max_batch_num, save_fig_on
+            )
+            result_queue.put((epoch, running_val_score))
+    except Exception:
+        result_queue.put((None, traceback.format_exc()))
+
+
+class AsyncValidator(object):
+    """
+    run the validation epochs in a spawned process, one epoch at a time, in order
+
+    :param opt: ParameterDict, task settings, used to build the model in the val process
+    :param dataloader: the val dataloader
+    :param device: device of the val process
+    :param gpus: gpus of the val process
+    :param max_batch_num: max number of val batches per epoch
+    :param save_fig_on: save the visualization results
+    :param max_pending: max number of submitted epochs waiting for their scores,
+        each of them holds a snapshot of the weights and of the optimizer
+    :param model_builder: picklable function (opt, device, gpus) -> model, builds the
+        model of the val process, None for build_model
+    """
+
+    def __init__(
+        self,
+        opt,
+        dataloader,
+        device,
+        gpus,
+        max_batch_num,
+        save_fig_on,
+        max_pending=2,
+        model_builder=None,
+    ):
+        # the background prefetch thread can not be sent to another process
+        dataloader = getattr(dataloader, "dataloader", dataloader)
+        ctx = mp.get_context("spawn")
+        self.task_queue = ctx.Queue()
+        self.result_queue = ctx.Queue()
+        self.process = ctx.Process(
+            target=_val_worker,
+            args=(
+                opt,
+                dataloader,
+                device,
+                gpus,
+                max_batch_num,
+                save_fig_on,
+                model_builder,
+                self.task_queue,
+                self.result_queue,
+            ),
+        )
+        self.process.start()
+        # a crashed training would otherwise wait forever on the val process at exit
+        atexit.register(self.terminate)
+        self.pending = {}
+        self.max_pending = max(max_pending, 1)
+
+    def submit(self, epoch, global_step, model, optimizer):
+        """
+        snapshot the model and queue its validation, the optimizer is snapshotted
+        as well in case the epoch turns out to be the best one
+
+        :param epoch: the epoch of the snapshot
+        :param global_step: dict, the steps of the snapshot, the scores are logged
+            at its train step
+        :param model: the network
+        :param optimizer: its optimizer
+        """
+        state_dict = snapshot_state(model.state_dict())
+        self.pending[epoch] = {
+            "global_step": dict(global_step),
+            "state_dict": state_dict,
+            "optimizer": snapshot_state(optimizer.state_dict()),
+        }
+        self.task_queue.put((epoch, state_dict))
+
+    def collect(self, wait=False, max_pending=0):
+        """
+        get the finished validation epochs
+
+        :param wait: block until at most max_pending submitted epochs are left
+        :param max_pending: see wait
+        :return: list of (epoch, running_val_score, snapshot), in epoch order,
+            the snapshot has the global_step, the state_dict and the optimizer state
+        """
+        results = []
+        while len(self.pending) > (max_pending if wait else 0):
+            try:
+                epoch, running_val_score = self.result_queue.get(
+                    block=wait, timeout=10 if wait else None
+                )
+            except queue.Empty:
+                if not self.process.is_alive():
+                    raise RuntimeError("the validation process exited unexpectedly")
+                if wait:
+                    continue
+                break
+            if epoch is None:
+                raise RuntimeError(
+                    "the validation process failed:\n{}".format(running_val_score)
+                )
+            results.append((epoch, running_val_score, self.pending.pop(epoch)))
+        return results
+
+    def wait_for_slot(self):
+        """
+        block until another epoch can be submitted
+
+        :return: the results of the epochs finished meanwhile, see collect
+        """
+        return self.collect(wait=True, max_pending=self.max_pending - 1)
+
+    def close(self):
+        """
+        validate the remaining epochs and stop the process
+
+        :return: the results of the remaining epochs, see collect
+        """
+        results = self.collect(wait=True)
+        self.task_queue.put(None)
+        self.process.join()
+        return results
+
+    def terminate(self):
+        if self.process.is_alive():
+            self.process.terminate()
@@ -71,9 +71,10 @@ class Initializer:
         """
         self.data_manager = DataManager()
 
-    def build_data_loader(self):
+    def build_data_loader(self, device=None):
         """
         get task related setttings for data manager
+        :param device: the device the batches are prefetched to, if prefetch_to_device is on
         """
         batch_size = self.task_opt[
             (
@@ -84,7 +85,7 @@ class Initializer:
         ]
         is_train = self.task_opt[("is_train", False, "train the model")]
         return self.data_manager.build_data_loaders(
-            batch_size=batch_size, is_train=is_train
+            batch_size=batch_size, is_train=is_train, device=device
         )
 
     def setting_folder(self):
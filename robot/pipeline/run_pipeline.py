@@ -23,8 +23,8 @@ class Pipline:
         self.tsk_opt = initializer.init_task_option(task_setting_pth)
         self.writer = initializer.initialize_log_env()
         self.tsk_opt = initializer.get_task_option()
-        self.data_loaders = initializer.build_data_loader()
         self.device, self.gpus = initializer.initialize_compute_env()
+        self.data_loaders = initializer.build_data_loader(self.device)
         self.model = build_model(self.tsk_opt, self.device, self.gpus)
 
     def clean_up(self):
@@ -4,7 +4,9 @@ import os
 import numpy as np
 
 
-def eval_model(opt, model, dataloaders, writer, device, task_name=""):
+def eval_model(
+    opt, model, dataloaders, writer, device, task_name="", model_loaded=False
+):
     model_path = opt["path"][("model_load_path", "", "trained model path")]
     since = time()
     record_path = opt["path"]["record_path"]
@@ -18,7 +20,9 @@ def eval_model(opt, model, dataloaders, writer, device, task_name=""):
     if running_part_data:
         print("running part of the test data from range {}".format(running_range))
     phases = ["test"]
-    if len(model_path):
+    if model_loaded:
+        pass
+    elif len(model_path):
         # todo  check  model loading for data parallel
         get_test_model(model_path, model.get_model(), model.optimizer)
     else:
@@ -1,9 +1,15 @@
 from time import time
-from robot.utils.net_utils import resume_train, save_checkpoint, update_res
-from robot.utils.utils import set_seed
+from robot.pipeline.async_val import AsyncValidator
+from robot.utils.net_utils import CheckpointSaver, resume_train, update_res
+from robot.utils.tensorboard_logger import log_buffer
+from robot.utils.utils import set_device, set_seed
 
 
-def train_model(opt, model, dataloaders, writer, device):
+def train_model(opt, model, dataloaders, writer, device, val_model_builder=None):
+    """
+    :param val_model_builder: builds the model of the async val process,
+        see AsyncValidator, None for build_model
+    """
     since = time()
     print_step = opt[("print_step", [10, 4, 4], "num of steps to print")]
     num_epochs = opt[("epoch", 100, "num of training epoch")]
@@ -41,6 +47,21 @@ def train_model(opt, model, dataloaders, writer, device):
     check_best_model_period = opt[
         ("check_best_model_period", 5, "save best performed model every # epoch")
     ]
+    async_checkpoint = opt[
+        (
+            "async_checkpoint",
+            True,
+            "snapshot the checkpoint into memory and write it in a background thread",
+        )
+    ]
+    max_checkpoints_to_keep = opt[
+        (
+            "max_checkpoints_to_keep",
+            -1,
+            "keep the # latest epoch checkpoints, -1 keeps all, model_best is always kept",
+        )
+    ]
+    checkpoint_saver = CheckpointSaver(async_checkpoint, max_checkpoints_to_keep)
     save_fig_on = opt[
         ("save_fig_on", False, "save the visualizatio results during the evaluation")
     ]
@@ -48,6 +69,35 @@ def train_model(opt, model, dataloaders, writer, device):
         phase: min(max_batch_num_per_epoch[phase], period[phase]) for phase in phases
     }
     val_period = opt[("val_period", 10, "do validation every num epoch")]
+    async_val = opt[
+        (
+            "async_val",
+            False,
+            "run the val phase in a separate process on a snapshot of the weights",
+        )
+    ]
+    val_gpu_ids = opt[
+        (
+            "val_gpu_ids",
+            -1,
+            "gpu of the async val process, -1 uses the training device",
+        )
+    ]
+    async_val_max_pending = opt[
+        (
+            "async_val_max_pending",
+            2,
+            "max number of val epochs queued to the async val process, "
+            "the training waits when it is reached",
+        )
+    ]
+    log_flush_step = opt[
+        (
+            "log_flush_step",
+            10,
+            "move the logged training losses to the host every # step",
+        )
+    ]
     warmming_up_epoch = opt[
         ("warmming_up_epoch", 2, "warming up the model in the first # epoch")
     ]
@@ -83,6 +133,64 @@ def train_model(opt, model, dataloaders, writer, device):
             model.rebuild_lr_scheduler(base_epoch=start_epoch)
             model.iter_count = 0
 
+    log_buffer.configure(log_flush_step, writer)
+    validator = None
+    if async_val and max_batch_num_per_epoch["val"]:
+        val_device, val_gpus = (
+            (device, model.gpu_ids) if val_gpu_ids < 0 else set_device([val_gpu_ids])
+        )
+        validator = AsyncValidator(
+            opt,
+            dataloaders["val"],
+            val_device,
+            val_gpus,
+            max_batch_num_per_epoch["val"],
+            save_fig_on,
+            async_val_max_pending,
+            val_model_builder,
+        )
+
+    def update_best_model(epoch, running_val_score, snapshot=None):
+        nonlocal best_score, best_epoch
+        for metric in running_val_score:
+            epoch_val_score_metric = sum(running_val_score[metric]) / len(
+                running_val_score[metric]
+            )
+            print(
+                "{} epoch_val_{}: {:.4f}".format(epoch, metric, epoch_val_score_metric)
+            )
+            if snapshot is not None:
+                # the inline val phase logs its scores while iterating the batches
+                tag = "score/val" if metric == "val_score" else metric + "_val"
+                writer.add_scalar(
+                    tag, epoch_val_score_metric, snapshot["global_step"]["train"]
+                )
+        epoch_val_score = sum(running_val_score["val_score"]) / len(
+            running_val_score["val_score"]
+        )
+
+        if epoch == 0:
+            best_score = epoch_val_score
+
+        if epoch_val_score > best_score:
+            best_score = epoch_val_score
+            best_epoch = epoch
+            save_model(
+                checkpoint_saver,
+                model,
+                check_point_path,
+                epoch,
+                global_step,
+                "epoch_" + str(epoch),
+                True,
+                best_score,
+                snapshot,
+            )
+
+    def update_async_val(results):
+        for epoch, running_val_score, snapshot in results:
+            update_best_model(epoch, running_val_score, snapshot)
+
     for epoch in range(start_epoch, num_epochs + 1):
         print("Epoch {}/{}".format(epoch, num_epochs - 1))
         print("-" * 10)
@@ -97,6 +205,15 @@ def train_model(opt, model, dataloaders, writer, device):
             # if # = 0 or None then skip the val or debug phase
             if not max_batch_num_per_epoch[phase]:
                 continue
+            if phase == "val" and validator is not None:
+                # the val steps advance as if the val phase had run inline
+                global_step[phase] += max(
+                    min(max_batch_num_per_epoch[phase], len(dataloaders[phase])), 1
+                )
+                # each queued epoch holds a snapshot of the weights and the optimizer
+                update_async_val(validator.wait_for_slot())
+                validator.submit(epoch, global_step, model.get_model(), model.optimizer)
+                continue
             if phase == "train":
                 set_seed(seed=None)
                 model.update_scheduler(epoch)
@@ -190,53 +307,34 @@ def train_model(opt, model, dataloaders, writer, device):
                     period_avg_loss = (
                         period_loss[phase] / tensorboard_print_period[phase]
                     )
-                    writer.add_scalar(
+                    log_buffer.add_scalar(
                         "score/" + phase, period_avg_loss, global_step["train"]
                     )
-                    print(
-                        "global_step:{}, {} score is{}".format(
-                            global_step["train"], phase, period_avg_loss
-                        )
+                    log_buffer.print(
+                        "global_step:{}, {} score is{}",
+                        global_step["train"],
+                        phase,
+                        period_avg_loss,
                     )
                     period_loss[phase] = 0.0
 
+                # the train losses stay on the device until the next flush
+                if is_train:
+                    log_buffer.step()
+                else:
+                    log_buffer.flush()
                 if end_of_epoch:
                     break
+            log_buffer.flush()
 
             if phase == "val":
                 model.save_res(phase)
-                for metric in running_val_score:
-                    epoch_val_score_metric = sum(running_val_score[metric]) / len(
-                        running_val_score[metric]
-                    )
-                    print(
-                        "{} epoch_val_{}: {:.4f}".format(
-                            epoch, metric, epoch_val_score_metric
-                        )
-                    )
-                epoch_val_score = sum(running_val_score["val_score"]) / len(
-                    running_val_score["val_score"]
-                )
-
-                if epoch == 0:
-                    best_score = epoch_val_score
-
-                if epoch_val_score > best_score:
-                    best_score = epoch_val_score
-                    best_epoch = epoch
-                    save_model(
-                        model,
-                        check_point_path,
-                        epoch,
-                        global_step,
-                        "epoch_" + str(epoch),
-                        True,
-                        best_score,
-                    )
+                update_best_model(epoch, running_val_score)
 
             if phase == "train":
                 if epoch % check_best_model_period == 0:
                     save_model(
+                        checkpoint_saver,
                         model,
                         check_point_path,
                         epoch,
@@ -246,6 +344,8 @@ def train_model(opt, model, dataloaders, writer, device):
                         best_score,
                     )
                     print("saving the model into thes checkpoint directory")
+                if validator is not None:
+                    update_async_val(validator.collect())
 
             if phase == "debug":
                 model.save_res(phase, saving=False)
@@ -263,6 +363,10 @@ def train_model(opt, model, dataloaders, writer, device):
                 )
                 print("{} epoch_debug_score: {:.4f}".format(epoch, epoch_debug_score))
 
+    if validator is not None:
+        update_async_val(validator.close())
+    checkpoint_saver.close()
+    log_buffer.configure()
     time_elapsed = time() - since
     print(
         "Training complete in {:.0f}m {:.0f}s".format(
@@ -276,16 +380,33 @@ def train_model(opt, model, dataloaders, writer, device):
 
 
 def save_model(
-    model, check_point_path, epoch, global_step, name, is_best=False, best_score=-1
+    checkpoint_saver,
+    model,
+    check_point_path,
+    epoch,
+    global_step,
+    name,
+    is_best=False,
+    best_score=-1,
+    snapshot=None,
 ):
-    optimizer_state = model.optimizer.state_dict()
-    save_checkpoint(
+    """
+    save the current model, or the given snapshot of it,
+    {"state_dict", "optimizer", "global_step"} taken by the async validator
+    """
+    if snapshot is None:
+        snapshot = {
+            "state_dict": model.get_model().state_dict(),
+            "optimizer": model.optimizer.state_dict(),
+            "global_step": global_step,
+        }
+    checkpoint_saver.save(
         {
             "epoch": epoch,
-            "state_dict": model.get_model().state_dict(),
-            "optimizer": optimizer_state,
+            "state_dict": snapshot["state_dict"],
+            "optimizer": snapshot["optimizer"],
             "best_score": best_score,
-            "global_step": global_step,
+            "global_step": snapshot["global_step"],
         },
         is_best,
         check_point_path,
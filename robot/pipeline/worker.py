@@ -0,0 +1,192 @@
+"""
+long-running registration worker
+
+the task setting, the model, its checkpoint and the keops bindings are loaded once,
+then pairs are registered on request, each request is evaluated by eval_model, so the outputs
+are the same as those of run_eval, the records of each request are prefixed by its pair name
+
+a request is one line, either "source_path target_path [pair_name]" or a json object
+{"source": path or shape info, "target": path or shape info, "pair_name": optional},
+requests come from stdin or from a unix socket, each of them is answered by a json line
+with the pair name, the status and the latency (seconds)
+"""
+import json
+import os
+import socketserver
+import sys
+import traceback
+from time import time
+
+from robot.datasets.data_utils import get_file_name, save_json, str_concat
+from robot.pipeline.build_model import build_model
+from robot.pipeline.initializer import Initializer
+from robot.pipeline.test_model import eval_model
+from robot.utils.net_utils import get_test_model
+
+
+def parse_request(line):
+    """
+    parse a request line into the pair info of a pair_data.json
+
+    :param line: str, "source_path target_path [pair_name]" or a json object
+    :return: (pair_name, {"source": shape_info, "target": shape_info})
+    """
+
+    def shape_info(item):
+        if isinstance(item, dict):
+            return item
+        return {"name": get_file_name(item), "data_path": item}
+
+    line = line.strip()
+    if line.startswith("{"):
+        request = json.loads(line)
+        source, target = request["source"], request["target"]
+        pair_name = request.get("pair_name", None)
+    else:
+        items = line.split()
+        if len(items) not in [2, 3]:
+            raise ValueError(
+                "request should be 'source_path target_path [pair_name]', "
+                "got {}".format(line)
+            )
+        source, target = items[:2]
+        pair_name = items[2] if len(items) == 3 else None
+    source, target = shape_info(source), shape_info(target)
+    if pair_name is None:
+        pair_name = str_concat([source["name"], target["name"]])
+    return pair_name, {"source": source, "target": target}
+
+
+class RegistrationWorker(object):
+    """
+    load the model once and register the requested pairs one by one
+    """
+
+    def __init__(self, task_setting_pth):
+        initializer = Initializer()
+        initializer.initialize_data_manager()
+        self.tsk_opt = initializer.init_task_option(task_setting_pth)
+        self.writer = initializer.initialize_log_env()
+        self.device, self.gpus = initializer.initialize_compute_env()
+        self.data_manager = initializer.data_manager
+        self.test_data_path = os.path.join(initializer.task_root_path, "test")
+        os.makedirs(self.test_data_path, exist_ok=True)
+        self.batch_size = self.tsk_opt[
+            (
+                "batch_sz",
+                1,
+                "list of batch size, refers to train, val, test,debug respectively",
+            )
+        ]
+        # one pair per request, spawning dataloader workers would dominate the latency
+        loader_opt = self.data_manager.data_opt[
+            ("loader", {}, "settings for the dataloaders")
+        ]
+        if "num_workers" not in loader_opt.ext:
+            loader_opt["num_workers"] = [-1, -1, 0, -1]
+        self.model = build_model(self.tsk_opt, self.device, self.gpus)
+        model_path = self.tsk_opt["path"][("model_load_path", "", "trained model path")]
+        if len(model_path):
+            get_test_model(model_path, self.model.get_model(), self.model.optimizer)
+        self.latency_list = []
+
+    def register(self, pair_name, pair_info):
+        """
+        register a pair, the outputs are written by eval_model into the record folder
+
+        :param pair_name: str, name of the pair
+        :param pair_info: dict, {"source": shape_info, "target": shape_info}
+        :return: float, latency of the request
+        """
+        start = time()
+        save_json(
+            os.path.join(self.test_data_path, "pair_data.json"), {pair_name: pair_info}
+        )
+        dataloaders = self.data_manager.build_data_loaders(
+            batch_size=self.batch_size, is_train=False, device=self.device
+        )
+        eval_model(
+            self.tsk_opt,
+            self.model,
+            dataloaders,
+            self.writer,
+            self.device,
+            task_name=pair_name + "_",
+            model_loaded=True,
+        )
+        # the optimization model never clears its result cache
+        self.model.caches = {}
+        latency = time() - start
+        self.latency_list.append(latency)
+        return latency
+
+    def handle(self, line):
+        """
+        handle a request line
+
+        :param line: str, request line
+        :return: dict, response
+        """
+        pair_name = None
+        try:
+            pair_name, pair_info = parse_request(line)
+            latency = self.register(pair_name, pair_info)
+        except Exception as e:
+            traceback.print_exc()
+            return {"pair_name": pair_name, "status": "error", "error": str(e)}
+        response = {
+            "pair_name": pair_name,
+            "status": "done",
+            "latency": latency,
+            "mean_latency": sum(self.latency_list) / len(self.latency_list),
+            "record_path": self.tsk_opt["path"]["record_path"],
+        }
+        print(
+            "request {} ({}) takes {:.3f}s, {:.3f}s on average".format(
+                len(self.latency_list), pair_name, latency, response["mean_latency"]
+            )
+        )
+        return response
+
+    def serve_stdin(self):
+        """
+        read the requests from stdin until EOF or "exit",
+        the responses are printed on a line starting with "response:"
+        """
+        for line in sys.stdin:
+            if line.strip() == "exit":
+                break
+            if line.strip():
+                print("response: " + json.dumps(self.handle(line)))
+
+    def serve_socket(self, socket_path):
+        """
+        serve the requests on a unix socket, one request per line, one response line each,
+        the connections are handled one by one, the model is not shared across threads
+        """
+        worker = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    line = line.decode()
+                    if not line.strip():
+                        continue
+                    response = worker.handle(line)
+                    self.wfile.write((json.dumps(response) + "\n").encode())
+                    self.wfile.flush()
+
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        with socketserver.UnixStreamServer(socket_path, Handler) as server:
+            print("registration worker listening on {}".format(socket_path))
+            try:
+                server.serve_forever()
+            finally:
+                os.remove(socket_path)
+
+    def serve(self, socket_path=None):
+        if socket_path:
+            self.serve_socket(socket_path)
+        else:
+            self.serve_stdin()
@@ -20,6 +20,7 @@ torch.backends.cudnn.benchmark = True
 import robot.utils.module_parameters as pars
 from abc import ABCMeta, abstractmethod
 from robot.pipeline.run_pipeline import run_one_task
+from robot.pipeline.worker import RegistrationWorker
 
 
 class BaseTask:
@@ -92,6 +93,23 @@ def do_evaluation(args):
     return pipeline
 
 
+def run_worker(args):
+    """
+    set running env once and serve the registration requests from stdin or a unix socket
+    :param args: the parsed arguments
+    """
+    task_output_path = os.path.join(args.output_root_path, "eval")
+    print("task output path: {}".format(task_output_path))
+    tsm = init_eval_env(args.setting_folder_path, task_output_path, None)
+    tsm = addition_test_setting(args, tsm)
+    tsm.task_par["tsk_set"]["gpu_ids"] = args.gpus
+    tsm_json_path = os.path.join(task_output_path, "task_setting.json")
+    tsm.save(tsm_json_path)
+    worker = RegistrationWorker(tsm_json_path)
+    worker.serve(args.socket)
+    return worker
+
+
 def addition_test_setting(args, tsm):
     model_path = args.model_path
     if model_path is not None:
@@ -114,6 +132,9 @@ if __name__ == "__main__":
         --setting_folder_path/ -ts: path of the folder where settings are saved,should include task_setting.json
         --model_path/ -m: for learning based approach, the model checkpoint should either provided here (first priority) or set in task_setting.json (second priority)
         --gpu_id/ -g: gpu_id to use
+        --worker/ -w: keep running, load the model once and register the pairs requested on stdin
+            (or on --socket), one request per line: "source_path target_path [pair_name]"
+        --socket/ -s: path of the unix socket the worker listens on
     """
     import argparse
 
@@ -160,6 +181,23 @@ if __name__ == "__main__":
         metavar="N",
         help="list of gpu ids to use",
     )
+    parser.add_argument(
+        "-w",
+        "--worker",
+        action="store_true",
+        help="run as a persistent worker, the pairs are requested on stdin or on --socket",
+    )
+    parser.add_argument(
+        "-s",
+        "--socket",
+        required=False,
+        type=str,
+        default=None,
+        help="the unix socket path the worker listens on, stdin is used if not set",
+    )
     args = parser.parse_args()
     print(args)
-    do_evaluation(args)
+    if args.worker:
+        run_worker(args)
+    else:
+        do_evaluation(args)
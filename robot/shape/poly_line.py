@@ -45,8 +45,8 @@ class PolyLine(ShapeBase):
         """
 
         :param points: BxNxD
-        :param edges: BxNx2
-        :param index: [index_a_list, index_b_list], each is an overbatch index list with B*N length
+        :param edges: BxEx2
+        :param index: [index_a, index_b], each is an overbatch index tensor with B*E length
         :param reindex: generate index over batch for two ends
         :return:
         """
@@ -59,12 +59,10 @@ class PolyLine(ShapeBase):
         if index is not None:
             self.index = index
         if self.index is None or reindex:
-            index_a_list = []
-            index_b_list = []
-            for b in range(self.nbatch):
-                index_a_list += edges[b, 0] + b * self.npoints
-                index_b_list += edges[b, 1] + b * self.npoints
-            self.index = [index_a_list, index_b_list]
+            # over-batch vertex index of the edges, computed once per shape
+            offset = torch.arange(self.nbatch, device=edges.device).view(-1, 1) * self.npoints
+            self.index = [(edges[..., i].long() + offset).view(-1) for i in range(2)]
+            self.clear_cache()
         self.update_info()
 
     def set_data_with_refer_to(self, points, polyline, detach=False):
@@ -91,19 +89,23 @@ class PolyLine(ShapeBase):
 
     def get_centers_and_currents(self):
         """
+        the result is cached until the points are changed
 
-        :return: centers:BxNxD, currents: BxNxD
+        :return: centers:BxExD, currents: BxExD
         """
         if self.points_mode_on:
             raise NotImplemented(
                 "the topology of the shape has changed, only point related operators are allowed"
             )
+        return self.get_cached("centers_and_currents", self._compute_centers_and_currents)
 
-        a = self.points.view(-1)[self.index[0]]
-        b = self.points.view(-1)[self.index[1]]
+    def _compute_centers_and_currents(self):
+        points = self.points.reshape(-1, self.dimension)
+        a = points[self.index[0]]
+        b = points[self.index[1]]
         centers = (a + b) / 2.0
         currents = b - a
-        zero_normal_index = torch.nonzero(torch.norm(currents, 2, 2) == 0)
+        zero_normal_index = torch.nonzero(torch.norm(currents, 2, -1) == 0)
         if zero_normal_index.shape[0] > 0:
             currents.data[zero_normal_index] = 1e-7
             print(
@@ -32,6 +32,7 @@ class ShapeBase(object):
         ]
         self.nbatch = None
         self.dimension = None
+        self._geometry_cache = {}
         self.points = None
         self.faces = None
         self.edges = None
@@ -49,6 +50,35 @@ class ShapeBase(object):
         self.points_mode_on = False
         # self.update_bounding_box()
 
+    @property
+    def points(self):
+        return self._points
+
+    @points.setter
+    def points(self, points):
+        """reassigning the points invalidates the cached geometry"""
+        self._points = points
+        self.clear_cache()
+
+    def clear_cache(self):
+        self._geometry_cache = {}
+
+    def get_cached(self, name, compute):
+        """
+        memoize a quantity derived from the points, e.g. the centers and normals of a mesh
+        the cache is dropped when the points are reassigned and refreshed when they are modified in place
+
+        :param name: str, cache key
+        :param compute: function without argument that computes the quantity
+        :return: the cached quantity
+        """
+        version = self._points._version
+        cached = self._geometry_cache.get(name, None)
+        if cached is None or cached[0] != version:
+            cached = (version, compute())
+            self._geometry_cache[name] = cached
+        return cached[1]
+
     def update_info(self):
         points = self.points
         points_shape = points.shape
@@ -1,3 +1,4 @@
+import copy
 import torch
 
 from robot.shape.shape_pair import ShapePair
@@ -91,6 +92,56 @@ def create_shape_pair(
     return shape_pair
 
 
+def select_shape(shape, index):
+    """
+    select a sub-batch of a shape, the tensors are sliced and not copied
+
+    :param shape: Shape, with nbatch B
+    :param index: long tensor, index of the selected batch
+    :return: Shape, with nbatch len(index)
+    """
+    selected = copy.copy(shape)
+    for attr in ["points", "weights", "label", "landmarks", "pointfea", "seg", "mask", "faces", "edges"]:
+        value = getattr(shape, attr, None)
+        if isinstance(value, torch.Tensor) and value.shape[0] == shape.nbatch:
+            setattr(selected, attr, value[index])
+    if len(shape.name_list):
+        selected.name_list = [shape.name_list[i] for i in index.tolist()]
+    if getattr(shape, "index", None) is not None:
+        # the over-batch vertex index depends on the batch size
+        topology = selected.faces if getattr(selected, "faces", None) is not None else selected.edges
+        offset = torch.arange(len(index), device=topology.device).view(-1, 1) * selected.npoints
+        selected.index = [(topology[..., i].long() + offset).view(-1) for i in range(len(shape.index))]
+    selected.clear_cache()
+    selected.nbatch = len(index)
+    return selected
+
+
+def select_shape_pair(shape_pair, index):
+    """
+    select a sub-batch of a shape pair, the registration parameter is not set
+
+    :param shape_pair: ShapePair, with nbatch B
+    :param index: long tensor, index of the selected batch
+    :return: ShapePair, with nbatch len(index)
+    """
+    selected = ShapePair(dense_mode=shape_pair.dense_mode)
+    selected.set_source_and_target(
+        select_shape(shape_pair.source, index), select_shape(shape_pair.target, index)
+    )
+    if shape_pair.toflow is not shape_pair.source:
+        selected.toflow = select_shape(shape_pair.toflow, index)
+    if shape_pair.control_points is not None:
+        selected.control_points = shape_pair.control_points[index]
+    if shape_pair.control_weights is not None:
+        selected.control_weights = shape_pair.control_weights[index]
+    pair_name = shape_pair.get_pair_name()
+    if isinstance(pair_name, list):
+        selected.set_pair_name([pair_name[i] for i in index.tolist()])
+    selected.extra_info = shape_pair.extra_info
+    return selected
+
+
 def prepare_shape_pair(n_control_points=-1):
     def prepare(source, target, toflow=None, pair_name=None, extra_info={}):
         return create_shape_pair(
@@ -40,8 +40,8 @@ class SurfaceMesh(ShapeBase):
         """
 
         :param points: BxNxD
-        :param faces: BxNx2
-        :param index: [index_a_list, index_b_list], each is an overbatch index list with B*N length
+        :param faces: BxFx3
+        :param index: [index_a, index_b, index_c], each is an overbatch index tensor with B*F length
         :param reindex: generate index over batch for two ends
         :return:
         """
@@ -56,14 +56,12 @@ class SurfaceMesh(ShapeBase):
         if index is not None:
             self.index = index
         if not self.points_mode_on and (self.index is None or reindex):
-            index_a_list = []
-            index_b_list = []
-            index_c_list = []
-            for b in range(self.nbatch):
-                index_a_list += faces[b, 0] + b * self.npoints
-                index_b_list += faces[b, 1] + b * self.npoints
-                index_c_list += faces[b, 2] + b * self.npoints
-            self.index = [index_a_list, index_b_list, index_c_list]
+            # over-batch vertex index of the faces, computed once per shape
+            offset = torch.arange(self.nbatch, device=faces.device).view(-1, 1) * self.npoints
+            self.index = [
+                (faces[..., i].long() + offset).view(-1) for i in range(faces.shape[-1])
+            ]
+            self.clear_cache()
         self.update_info()
         return self
 
@@ -93,19 +91,24 @@ class SurfaceMesh(ShapeBase):
 
     def get_centers_and_normals(self):
         """
+        the result is cached until the points are changed
 
-        :return: centers:BxNxD, normals: BxNxD
+        :return: centers:BxFxD, normals: BxFxD
         """
         if self.points_mode_on:
             raise NotImplemented(
                 "the topology of the shape has changed, only point related operators are allowed"
             )
-        a = self.points.view(-1)[self.index[0]]
-        b = self.points.view(-1)[self.index[1]]
-        c = self.points.view(-1)[self.index[2]]
+        return self.get_cached("centers_and_normals", self._compute_centers_and_normals)
+
+    def _compute_centers_and_normals(self):
+        points = self.points.reshape(-1, self.dimension)
+        a = points[self.index[0]]
+        b = points[self.index[1]]
+        c = points[self.index[2]]
         centers = (a + b + c) / 3.0
-        normals = torch.cross(b - a, c - a) / 2  # BxNxdim
-        zero_normal_index = torch.nonzero(torch.norm(normals, 2, 2) == 0)
+        normals = torch.cross(b - a, c - a, dim=-1) / 2  # (B*F)xdim
+        zero_normal_index = torch.nonzero(torch.norm(normals, 2, -1) == 0)
         if zero_normal_index.shape[0] > 0:
             normals.data[zero_normal_index] = 1e-7
             print(
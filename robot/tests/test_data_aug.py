@@ -0,0 +1,145 @@
+import os, sys
+
+sys.path.insert(0, os.path.abspath("../.."))
+import torch
+import unittest
+import robot.global_variable
+from scipy.spatial.transform import Rotation as R
+from robot.datasets.data_aug import BatchSplineAug
+from robot.utils.module_parameters import ParameterDict
+
+torch.manual_seed(0)
+
+
+class _RecordedBatchSplineAug(BatchSplineAug):
+    """record the random numbers drawn for the batch"""
+
+    def __init__(self, aug_settings, generator):
+        super(_RecordedBatchSplineAug, self).__init__(aug_settings, generator)
+        self.draws = []
+
+    def rand(self, *size, device=None):
+        rand = super(_RecordedBatchSplineAug, self).rand(*size, device=device)
+        self.draws.append(rand)
+        return rand
+
+
+def reference_grid_cluster(points, weights, spacing):
+    """weighted voxel centers of one sample, in the lexicographic order of the voxels"""
+    voxel_index = torch.floor(points / spacing).long()
+    voxels, inverse = torch.unique(voxel_index, dim=0, return_inverse=True)
+    cluster_points = torch.zeros(len(voxels), points.shape[1])
+    cluster_weights = torch.zeros(len(voxels), 1)
+    cluster_points.index_add_(0, inverse, points * weights)
+    cluster_weights.index_add_(0, inverse, weights)
+    return cluster_points / cluster_weights, cluster_weights
+
+
+def reference_spline_aug(aug, draws, points, weights):
+    """
+    deform one sample (NxD) with the random numbers drawn for it by BatchSplineAug,
+    in the order local deform, grid deform, rigid deform
+    """
+    settings = aug.aug_settings
+    draws = list(draws)
+    # local deform, sampling without replacement
+    num_sample = settings["local_deform_aug"]["num_sample"]
+    index = draws.pop(0).argsort()[:num_sample].sort()[0]
+    control_points, control_weights = points[index], weights[index]
+    control_disp = (draws.pop(0) * 2 - 1) * settings["local_deform_aug"]["disp_scale"]
+    points = points + aug.local_deform_spline_kernel(
+        points[None], control_points[None], control_disp[None], control_weights[None]
+    )[0]
+    # grid deform, the control points of the batch are padded to the largest sample
+    scale = settings["grid_spline_aug"]["disp_scale"] * draws.pop(0).item()
+    control_points, control_weights = reference_grid_cluster(
+        points, weights, settings["grid_spline_aug"]["grid_spacing"]
+    )
+    control_disp = (draws.pop(0)[: len(control_points)] * 2 - 1) * scale
+    points = points + aug.grid_spline_kernel(
+        points[None], control_points[None], control_disp[None], control_weights[None]
+    )[0]
+    # rigid deform
+    rigid_settings = settings["rigid_aug"]
+    scale_range = rigid_settings["scale_range"]
+    translation_range = rigid_settings["translation_range"]
+    rotation_range = rigid_settings["rotation_range"]
+    scale = draws.pop(0).item() * (scale_range[1] - scale_range[0]) + scale_range[0]
+    translation = (
+        draws.pop(0).item() * (translation_range[1] - translation_range[0])
+        + translation_range[0]
+    )
+    angles = draws.pop(0) * (rotation_range[1] - rotation_range[0]) + rotation_range[0]
+    r_matrix = R.from_euler("zyx", angles.tolist(), degrees=True).as_matrix() * scale
+    points = points @ torch.tensor(r_matrix, dtype=points.dtype) + translation
+    assert len(draws) == 0
+    return points
+
+
+def spline_aug_settings():
+    aug_settings = ParameterDict(printSettings=False)
+    aug_settings["do_local_deform_aug"] = True
+    aug_settings["do_grid_aug"] = True
+    aug_settings["do_rigid_aug"] = True
+    aug_settings["plot"] = False
+    local_deform_aug = aug_settings[("local_deform_aug", {}, "")]
+    local_deform_aug["num_sample"] = 50
+    local_deform_aug["disp_scale"] = 0.05
+    local_deform_aug[
+        "local_deform_spline_kernel_obj"
+    ] = "point_interpolator.NadWatIsoSpline(kernel_scale=0.1, exp_order=2)"
+    grid_spline_aug = aug_settings[("grid_spline_aug", {}, "")]
+    grid_spline_aug["grid_spacing"] = 0.4
+    grid_spline_aug["disp_scale"] = 0.1
+    grid_spline_aug[
+        "grid_spline_kernel_obj"
+    ] = "point_interpolator.NadWatIsoSpline(kernel_scale=0.3, exp_order=2)"
+    rigid_aug = aug_settings[("rigid_aug", {}, "")]
+    rigid_aug["rotation_range"] = [-30, 30]
+    rigid_aug["scale_range"] = [0.8, 1.2]
+    rigid_aug["translation_range"] = [-0.1, 0.1]
+    return aug_settings
+
+
+class Test_Data_Aug(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_batch_spline_aug(self):
+        aug_settings = spline_aug_settings()
+        points = torch.rand(3, 200, 3)
+        # the samples have a different number of grid control points
+        points[1] = points[1] * 0.5
+        weights = torch.rand(3, 200, 1) + 0.1
+        generator = torch.Generator().manual_seed(7)
+        batch_aug = _RecordedBatchSplineAug(aug_settings, generator)
+        batch_points, batch_weights = batch_aug(points, weights)
+        for sample_id in range(points.shape[0]):
+            reference_points = reference_spline_aug(
+                batch_aug,
+                [rand[sample_id] for rand in batch_aug.draws],
+                points[sample_id],
+                weights[sample_id],
+            )
+            torch.testing.assert_close(
+                batch_points[sample_id], reference_points, rtol=1e-4, atol=1e-5
+            )
+        torch.testing.assert_close(batch_weights, weights)
+        # the same seed gives the same batch
+        generator = torch.Generator().manual_seed(7)
+        seeded_points, _ = BatchSplineAug(aug_settings, generator)(points, weights)
+        torch.testing.assert_close(seeded_points, batch_points)
+
+
+def run_by_name(test_name):
+    suite = unittest.TestSuite()
+    suite.addTest(Test_Data_Aug(test_name))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
+
+
+if __name__ == "__main__":
+    run_by_name("test_batch_spline_aug")
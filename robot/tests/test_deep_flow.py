@@ -0,0 +1,80 @@
+import os, sys
+
+sys.path.insert(0, os.path.abspath("../.."))
+import shutil
+import tempfile
+import torch
+import unittest
+import robot.global_variable
+from robot.models_reg.model_deep_flow import (
+    DeepDiscreteFlow,
+    DeepDiscreteFlowInference,
+    export_deep_flow_inference,
+    load_deep_flow_inference,
+)
+from robot.utils.module_parameters import ParameterDict
+
+torch.manual_seed(0)
+
+
+def deep_flow_opt():
+    opt = ParameterDict(printSettings=False)
+    opt["deep_regparam_generator"] = "flotnet_regparam"
+    opt["flotnet_regparam"] = {}
+    opt["flotnet_regparam"]["use_keops"] = False
+    opt["flotnet_regparam"]["input_channel"] = 3
+    opt["n_step"] = 2
+    opt["reg_param_scale"] = 0.5
+    opt["flow_model"] = {}
+    opt["flow_model"]["model_type"] = "disp"
+    opt["deep_loss"] = "deepflow_loss"
+    return opt
+
+
+def shape_data(seed):
+    torch.manual_seed(seed)
+    points = torch.rand(1, 300, 3)
+    target_points = points + 0.02 * torch.randn_like(points)
+    weights = torch.ones(1, 300, 1) / 300
+    return {
+        "source": {"points": points, "weights": weights},
+        "target": {"points": target_points, "weights": weights.clone()},
+    }
+
+
+class Test_Deep_Flow(unittest.TestCase):
+    def setUp(self):
+        self.export_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.export_path)
+
+    def test_inference_export(self):
+        model = DeepDiscreteFlow(deep_flow_opt())
+        model.eval()
+        model.set_cur_epoch(0)
+        with torch.no_grad():
+            _, output = model(shape_data(1), {"has_gt": False, "is_synth": False})
+        inference_output = DeepDiscreteFlowInference(model)(shape_data(1))
+        torch.testing.assert_close(
+            inference_output["flowed"]["points"], output["flowed"]["points"]
+        )
+        # round trip through the exported file, the weights are loaded strictly
+        export_path = os.path.join(self.export_path, "deep_flow.pth")
+        export_deep_flow_inference(model, export_path)
+        loaded_model = load_deep_flow_inference(export_path)
+        loaded_output = loaded_model(shape_data(1))
+        torch.testing.assert_close(
+            loaded_output["flowed"]["points"], output["flowed"]["points"]
+        )
+
+
+def run_by_name(test_name):
+    suite = unittest.TestSuite()
+    suite.addTest(Test_Deep_Flow(test_name))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
+
+
+if __name__ == "__main__":
+    run_by_name("test_inference_export")
@@ -0,0 +1,75 @@
+import os, sys
+
+sys.path.insert(0, os.path.abspath("../.."))
+import torch
+import unittest
+import robot.global_variable
+from robot.global_variable import Shape
+from robot.modules_reg.module_gradient_flow import (
+    wasserstein_barycenter_mapping,
+    iter_wasserstein_plan_blocks,
+)
+from robot.utils.module_parameters import ParameterDict
+
+torch.manual_seed(0)
+
+
+class Test_Gradient_Flow(unittest.TestCase):
+    def setUp(self):
+        self.source = Shape().set_data(points=torch.rand(2, 300, 3))
+        self.target = Shape().set_data(points=torch.rand(2, 200, 3) + 0.1)
+
+    def tearDown(self):
+        pass
+
+    def geomloss_setting(self, mode, **settings):
+        opt = ParameterDict(printSettings=False)
+        opt["geom_obj"] = (
+            "geomloss.SamplesLoss(loss='sinkhorn',blur=0.05, scaling=0.8,debias=False)"
+        )
+        opt["attr"] = "points"
+        opt["mode"] = mode
+        for key, value in settings.items():
+            opt[key] = value
+        return opt
+
+    def test_plan_blocks(self):
+        for mode in ["trans_plan", "prob"]:
+            P, log_P = wasserstein_barycenter_mapping(
+                self.source, self.target, self.geomloss_setting(mode)
+            )
+            # the non chunked modes keep returning the LazyTensors
+            self.assertEqual(P.__class__.__name__, "LazyTensor")
+            # a budget of ~50 rows per block, the source is split into several blocks
+            setting = self.geomloss_setting(mode, chunked=True, memory_budget_mb=0.25)
+            blocks = list(
+                wasserstein_barycenter_mapping(self.source, self.target, setting)
+            )
+            self.assertGreater(len(blocks), 1)
+            self.assertEqual(blocks[-1][0].stop, self.source.points.shape[1])
+            log_P_dense = torch.cat([log_P_block for _, _, log_P_block in blocks], 1)
+            # the row sums of the dense blocks match the KeOps reduction
+            torch.testing.assert_close(
+                log_P_dense.logsumexp(2, keepdim=True),
+                log_P.logsumexp(dim=2),
+                rtol=1e-4,
+                atol=1e-4,
+            )
+            P_dense = torch.cat([P_block for _, P_block, _ in blocks], 1)
+            torch.testing.assert_close(P_dense, log_P_dense.exp())
+        # the other modes can not be streamed
+        with self.assertRaises(ValueError):
+            iter_wasserstein_plan_blocks(
+                self.source, self.target, self.geomloss_setting("soft")
+            )
+
+
+def run_by_name(test_name):
+    suite = unittest.TestSuite()
+    suite.addTest(Test_Gradient_Flow(test_name))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
+
+
+if __name__ == "__main__":
+    run_by_name("test_plan_blocks")
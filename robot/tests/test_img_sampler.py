@@ -0,0 +1,90 @@
+import os, sys
+
+sys.path.insert(0, os.path.abspath("../.."))
+import numpy as np
+import SimpleITK as sitk
+import torch
+import unittest
+from robot.experiments.datasets.lung.img_sampler import DataProcessing
+
+torch.manual_seed(0)
+
+
+class Test_Img_Sampler(unittest.TestCase):
+    def setUp(self):
+        array = np.random.RandomState(0).rand(10, 12, 14)
+        self.image = sitk.GetImageFromArray(array)
+        self.image.SetSpacing((1.0, 1.5, 2.0))
+        self.image.SetOrigin((3.0, -2.0, 1.0))
+
+    def tearDown(self):
+        pass
+
+    def test_bspline_elastic_deformation(self):
+        for interpolator in [sitk.sitkLinear, sitk.sitkBSpline]:
+            warped_list = []
+            for use_torch in [False, True]:
+                warped, transform = DataProcessing.random_bspline_elastic_deformation(
+                    self.image,
+                    mesh_size=(3, 2, 4),
+                    magnitude=2.0,
+                    interpolator=interpolator,
+                    use_torch=use_torch,
+                    generator=torch.Generator().manual_seed(0),
+                )
+                warped_list.append(sitk.GetArrayFromImage(warped))
+            np.testing.assert_allclose(warped_list[1], warped_list[0], atol=1e-10)
+            self.assertGreater(
+                np.abs(warped_list[0] - sitk.GetArrayFromImage(self.image)).max(), 0.1
+            )
+
+    def test_bspline_displacement(self):
+        mesh_size = (3, 2, 4)
+        _, transform = DataProcessing.random_bspline_elastic_deformation(
+            self.image, mesh_size=mesh_size, generator=torch.Generator().manual_seed(0)
+        )
+        coefficients = torch.tensor(transform.GetParameters(), dtype=torch.float64)
+        coefficients = coefficients.view(3, *[m + 3 for m in mesh_size[::-1]]).flip(0)
+        size = self.image.GetSize()[::-1]
+        spacing = self.image.GetSpacing()[::-1]
+        # continuous indices in the array axis order
+        points = torch.rand(1, 50, 3, dtype=torch.float64) * (
+            torch.tensor(size, dtype=torch.float64) - 1
+        )
+        displacement = DataProcessing.bspline_displacement_torch(
+            coefficients[None], size, spacing, points
+        )
+        for point, point_displacement in zip(points[0], displacement[0]):
+            physical_point = self.image.TransformContinuousIndexToPhysicalPoint(
+                point.flip(0).tolist()
+            )
+            sitk_displacement = np.array(
+                transform.TransformPoint(physical_point)
+            ) - np.array(physical_point)
+            np.testing.assert_allclose(
+                point_displacement.flip(0).numpy(), sitk_displacement, atol=1e-10
+            )
+        # on the image grid, the displacement is the same as the one at the points
+        grid_displacement = DataProcessing.bspline_displacement_torch(
+            coefficients[None], size, spacing
+        )
+        index = points[0].round().long()
+        points = index.to(torch.float64)[None]
+        np.testing.assert_allclose(
+            DataProcessing.bspline_displacement_torch(
+                coefficients[None], size, spacing, points
+            )[0].numpy(),
+            grid_displacement[0, :, index[:, 0], index[:, 1], index[:, 2]].t().numpy(),
+            atol=1e-10,
+        )
+
+
+def run_by_name(test_name):
+    suite = unittest.TestSuite()
+    suite.addTest(Test_Img_Sampler(test_name))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
+
+
+if __name__ == "__main__":
+    run_by_name("test_bspline_elastic_deformation")
@@ -187,6 +187,208 @@ class Test_Kernels(unittest.TestCase):
         torch.testing.assert_allclose(keops_gauss, torch_gauss, rtol=1e-3, atol=1e-7)
         self.compare_tensors(keops_grads, torch_grads, rtol=1e-3, atol=1e-7)
 
+    def test_kernel_multi_gaussian_lin(self, task_name="multi_gauss_lin"):
+        kernel_args = dict(sigma_list=[0.01, 0.05, 0.1], weight_list=[0.2, 0.3, 0.5])
+        keops_kernel = LazyKeopsKernel(kernel_type="multi_gauss_lin", **kernel_args)
+        torch_kernel = TorchKernel(kernel_type="multi_gauss_lin", **kernel_args)
+        keops_kernel = timming(
+            keops_kernel, "test_kernel_{} with keops".format(task_name)
+        )
+        torch_kernel = timming(
+            torch_kernel, "test_kernel_{} with torch".format(task_name)
+        )
+        b = self.b[..., :1]
+        keops_gauss = keops_kernel(self.x, self.y, self.px, self.py, b)
+        torch_gauss = torch_kernel(self.x, self.y, self.px, self.py, b)
+        keops_grads = grad(
+            keops_gauss.mean(), (self.x, self.y, self.px, self.py), retain_graph=True
+        )
+        torch_grads = grad(
+            torch_gauss.mean(), (self.x, self.y, self.px, self.py), retain_graph=True
+        )
+        torch.testing.assert_allclose(keops_gauss, torch_gauss, rtol=1e-3, atol=1e-7)
+        self.compare_tensors(keops_grads, torch_grads, rtol=1e-3, atol=1e-7)
+
+    def test_kernel_normalized_multi_gaussian(
+        self, task_name="normalized_multi_gauss"
+    ):
+        sigma_list, weight_list = [0.01, 0.05, 0.1], [0.2, 0.3, 0.5]
+        fused_kernel = LazyKeopsKernel(
+            kernel_type="normalized_multi_gauss",
+            sigma_list=sigma_list,
+            weight_list=weight_list,
+        )
+        fused_kernel = timming(
+            fused_kernel, "test_kernel_{} fused".format(task_name)
+        )
+        loop_kernel = timming(
+            LazyKeopsKernel.normalized_multi_gauss_loop,
+            "test_kernel_{} loop".format(task_name),
+        )
+        fused_gauss = fused_kernel(self.x, self.y, self.b)
+        loop_gauss = loop_kernel(self.x, self.y, self.b, sigma_list, weight_list)
+        fused_grads = grad(
+            fused_gauss.mean(), (self.x, self.y, self.b), retain_graph=True
+        )
+        loop_grads = grad(
+            loop_gauss.mean(), (self.x, self.y, self.b), retain_graph=True
+        )
+        torch.testing.assert_allclose(fused_gauss, loop_gauss, rtol=1e-3, atol=1e-6)
+        self.compare_tensors(fused_grads, loop_grads, rtol=1e-3, atol=1e-6)
+        # an isolated point would underflow an unshifted normalizer
+        x = self.x.detach().clone()
+        x[0, 0] = 100.0
+        x.requires_grad_()
+        fused_gauss = fused_kernel(x, self.y, self.b)
+        loop_gauss = loop_kernel(x, self.y, self.b, sigma_list, weight_list)
+        self.assertTrue(torch.isfinite(fused_gauss).all())
+        torch.testing.assert_allclose(fused_gauss, loop_gauss, rtol=1e-3, atol=1e-6)
+        fused_grads = grad(fused_gauss.mean(), (x, self.y, self.b), retain_graph=True)
+        loop_grads = grad(loop_gauss.mean(), (x, self.y, self.b), retain_graph=True)
+        # the gradient of the isolated point vanishes, up to the float32 rounding
+        self.compare_tensors(fused_grads, loop_grads, rtol=1e-3, atol=1e-5)
+
+    def aniso_gamma(self, num, scale=0.1):
+        B, D = self.x.shape[0], self.x.shape[-1]
+        rot = torch.randn(B, num, D, D, device=self.x.device)
+        cov = rot @ rot.transpose(-1, -2) + torch.eye(D, device=self.x.device)
+        return (torch.inverse(cov) / scale ** 2).requires_grad_()
+
+    def test_kernel_aniso_gaussian(self, task_name="aniso_gauss"):
+        kernel_args = dict(
+            relative_scale_list=[0.5, 1.0, 2.0], weight_list=[0.2, 0.3, 0.5]
+        )
+        for self_center in [False, True]:
+            num = self.x.shape[1] if self_center else self.y.shape[1]
+            gamma = self.aniso_gamma(num)
+            for kernel_type, args in [
+                ("aniso_gauss", {}),
+                ("aniso_multi_gauss", kernel_args),
+            ]:
+                keops_kernel = LazyKeopsKernel(
+                    kernel_type=kernel_type, self_center=self_center, **args
+                )
+                torch_kernel = TorchKernel(
+                    kernel_type=kernel_type, self_center=self_center, **args
+                )
+                keops_kernel = timming(
+                    keops_kernel, "test_kernel_{} with keops".format(kernel_type)
+                )
+                torch_kernel = timming(
+                    torch_kernel, "test_kernel_{} with torch".format(kernel_type)
+                )
+                keops_gauss = keops_kernel(self.x, self.y, self.b, gamma)
+                torch_gauss = torch_kernel(self.x, self.y, self.b, gamma)
+                inputs = (self.x, self.y, self.b, gamma)
+                keops_grads = grad(keops_gauss.mean(), inputs, retain_graph=True)
+                torch_grads = grad(torch_gauss.mean(), inputs, retain_graph=True)
+                torch.testing.assert_allclose(
+                    keops_gauss, torch_gauss, rtol=1e-3, atol=1e-6
+                )
+                self.compare_tensors(keops_grads, torch_grads, rtol=1e-3, atol=1e-6)
+        # an isotropic gamma recovers the gauss kernel
+        gamma = torch.eye(3).repeat(*self.y.shape[:2], 1, 1) / 0.1 ** 2
+        torch.testing.assert_allclose(
+            LazyKeopsKernel(kernel_type="aniso_gauss")(self.x, self.y, self.b, gamma),
+            LazyKeopsKernel(kernel_type="gauss", sigma=0.1)(self.x, self.y, self.b),
+            rtol=1e-3,
+            atol=1e-6,
+        )
+
+    def test_aniso_multi_gauss_spatial_conv(self):
+        from robot.modules_reg.networks.geo_net_utils import AnisoMultiGaussSpatialConv
+
+        kernel_args = dict(
+            relative_scale_list=[0.5, 1.0, 2.0], weight_list=[0.2, 0.3, 0.5]
+        )
+        for self_center in [False, True]:
+            num = self.x.shape[1] if self_center else self.y.shape[1]
+            gamma = self.aniso_gamma(num)
+            conv = AnisoMultiGaussSpatialConv(self_center=self_center, **kernel_args)
+            torch_kernel = TorchKernel(
+                kernel_type="aniso_multi_gauss", self_center=self_center, **kernel_args
+            )
+            torch.testing.assert_allclose(
+                conv(self.x, self.y, self.b, gamma),
+                torch_kernel(self.x, self.y, self.b, gamma),
+                rtol=1e-3,
+                atol=1e-6,
+            )
+
+    def test_kernel_aniso_gaussian_grad(self, task_name="aniso_gauss_grad"):
+        kernel_args = dict(
+            relative_scale_list=[0.5, 1.0, 2.0], weight_list=[0.2, 0.3, 0.5]
+        )
+        for self_center in [False, True]:
+            num = self.x.shape[1] if self_center else self.y.shape[1]
+            gamma = self.aniso_gamma(num)
+            for kernel_type, args in [
+                ("aniso_gauss", {}),
+                ("aniso_multi_gauss", kernel_args),
+            ]:
+                keops_kernel = LazyKeopsKernel(
+                    kernel_type=kernel_type + "_grad", self_center=self_center, **args
+                )
+                torch_kernel = TorchKernel(
+                    kernel_type=kernel_type + "_grad", self_center=self_center, **args
+                )
+                keops_gauss = keops_kernel(self.px, self.x, self.py, self.y, gamma)
+                torch_gauss = torch_kernel(self.px, self.x, self.py, self.y, gamma)
+                torch.testing.assert_allclose(
+                    keops_gauss, torch_gauss, rtol=1e-3, atol=1e-5
+                )
+                # derivative of the kernel w.r.t. its first argument
+                x = self.x.detach().clone().requires_grad_()
+                kernel = TorchKernel(
+                    kernel_type=kernel_type, self_center=self_center, **args
+                )
+                energy = (self.px * kernel(x, self.y, self.py, gamma)).sum()
+                torch.testing.assert_allclose(
+                    keops_gauss, grad(energy, x)[0], rtol=1e-3, atol=1e-5
+                )
+
+    def check_low_precision(self, low_kernel, x, y, b):
+        """compare a low precision gauss kernel and its gradients with float32"""
+        ref_kernel = TorchKernel(kernel_type="gauss", sigma=0.1)
+        low_gauss = low_kernel(x, y, b)
+        ref_gauss = ref_kernel(x, y, b)
+        self.assertEqual(low_gauss.dtype, torch.float32)
+        ref_grads = grad(ref_gauss.mean(), (x, y, b), retain_graph=True)
+        low_grads = grad(low_gauss.mean(), (x, y, b), retain_graph=True)
+        err = ((low_gauss - ref_gauss).norm() / ref_gauss.norm()).item()
+        # the low precision is effective, but close to the reference
+        self.assertGreater(err, 1e-6)
+        self.assertLess(err, 2e-2)
+        for low_grad, ref_grad in zip(low_grads, ref_grads):
+            self.assertLess(
+                ((low_grad - ref_grad).norm() / ref_grad.norm()).item(), 5e-2
+            )
+
+    def test_kernel_gaussian_low_precision(self, task_name="gauss_bfloat16"):
+        device = self.x.device
+        precision = "float16" if device.type == "cuda" else "bfloat16"
+        torch_kernel = TorchKernel(kernel_type="gauss", precision=precision, sigma=0.1)
+        torch_kernel = timming(
+            torch_kernel, "test_kernel_{} with torch".format(task_name)
+        )
+        self.check_low_precision(torch_kernel, self.x, self.y, self.b)
+
+    @unittest.skipUnless(
+        torch.cuda.is_available(), "keops reduces in float32 on cpu, no gpu found"
+    )
+    def test_keops_kernel_gaussian_low_precision(self, task_name="gauss_float16"):
+        x, y, b = [
+            tensor.detach().cuda().requires_grad_()
+            for tensor in [self.x, self.y, self.b]
+        ]
+        keops_kernel = LazyKeopsKernel(
+            kernel_type="gauss", precision="float16", sigma=0.1
+        )
+        keops_kernel = timming(
+            keops_kernel, "test_kernel_{} with keops".format(task_name)
+        )
+        self.check_low_precision(keops_kernel, x, y, b)
+
 
 def run_by_name(test_name):
     suite = unittest.TestSuite()
@@ -201,3 +403,10 @@ if __name__ == "__main__":
     run_by_name("test_kernel_gaussian_grad")
     run_by_name("test_kernel_multi_gaussian_grad")
     run_by_name("test_kernel_gaussian_lin")
+    run_by_name("test_kernel_multi_gaussian_lin")
+    run_by_name("test_kernel_normalized_multi_gaussian")
+    run_by_name("test_kernel_aniso_gaussian")
+    run_by_name("test_kernel_aniso_gaussian_grad")
+    run_by_name("test_aniso_multi_gauss_spatial_conv")
+    run_by_name("test_kernel_gaussian_low_precision")
+    run_by_name("test_keops_kernel_gaussian_low_precision")
@@ -0,0 +1,77 @@
+import os, sys
+
+sys.path.insert(0, os.path.abspath("../.."))
+import torch
+import unittest
+from robot.experiments.datasets.lung_filter.key_point_extractor import (
+    depth_tiles,
+    mindssc,
+    mindssc_halo,
+    mindssc_tile_depth,
+    ssd,
+    ssd_streaming,
+)
+
+torch.manual_seed(0)
+
+
+class Test_Key_Point_Extractor(unittest.TestCase):
+    def setUp(self):
+        D, H, W = 32, 12, 12
+        self.img_fixed = torch.rand(1, 1, D, H, W)
+        self.img_moving = torch.rand(1, 1, D, H, W)
+        self.kpts_fixed = torch.rand(1, 100, 3) * 2 - 1
+        # the budget of a slab of n slices, 80 single channel temporaries per slice
+        self.slab_budget_mb = lambda n: n * 80 * H * W * 4 / 1024 ** 2
+
+    def tearDown(self):
+        pass
+
+    def test_tiled_mindssc(self):
+        halo = mindssc_halo()
+        memory_budget_mb = self.slab_budget_mb(8 + 2 * halo)
+        tile_depth = mindssc_tile_depth(self.img_fixed, memory_budget_mb, halo)
+        self.assertGreaterEqual(len(depth_tiles(32, tile_depth, halo)), 3)
+        mind = mindssc(self.img_fixed)
+        tiled_mind = mindssc(self.img_fixed, memory_budget_mb=memory_budget_mb)
+        torch.testing.assert_close(tiled_mind, mind)
+
+    def test_tiled_ssd(self):
+        ssd_args = dict(disp_radius=2, disp_step=2, patch_radius=2)
+        feat_fixed, feat_moving = mindssc(self.img_fixed), mindssc(self.img_moving)
+        orig_shape = self.img_fixed.shape[2:]
+        cost = ssd(self.kpts_fixed, feat_fixed, feat_moving, orig_shape, **ssd_args)
+        chunked_cost = ssd(
+            self.kpts_fixed,
+            feat_fixed,
+            feat_moving,
+            orig_shape,
+            memory_budget_mb=0.5,
+            **ssd_args
+        )
+        torch.testing.assert_close(chunked_cost, cost)
+        # the keypoints are streamed over depth tiles, the slabs read 7 voxels around
+        # a keypoint, plus the MIND-SSC halo
+        halo = 7 + mindssc_halo()
+        memory_budget_mb = self.slab_budget_mb(8 + 2 * halo)
+        tile_depth = mindssc_tile_depth(self.img_fixed, memory_budget_mb, halo)
+        self.assertGreaterEqual(len(depth_tiles(32, tile_depth, halo)), 3)
+        streaming_cost = ssd_streaming(
+            self.kpts_fixed,
+            self.img_fixed,
+            self.img_moving,
+            memory_budget_mb=memory_budget_mb,
+            **ssd_args
+        )
+        torch.testing.assert_close(streaming_cost, cost, rtol=1e-5, atol=1e-5)
+
+
+def run_by_name(test_name):
+    suite = unittest.TestSuite()
+    suite.addTest(Test_Key_Point_Extractor(test_name))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
+
+
+if __name__ == "__main__":
+    run_by_name("test_tiled_mindssc")
@@ -0,0 +1,52 @@
+import os, sys, json, tempfile
+
+sys.path.insert(0, os.path.abspath("../.."))
+import unittest
+from robot.utils.module_parameters import ParameterDict, FrozenParameterDict
+
+
+class Test_ModuleParameters(unittest.TestCase):
+    def setUp(self):
+        self.par = ParameterDict(printSettings=False)
+        self.par["model"] = ({}, "model settings")
+        self.par["model"]["sim_factor"] = (10, "similarity factor")
+
+    def tearDown(self):
+        pass
+
+    def test_freeze(self):
+        frozen = self.par.freeze()
+        model = frozen["model"]
+        self.assertIsInstance(model, FrozenParameterDict)
+        self.assertIs(frozen["model"], model)
+        self.assertEqual(model[("sim_factor", 1, "similarity factor")], 10)
+        self.assertEqual(model[("reg_factor", 0.1, "regularization factor")], 0.1)
+        # defaults are recorded once in the underlying ParameterDict
+        self.assertEqual(self.par["model"]["reg_factor"], 0.1)
+        self.assertEqual(self.par.com["model"]["reg_factor"], "regularization factor")
+        self.assertIn("sim_factor", model)
+        with self.assertRaises(TypeError):
+            model["sim_factor"] = 1
+
+    def test_freeze_write_json(self):
+        frozen = self.par.freeze()
+        frozen["model"][("decay_factor", 8, "decay factor")]
+        with tempfile.TemporaryDirectory() as folder:
+            file_names = [os.path.join(folder, "par.json"), os.path.join(folder, "com.json")]
+            frozen.write_JSON_and_JSON_comments(file_names)
+            with open(file_names[0]) as f:
+                self.assertEqual(json.load(f), {"model": {"decay_factor": 8, "sim_factor": 10}})
+            with open(file_names[1]) as f:
+                self.assertEqual(json.load(f)["model"]["decay_factor"], "decay factor")
+
+
+def run_by_name(test_name):
+    suite = unittest.TestSuite()
+    suite.addTest(Test_ModuleParameters(test_name))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
+
+
+if __name__ == "__main__":
+    run_by_name("test_freeze")
+    run_by_name("test_freeze_write_json")
@@ -0,0 +1,139 @@
+import os, sys
+
+sys.path.insert(0, os.path.abspath("../.."))
+import shutil
+import tempfile
+import torch
+import unittest
+import robot.global_variable
+from robot.global_variable import Shape
+from robot.shape.shape_pair import ShapePair
+from robot.models_reg.model_discrete_flow import DiscreteFlowOPT
+from robot.models_reg.multiscale_optimization import build_single_scale_general_solver
+from robot.utils.module_parameters import ParameterDict
+
+torch.manual_seed(0)
+
+
+class _DispModel(torch.nn.Module):
+    """displacement model, one energy per pair: ||source + disp - target||^2 + 1"""
+
+    def __init__(self):
+        super(_DispModel, self).__init__()
+        self.batch_sizes = []
+        self.supports_pair_compaction = True
+
+    def set_record_path(self, record_path):
+        pass
+
+    def init_reg_param(self, shape_pair):
+        reg_param = torch.zeros_like(shape_pair.source.points).requires_grad_()
+        shape_pair.set_reg_param(reg_param)
+
+    def reset(self):
+        pass
+
+    def forward(self, shape_pair):
+        self.batch_sizes.append(shape_pair.reg_param.shape[0])
+        flowed_points = shape_pair.source.points + shape_pair.reg_param
+        shape_pair.flowed = Shape().set_data_with_refer_to(
+            flowed_points, shape_pair.source
+        )
+        dist = (flowed_points - shape_pair.target.points) ** 2
+        return dist.sum(2).mean(1) + 1.0
+
+
+class _OffsetDiscreteFlowOPT(DiscreteFlowOPT):
+    """the aligned pair has a constant energy, so its relative change vanishes"""
+
+    def forward(self, shape_pair):
+        return super(_OffsetDiscreteFlowOPT, self).forward(shape_pair) + 1.0
+
+
+class Test_Multiscale_Optimization(unittest.TestCase):
+    def setUp(self):
+        self.record_path = tempfile.mkdtemp()
+        points = torch.rand(2, 50, 3)
+        target = points.clone()
+        # the first pair is already aligned and converges at once
+        target[1] += 1.0
+        self.source = Shape().set_data(points=points)
+        self.target = Shape().set_data(points=target)
+
+    def tearDown(self):
+        shutil.rmtree(self.record_path)
+
+    def solve(self, compact_converged_pairs, num_iter=30, model=None, lr=0.01):
+        opt = ParameterDict(printSettings=False)
+        opt["save_res"] = False
+        opt["record_path"] = self.record_path
+        opt["compact_converged_pairs"] = compact_converged_pairs
+        opt["optim"] = {}
+        opt["optim"]["type"] = "sgd"
+        model = _DispModel() if model is None else model
+        solver = build_single_scale_general_solver(
+            opt, model, num_iter, lr=lr, rel_ftol=1e-4, patient=2
+        )
+        shape_pair = ShapePair(dense_mode=True)
+        shape_pair.set_source_and_target(self.source, self.target)
+        return solver(shape_pair), model
+
+    def discrete_flow_model(self, drift_every_n_iter):
+        opt = ParameterDict(printSettings=False)
+        opt["drift_every_n_iter"] = drift_every_n_iter
+        opt["print_step"] = 100
+        opt["sim_loss"] = {}
+        opt["sim_loss"]["loss_list"] = ["l2"]
+        opt["sim_loss"]["l2"] = {}
+        opt["sim_loss"]["l2"]["attr"] = "points"
+        return _OffsetDiscreteFlowOPT(opt)
+
+    def test_per_pair_convergence(self):
+        for compact_converged_pairs in [True, False]:
+            shape_pair, model = self.solve(compact_converged_pairs)
+            stop_iter = shape_pair.extra_info["stop_iter"]
+            # the first pair is frozen early, the second one keeps iterating
+            self.assertLess(stop_iter[0], 10)
+            self.assertEqual(stop_iter[1], 29)
+            self.assertEqual(
+                model.batch_sizes[-1], 1 if compact_converged_pairs else 2
+            )
+            reg_param = shape_pair.reg_param.detach()
+            self.assertLess(reg_param[0].abs().max().item(), 1e-6)
+            self.assertGreater(reg_param[1].mean().item(), 0.05)
+            # the flowed points of both pairs are kept, they come from the last evaluation
+            flowed_points = shape_pair.flowed.points
+            torch.testing.assert_close(flowed_points[0], self.source.points[0])
+            disp = (flowed_points[1] - self.source.points[1]).mean().item()
+            self.assertGreater(disp, 0.05)
+
+    def test_per_pair_convergence_discrete_flow(self):
+        # the drift buffers hold the full batch, the compaction is skipped
+        model = self.discrete_flow_model(drift_every_n_iter=5)
+        self.assertFalse(model.supports_pair_compaction)
+        shape_pair, _ = self.solve(True, model=model, lr=1.0)
+        stop_iter = shape_pair.extra_info["stop_iter"]
+        self.assertLess(stop_iter[0], 29)
+        self.assertEqual(shape_pair.reg_param.shape[0], 2)
+        self.assertEqual(shape_pair.flowed.points.shape, self.source.points.shape)
+        # without drift, the model evaluates the compacted batch
+        model = self.discrete_flow_model(drift_every_n_iter=-1)
+        self.assertTrue(model.supports_pair_compaction)
+        shape_pair, _ = self.solve(True, model=model, lr=1.0)
+        self.assertLess(shape_pair.extra_info["stop_iter"][0], 29)
+        self.assertEqual(shape_pair.flowed.points.shape, self.source.points.shape)
+        torch.testing.assert_close(
+            shape_pair.flowed.points[0], self.source.points[0], atol=1e-4, rtol=0
+        )
+
+
+def run_by_name(test_name):
+    suite = unittest.TestSuite()
+    suite.addTest(Test_Multiscale_Optimization(test_name))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
+
+
+if __name__ == "__main__":
+    run_by_name("test_per_pair_convergence")
+    run_by_name("test_per_pair_convergence_discrete_flow")
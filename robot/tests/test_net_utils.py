@@ -0,0 +1,71 @@
+import os, sys
+
+sys.path.insert(0, os.path.abspath("../.."))
+import shutil
+import tempfile
+import torch
+import unittest
+from robot.utils.net_utils import CheckpointSaver
+
+
+class Test_Net_Utils(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.model = torch.nn.Linear(3, 3)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def make_state(self, epoch):
+        return {
+            "epoch": epoch,
+            "state_dict": self.model.state_dict(),
+            "global_step": {"train": epoch},
+        }
+
+    def test_async_checkpoint(self):
+        saver = CheckpointSaver(asynchronous=True)
+        weight = self.model.weight.detach().clone()
+        saver.save(self.make_state(0), True, self.path, "epoch_0", "")
+        # the snapshot is taken before the update
+        with torch.no_grad():
+            self.model.weight.add_(1.0)
+        saver.close()
+        for name in ["epoch_0_", "model_best.pth.tar"]:
+            checkpoint = torch.load(os.path.join(self.path, name))
+            self.assertEqual(checkpoint["epoch"], 0)
+            torch.testing.assert_close(checkpoint["state_dict"]["weight"], weight)
+        self.assertFalse(any(name.endswith(".tmp") for name in os.listdir(self.path)))
+
+    def test_checkpoint_retention(self):
+        for asynchronous in [True, False]:
+            saver = CheckpointSaver(asynchronous=asynchronous, max_to_keep=2)
+            for epoch in range(4):
+                saver.save(
+                    self.make_state(epoch),
+                    epoch == 1,
+                    self.path,
+                    "epoch_" + str(epoch),
+                    "",
+                )
+            saver.close()
+            self.assertEqual(
+                sorted(os.listdir(self.path)),
+                ["epoch_2_", "epoch_3_", "model_best.pth.tar"],
+            )
+            checkpoint = torch.load(os.path.join(self.path, "model_best.pth.tar"))
+            self.assertEqual(checkpoint["epoch"], 1)
+            shutil.rmtree(self.path)
+            os.makedirs(self.path)
+
+
+def run_by_name(test_name):
+    suite = unittest.TestSuite()
+    suite.addTest(Test_Net_Utils(test_name))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
+
+
+if __name__ == "__main__":
+    run_by_name("test_async_checkpoint")
+    run_by_name("test_checkpoint_retention")
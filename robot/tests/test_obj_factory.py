@@ -0,0 +1,65 @@
+import os, sys
+
+sys.path.insert(0, os.path.abspath("../.."))
+import unittest
+from functools import partial
+from robot.utils.obj_factory import (
+    obj_factory,
+    partial_obj_factory,
+    parse_args_exp,
+    compile_obj_exp,
+)
+
+
+class Test_ObjFactory(unittest.TestCase):
+    def setUp(self):
+        compile_obj_exp.cache_clear()
+
+    def tearDown(self):
+        pass
+
+    def test_parse_args_exp(self):
+        args, kwargs = parse_args_exp(
+            "('sinkhorn', -1, blur=0.01, sigma_list=[0.05,0.1], opt={'a': (1, None)}, debias=False)"
+        )
+        self.assertEqual(args, ("sinkhorn", -1))
+        self.assertEqual(
+            kwargs,
+            {"blur": 0.01, "sigma_list": [0.05, 0.1], "opt": {"a": (1, None)}, "debias": False},
+        )
+        with self.assertRaises(ValueError):
+            parse_args_exp("(__import__('os').getcwd())")
+        with self.assertRaises(ValueError):
+            parse_args_exp("(**{'a': 1})")
+
+    def test_obj_factory_cache(self):
+        exp = "collections.OrderedDict(a=[1, 2])"
+        obj = obj_factory(exp, b=3)
+        self.assertEqual(dict(obj), {"a": [1, 2], "b": 3})
+        obj["a"].append(3)
+        # the cached arguments are not shared with the created object
+        self.assertEqual(dict(obj_factory(exp, b=4)), {"a": [1, 2], "b": 4})
+        self.assertEqual(compile_obj_exp.cache_info().misses, 1)
+        self.assertEqual(compile_obj_exp.cache_info().hits, 1)
+        # the keyword arguments of the expression take precedence
+        self.assertEqual(dict(obj_factory(exp, a=0)), {"a": [1, 2]})
+
+    def test_partial_obj_factory(self):
+        func = partial_obj_factory("math.pow(2)")
+        self.assertIsInstance(func, partial)
+        self.assertEqual(func(3), 8)
+        self.assertEqual(obj_factory(func, 2), 4)
+        self.assertEqual(obj_factory(["math.sqrt(4)", "math.sqrt(9)"]), [2, 3])
+
+
+def run_by_name(test_name):
+    suite = unittest.TestSuite()
+    suite.addTest(Test_ObjFactory(test_name))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
+
+
+if __name__ == "__main__":
+    run_by_name("test_parse_args_exp")
+    run_by_name("test_obj_factory_cache")
+    run_by_name("test_partial_obj_factory")
@@ -0,0 +1,74 @@
+import os, sys
+
+sys.path.insert(0, os.path.abspath("../.."))
+import torch
+import unittest
+import robot.global_variable
+from robot.modules_reg.networks import ot
+
+torch.manual_seed(0)
+
+
+def dense_transport_flow(transport, pcloud1, pcloud2):
+    row_sum = transport.sum(-1, keepdim=True)
+    return (transport @ pcloud2) / (row_sum + 1e-8) - pcloud1
+
+
+class Test_OT(unittest.TestCase):
+    def setUp(self):
+        B, N, M, C = 2, 120, 100, 16
+        dtype = torch.float64
+        self.feature1 = torch.randn(B, N, C, dtype=dtype)
+        self.feature2 = torch.randn(B, M, C, dtype=dtype)
+        self.pcloud1 = torch.rand(B, N, 3, dtype=dtype)
+        self.pcloud2 = self.pcloud1[:, :M] + 0.1 * torch.randn(B, M, 3, dtype=dtype)
+        self.epsilon = torch.tensor(0.06, dtype=dtype)
+        self.gamma = torch.tensor(0.5, dtype=dtype)
+
+    def tearDown(self):
+        pass
+
+    def compare(self, pcloud1, pcloud2, max_iter):
+        args = (self.feature1, self.feature2, pcloud1, pcloud2, self.epsilon)
+        transport = ot.sinkhorn(*args, self.gamma, max_iter)
+        log_a, log_b, log_K = ot.sinkhorn_keops(*args, self.gamma, max_iter)
+        # the row and column sums of the plan, log T = log_a + log_K + log_b
+        log_row_sum = log_a + (log_K + ot.LazyTensor(log_b[:, None])).logsumexp(2)
+        log_col_sum = log_b + (log_K + ot.LazyTensor(log_a[:, :, None])).logsumexp(1)
+        torch.testing.assert_close(
+            log_row_sum.exp(), transport.sum(2, keepdim=True), rtol=1e-8, atol=1e-12
+        )
+        torch.testing.assert_close(
+            log_col_sum.exp(), transport.sum(1)[..., None], rtol=1e-8, atol=1e-12
+        )
+        torch.testing.assert_close(
+            ot.keops_transport_flow(log_a, log_b, log_K, pcloud1, pcloud2),
+            dense_transport_flow(transport, pcloud1, pcloud2),
+            rtol=1e-8,
+            atol=1e-10,
+        )
+        return transport
+
+    def test_sinkhorn_keops(self):
+        for max_iter in [0, 1, 5]:
+            self.compare(self.pcloud1, self.pcloud2, max_iter)
+
+    def test_sinkhorn_keops_masked(self):
+        # spread the clouds over 20 m, so part of the pairs is outside the 10 m support
+        pcloud1, pcloud2 = self.pcloud1 * 20, self.pcloud2 * 20
+        for max_iter in [0, 5]:
+            transport = self.compare(pcloud1, pcloud2, max_iter)
+            masked = torch.cdist(pcloud1, pcloud2) >= 10
+            self.assertTrue(masked.any())
+            self.assertEqual(transport[masked].abs().max().item(), 0)
+
+
+def run_by_name(test_name):
+    suite = unittest.TestSuite()
+    suite.addTest(Test_OT(test_name))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
+
+
+if __name__ == "__main__":
+    run_by_name("test_sinkhorn_keops")
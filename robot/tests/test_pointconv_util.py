@@ -0,0 +1,71 @@
+import os, sys
+
+sys.path.insert(0, os.path.abspath("../.."))
+import torch
+import unittest
+import robot.global_variable
+from robot.modules_reg.networks.pointconv_util import knn_point, square_distance
+from robot.modules_reg.networks.pointpwcnet import computeChamfer
+
+torch.manual_seed(0)
+
+
+def dense_knn_point(nsample, xyz, new_xyz):
+    """the dense search the PointPWC losses used before, square_distance + topk"""
+    sqrdist = square_distance(new_xyz, xyz)
+    dist, idx = torch.topk(sqrdist, nsample, dim=-1, largest=False, sorted=False)
+    return idx, dist
+
+
+class Test_Pointconv_Util(unittest.TestCase):
+    def setUp(self):
+        self.pc1 = torch.rand(2, 300, 3)
+        self.pc2 = torch.rand(2, 200, 3)
+
+    def tearDown(self):
+        pass
+
+    def test_knn_point(self):
+        # the (nsample, xyz, new_xyz) of curvature, computeSmooth, interpolateCurvature
+        # and computeChamfer
+        for nsample, xyz, new_xyz in [
+            (10, self.pc1, self.pc1),
+            (9, self.pc1, self.pc1),
+            (5, self.pc2, self.pc1),
+            (1, self.pc2, self.pc1),
+            (1, self.pc1, self.pc2),
+        ]:
+            idx, dist = knn_point(nsample, xyz, new_xyz, return_dist=True)
+            dense_idx, dense_dist = dense_knn_point(nsample, xyz, new_xyz)
+            # the neighbor sets match, the order within a set is not specified
+            order, dense_order = idx.argsort(-1), dense_idx.argsort(-1)
+            torch.testing.assert_close(
+                idx.gather(-1, order), dense_idx.gather(-1, dense_order)
+            )
+            torch.testing.assert_close(
+                dist.gather(-1, order),
+                dense_dist.gather(-1, dense_order),
+                rtol=1e-4,
+                atol=1e-6,
+            )
+            torch.testing.assert_close(knn_point(nsample, xyz, new_xyz), idx)
+
+    def test_compute_chamfer(self):
+        dist1, dist2 = computeChamfer(
+            self.pc1.permute(0, 2, 1), self.pc2.permute(0, 2, 1)
+        )
+        sqrdist12 = square_distance(self.pc1, self.pc2)
+        torch.testing.assert_close(dist1, sqrdist12.min(2)[0], rtol=1e-4, atol=1e-6)
+        torch.testing.assert_close(dist2, sqrdist12.min(1)[0], rtol=1e-4, atol=1e-6)
+
+
+def run_by_name(test_name):
+    suite = unittest.TestSuite()
+    suite.addTest(Test_Pointconv_Util(test_name))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
+
+
+if __name__ == "__main__":
+    run_by_name("test_knn_point")
+    run_by_name("test_compute_chamfer")
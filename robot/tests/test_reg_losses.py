@@ -0,0 +1,228 @@
+import os, sys
+
+sys.path.insert(0, os.path.abspath("../.."))
+import numpy as np
+import torch
+import unittest
+import geomloss
+from scipy.stats import wasserstein_distance
+import robot.global_variable
+from robot.global_variable import Shape
+from robot.metrics.reg_losses import (
+    GMMLoss,
+    GeomDistance,
+    L2Distance,
+    SlicedWassersteinDistance,
+    get_geom_param,
+    parse_geom_obj,
+    set_geom_placeholders,
+    sliced_wasserstein,
+    validate_loss_precision,
+)
+from robot.utils.module_parameters import ParameterDict
+
+torch.manual_seed(0)
+
+
+def geom_distance(geom_obj, **settings):
+    opt = ParameterDict(printSettings=False)
+    opt["geom_obj"] = geom_obj
+    for key, value in settings.items():
+        opt[key] = value
+    return GeomDistance(opt)
+
+
+def sliced_wasserstein_loss(**settings):
+    opt = ParameterDict(printSettings=False)
+    for key, value in settings.items():
+        opt[key] = value
+    return SlicedWassersteinDistance(opt)
+
+
+def reference_sliced_wasserstein(x, y, weight_x, weight_y, projections):
+    """SW_1 from scipy, each 1d wasserstein distance is solved by scipy"""
+    proj_x, proj_y = (x @ projections).numpy(), (y @ projections).numpy()
+    return torch.tensor(
+        [
+            np.mean(
+                [
+                    wasserstein_distance(
+                        proj_x[b, :, i], proj_y[b, :, i], weight_x[b], weight_y[b]
+                    )
+                    for i in range(projections.shape[1])
+                ]
+            )
+            for b in range(x.shape[0])
+        ],
+        dtype=x.dtype,
+    )
+
+
+class Test_Reg_Losses(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_geom_cluster_cache(self):
+        loss = geom_distance(
+            "geomloss.SamplesLoss(loss='sinkhorn',blur=0.01, scaling=0.8, "
+            "debias=False, backend='multiscale')"
+        )
+        target = torch.rand(1, 1000, 3)
+        labels = loss.cluster(target, 0.1, cache=True)
+        self.assertIs(loss.cluster(target, 0.1, cache=True), labels)
+        target.mul_(0.5)
+        labels = loss.cluster(target, 0.1, cache=True)
+        torch.testing.assert_close(labels[0], loss.cluster(target, 0.1)[0])
+        # a new target of the same shape, the allocator is likely to reuse the address
+        del target
+        target = torch.rand(1, 1000, 3)
+        new_labels = loss.cluster(target, 0.1, cache=True)
+        self.assertIsNot(new_labels, labels)
+        torch.testing.assert_close(new_labels[0], loss.cluster(target, 0.1)[0])
+        self.assertFalse(torch.equal(new_labels[0], labels[0]))
+
+    def test_geom_multi_blur(self):
+        loss = geom_distance(
+            "geomloss.SamplesLoss(loss='sinkhorn',blur=0.01, scaling=0.8, "
+            "debias=False, backend='tensorized')"
+        )
+        flowed = Shape().set_data(points=torch.rand(2, 100, 3))
+        target = Shape().set_data(points=torch.rand(2, 80, 3) * 0.5 + 0.2)
+        blur_list = [0.01, 0.05, 0.1]
+        weight1, weight2 = flowed.weights[..., 0], target.weights[..., 0]
+        multi_blur_loss = loss.multi_blur(flowed, target, blur_list)
+        self.assertEqual(multi_blur_loss.shape, (2, 3))
+        for k, blur in enumerate(blur_list):
+            blur_loss = geomloss.SamplesLoss(
+                loss="sinkhorn",
+                blur=blur,
+                scaling=0.8,
+                debias=False,
+                backend="tensorized",
+            )(weight1, flowed.points, weight2, target.points)
+            # the batched levels share one eps-scaling schedule
+            torch.testing.assert_close(
+                multi_blur_loss[:, k], blur_loss, rtol=5e-3, atol=1e-6
+            )
+
+    def test_parse_geom_obj(self):
+        geom_obj = (
+            "geomloss.SamplesLoss(loss='sinkhorn',blur=blurplaceholder, scaling=0.8)"
+        )
+        with self.assertRaisesRegex(ValueError, "blur"):
+            parse_geom_obj(geom_obj)
+        obj_name, geom_param = parse_geom_obj(geom_obj, ["blur"])
+        self.assertEqual(obj_name, "geomloss.SamplesLoss")
+        self.assertEqual(geom_param, {"loss": "sinkhorn", "scaling": 0.8})
+
+    def test_set_geom_placeholders(self):
+        opt = ParameterDict(printSettings=False)
+        opt["geom_obj"] = (
+            "geomloss.SamplesLoss(loss='sinkhorn',blur=blurplaceholder, reach=5)"
+        )
+        set_geom_placeholders(opt, blur=0.1, reach=1.0)
+        # the reach given in geom_obj is kept
+        self.assertEqual(
+            get_geom_param(opt)[1], {"loss": "sinkhorn", "blur": 0.1, "reach": 5}
+        )
+        opt = ParameterDict(printSettings=False)
+        opt["geom_obj"] = "geomloss.SamplesLoss(loss='sinkhorn',blur=blurplaceholder)"
+        set_geom_placeholders(opt, blur=0.1, reach=1.0)
+        # the reach is not named, the ot stays balanced
+        self.assertEqual(get_geom_param(opt)[1], {"loss": "sinkhorn", "blur": 0.1})
+        opt = ParameterDict(printSettings=False)
+        opt["geom_obj"] = (
+            "geomloss.SamplesLoss(blur=blurplaceholder, reach=reachplaceholder)"
+        )
+        set_geom_placeholders(opt, blur=0.1, reach=None)
+        self.assertEqual(get_geom_param(opt)[1], {"blur": 0.1, "reach": None})
+
+    def test_validate_loss_precision(self):
+        # the l2 distance needs corresponding points
+        flowed = Shape().set_data(points=torch.rand(2, 500, 3))
+        target = Shape().set_data(points=torch.rand(2, 500, 3))
+        # keops has no low precision reduction on cpu, the gmm loss stays in float32
+        for loss_class, settings, low_precision in [
+            (L2Distance, {"attr": "points"}, True),
+            (GMMLoss, {"attr": "points", "sigma": 0.1}, False),
+        ]:
+            opt = ParameterDict(printSettings=False)
+            for key, value in settings.items():
+                opt[key] = value
+            ref_loss_fn = loss_class(opt)
+            loss_err, grad_err = validate_loss_precision(
+                ref_loss_fn, ref_loss_fn, flowed, target
+            )
+            self.assertEqual((loss_err, grad_err), (0.0, 0.0))
+            opt["precision"] = "bfloat16"
+            loss_err, grad_err = validate_loss_precision(
+                loss_class(opt), ref_loss_fn, flowed, target
+            )
+            if not low_precision:
+                self.assertEqual((loss_err, grad_err), (0.0, 0.0))
+                continue
+            self.assertGreater(loss_err, 0.0)
+            self.assertLess(loss_err, 2e-2)
+            self.assertLess(grad_err, 5e-2)
+
+    def test_sliced_wasserstein(self):
+        x, y = torch.rand(2, 60, 3).double(), torch.rand(2, 45, 3).double() + 0.2
+        weight_x, weight_y = torch.rand(2, 60) + 0.1, torch.rand(2, 45) + 0.1
+        weight_x, weight_y = weight_x.double(), weight_y.double()
+        flowed = Shape().set_data(points=x, weights=weight_x[..., None])
+        target = Shape().set_data(points=y, weights=weight_y[..., None])
+        for projection in ["random", "sobol"]:
+            # the projections are redrawn by a loss of the same seed
+            loss = sliced_wasserstein_loss(
+                num_projections=16, projection=projection, p=1, seed=3
+            )
+            projections = sliced_wasserstein_loss(
+                num_projections=16, projection=projection, p=1, seed=3
+            ).draw_projections(3)
+            # weighted point clouds of unequal size
+            torch.testing.assert_close(
+                loss(flowed, target),
+                reference_sliced_wasserstein(x, y, weight_x, weight_y, projections),
+            )
+        # uniform weights of the same size take the one to one fast path
+        x, y = x[:, :30], y[:, :30]
+        uniform = torch.ones(2, 30, dtype=torch.float64)
+        torch.testing.assert_close(
+            sliced_wasserstein(x, y, uniform, uniform, projections, p=1),
+            reference_sliced_wasserstein(x, y, uniform, uniform, projections),
+        )
+        # a duplicated target is the same measure but goes through the quantile path
+        y_twice, uniform_twice = torch.cat([y, y], 1), torch.cat([uniform, uniform], 1)
+        torch.testing.assert_close(
+            sliced_wasserstein(x, y, uniform, uniform, projections, p=2),
+            sliced_wasserstein(x, y_twice, uniform, uniform_twice, projections, p=2),
+        )
+
+    def test_sliced_wasserstein_sobol_seed(self):
+        flowed = Shape().set_data(points=torch.rand(2, 100, 3))
+        target = Shape().set_data(points=torch.rand(2, 80, 3))
+        losses = [
+            sliced_wasserstein_loss(num_projections=8, projection="sobol", seed=seed)
+            for seed in [1, 1, 2]
+        ]
+        first, second = [[loss(flowed, target) for loss in losses] for _ in range(2)]
+        # the same seed replays the same projections call after call
+        torch.testing.assert_close(first[0], first[1], rtol=0, atol=0)
+        torch.testing.assert_close(second[0], second[1], rtol=0, atol=0)
+        # the sequence advances between calls, a different seed scrambles differently
+        self.assertFalse(torch.equal(first[0], second[0]))
+        self.assertFalse(torch.equal(first[0], first[2]))
+
+
+def run_by_name(test_name):
+    suite = unittest.TestSuite()
+    suite.addTest(Test_Reg_Losses(test_name))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
+
+
+if __name__ == "__main__":
+    run_by_name("test_geom_cluster_cache")
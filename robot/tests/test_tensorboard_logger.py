@@ -0,0 +1,73 @@
+import os, sys
+
+sys.path.insert(0, os.path.abspath("../.."))
+import io
+import torch
+import unittest
+from contextlib import redirect_stdout
+from robot.utils.tensorboard_logger import DeviceLogBuffer
+
+
+class _Writer(object):
+    def __init__(self):
+        self.scalars = []
+
+    def add_scalar(self, tag, value, step):
+        self.scalars.append((tag, value, step))
+
+
+class Test_TensorBoard_Logger(unittest.TestCase):
+    def setUp(self):
+        self.writer = _Writer()
+
+    def tearDown(self):
+        pass
+
+    def test_log_buffer(self):
+        log_buffer = DeviceLogBuffer(flush_every=3, writer=self.writer)
+        local_iter = torch.Tensor([0])
+        output = io.StringIO()
+        with redirect_stdout(output):
+            for i in range(4):
+                log_buffer.print(
+                    "{} th step, loss is {}, {}",
+                    local_iter,
+                    torch.tensor([i, i + 2.0]).mean(),
+                    [torch.tensor(1.5), torch.tensor(2)],
+                    step=local_iter,
+                    print_step=2,
+                )
+                log_buffer.add_scalar("score/train", torch.tensor(float(i)), i)
+                # the logged values are snapshots
+                local_iter += 1
+                log_buffer.step()
+                if i == 1:
+                    self.assertEqual(output.getvalue(), "")
+            self.assertEqual(len(self.writer.scalars), 3)
+            log_buffer.flush()
+        self.assertEqual(
+            output.getvalue().splitlines(),
+            ["0.0 th step, loss is 1.0, [1.5, 2]", "2.0 th step, loss is 3.0, [1.5, 2]"],
+        )
+        self.assertEqual(
+            self.writer.scalars, [("score/train", float(i), i) for i in range(4)]
+        )
+
+    def test_log_buffer_unbuffered(self):
+        log_buffer = DeviceLogBuffer()
+        output = io.StringIO()
+        with redirect_stdout(output):
+            log_buffer.print("loss is {}", torch.tensor(0.5))
+            self.assertEqual(output.getvalue(), "loss is 0.5\n")
+
+
+def run_by_name(test_name):
+    suite = unittest.TestSuite()
+    suite.addTest(Test_TensorBoard_Logger(test_name))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
+
+
+if __name__ == "__main__":
+    run_by_name("test_log_buffer")
+    run_by_name("test_log_buffer_unbuffered")
@@ -0,0 +1,161 @@
+import os, sys
+
+sys.path.insert(0, os.path.abspath("../.."))
+import shutil
+import tempfile
+import torch
+import unittest
+import robot.global_variable
+from robot.pipeline.train_model import train_model
+from robot.utils.module_parameters import ParameterDict
+
+torch.manual_seed(0)
+
+# the weight moves by TRAIN_STEPS[epoch] in each epoch, the val score peaks in between
+TRAIN_STEPS = [0.5, 0.4, -0.6, 0.5, 0.45, -0.3, 0.2]
+
+
+class _StubModel(object):
+    """
+    a one weight network, each train epoch moves the weight by a fixed step,
+    the val score is -(w - 1)^2, so the best epoch is known in advance
+    """
+
+    def __init__(self):
+        self.network = torch.nn.Linear(1, 1, bias=False)
+        with torch.no_grad():
+            self.network.weight.zero_()
+        self.optimizer = torch.optim.SGD(self.network.parameters(), lr=1.0)
+        self.gpu_ids = None
+        self.cur_epoch = 0
+        self.loss = None
+
+    def get_model(self):
+        return self.network
+
+    def set_cur_epoch(self, epoch):
+        self.cur_epoch = epoch
+
+    def update_learning_rate(self):
+        pass
+
+    def update_scheduler(self, epoch):
+        pass
+
+    def set_train(self):
+        self.network.train()
+
+    def set_val(self):
+        self.network.eval()
+
+    def set_debug(self):
+        self.network.eval()
+
+    def set_input(self, data, device, phase=None):
+        return data
+
+    def optimize_parameters(self, input):
+        self.optimizer.zero_grad()
+        # one sgd step with lr 1 moves the weight by the step
+        loss = -TRAIN_STEPS[self.cur_epoch] * self.network.weight.sum()
+        loss.backward()
+        self.optimizer.step()
+        self.loss = loss.item()
+
+    def get_current_errors(self):
+        return self.loss
+
+    def get_evaluation(self, input):
+        return self.network.weight.detach().clone()
+
+    def analyze_res(self, res, cache_res=True):
+        score = -((res.item() - 1.0) ** 2)
+        return score, {"weight": [res.item()]}
+
+    def get_batch_names(self):
+        return ["stub"]
+
+    def save_visual_res(self, save_fig_on, input, res, phase):
+        pass
+
+    def update_loss(self, epoch, end_of_epoch):
+        pass
+
+    def do_some_clean(self):
+        pass
+
+    def save_res(self, phase, saving=True):
+        pass
+
+
+def build_stub_model(opt, device, gpus):
+    return _StubModel()
+
+
+class _StubWriter(object):
+    def add_scalar(self, tag, value, step):
+        pass
+
+    def close(self):
+        pass
+
+
+class Test_Train_Model(unittest.TestCase):
+    def setUp(self):
+        self.check_point_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.check_point_path)
+
+    def train(self, async_val):
+        check_point_path = os.path.join(self.check_point_path, str(async_val))
+        opt = ParameterDict(printSettings=False)
+        opt["epoch"] = len(TRAIN_STEPS) - 1
+        opt["max_batch_num_per_epoch"] = [1, 1, 0]
+        opt["val_period"] = 1
+        opt["check_best_model_period"] = 100
+        opt["warmming_up_epoch"] = 100
+        opt["async_checkpoint"] = False
+        opt["async_val"] = async_val
+        opt["optim"] = {}
+        opt["optim"]["lr"] = 1.0
+        opt["path"] = {}
+        opt["path"]["model_load_path"] = ""
+        opt["path"]["check_point_path"] = check_point_path
+        dataloaders = {"train": [{}], "val": [{}], "debug": []}
+        train_model(
+            opt,
+            _StubModel(),
+            dataloaders,
+            _StubWriter(),
+            torch.device("cpu"),
+            val_model_builder=build_stub_model,
+        )
+        return torch.load(os.path.join(check_point_path, "model_best.pth.tar"))
+
+    def test_async_val_best_model(self):
+        checkpoint = self.train(async_val=False)
+        async_checkpoint = self.train(async_val=True)
+        # the weights are 0.5, 0.9, 0.3, 0.8, 1.25, 0.95, 1.15 after each epoch
+        self.assertEqual(checkpoint["epoch"], 5)
+        self.assertAlmostEqual(checkpoint["best_score"], -(0.05 ** 2), places=6)
+        self.assertEqual(async_checkpoint["epoch"], checkpoint["epoch"])
+        self.assertEqual(async_checkpoint["best_score"], checkpoint["best_score"])
+        self.assertEqual(async_checkpoint["global_step"], checkpoint["global_step"])
+        torch.testing.assert_close(
+            async_checkpoint["state_dict"], checkpoint["state_dict"]
+        )
+        torch.testing.assert_close(
+            async_checkpoint["optimizer"], checkpoint["optimizer"]
+        )
+
+
+def run_by_name(test_name):
+    suite = unittest.TestSuite()
+    suite.addTest(Test_Train_Model(test_name))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
+
+
+if __name__ == "__main__":
+    run_by_name("test_async_val_best_model")
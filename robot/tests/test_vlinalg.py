@@ -0,0 +1,79 @@
+import os, sys
+
+sys.path.insert(0, os.path.abspath("../.."))
+import torch
+import unittest
+from torchvectorized.vlinalg import vSymEig3x3, vSymEig
+
+torch.manual_seed(123)
+
+
+class Test_VLinalg(unittest.TestCase):
+    def setUp(self):
+        N = 1000
+        x = torch.randn(N, 3, 3, dtype=torch.float64)
+        self.cov = x @ x.transpose(1, 2)
+        q, _ = torch.linalg.qr(torch.randn(N, 3, 3, dtype=torch.float64))
+        vals = torch.tensor([1.0, 1.0, 2.0], dtype=torch.float64).expand(N, 3)
+        self.degenerate_cov = q @ torch.diag_embed(vals) @ q.transpose(1, 2)
+
+    def tearDown(self):
+        pass
+
+    def check_decomposition(self, cov, vals, vecs, atol):
+        ref_vals = torch.linalg.eigvalsh(cov)
+        torch.testing.assert_close(vals, ref_vals, rtol=0, atol=atol)
+        rec = vecs @ torch.diag_embed(vals) @ vecs.transpose(1, 2)
+        torch.testing.assert_close(rec, cov, rtol=0, atol=atol)
+        eye = torch.eye(3, dtype=vecs.dtype).expand_as(vecs)
+        torch.testing.assert_close(vecs.transpose(1, 2) @ vecs, eye, rtol=0, atol=atol)
+
+    def test_sym_eig_3x3(self):
+        vals, vecs = vSymEig3x3(self.cov, eigenvectors=True)
+        self.check_decomposition(self.cov, vals, vecs, atol=1e-8)
+        desc_vals, _ = vSymEig3x3(self.cov, descending_eigenvals=True)
+        torch.testing.assert_close(desc_vals, vals.flip(-1))
+
+    def test_sym_eig_3x3_degenerate(self):
+        vals, vecs = vSymEig3x3(self.degenerate_cov, eigenvectors=True)
+        self.check_decomposition(self.degenerate_cov, vals, vecs, atol=1e-6)
+        identity = torch.eye(3, dtype=torch.float64).repeat(10, 1, 1) * 3
+        vals, vecs = vSymEig3x3(identity, eigenvectors=True)
+        self.check_decomposition(identity, vals, vecs, atol=1e-8)
+
+    def test_sym_eig_3x3_grad(self):
+        cov = self.cov[:10].clone().requires_grad_()
+        self.assertTrue(
+            torch.autograd.gradcheck(
+                lambda x: vSymEig3x3(0.5 * (x + x.transpose(1, 2)), eigenvectors=True),
+                (cov,),
+                atol=1e-4,
+            )
+        )
+        cov = self.degenerate_cov.clone().requires_grad_()
+        vals, vecs = vSymEig3x3(cov, eigenvectors=True)
+        grad = torch.autograd.grad(vals.sum() + vecs[..., 2].abs().sum(), cov)[0]
+        self.assertTrue(torch.isfinite(grad).all())
+
+    def test_vsymeig_volume(self):
+        cov = self.cov.float()
+        vals, vecs = vSymEig(
+            cov.view(1, -1, 9, 1, 1).permute(0, 2, 1, 3, 4),
+            eigenvectors=True,
+            flatten_output=True,
+        )
+        self.check_decomposition(cov, vals, vecs, atol=1e-3)
+
+
+def run_by_name(test_name):
+    suite = unittest.TestSuite()
+    suite.addTest(Test_VLinalg(test_name))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
+
+
+if __name__ == "__main__":
+    run_by_name("test_sym_eig_3x3")
+    run_by_name("test_sym_eig_3x3_degenerate")
+    run_by_name("test_sym_eig_3x3_grad")
+    run_by_name("test_vsymeig_volume")
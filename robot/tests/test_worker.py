@@ -0,0 +1,139 @@
+import os, sys
+
+sys.path.insert(0, os.path.abspath("../.."))
+import json
+import unittest
+import robot.global_variable
+from robot.pipeline.worker import RegistrationWorker, parse_request
+
+
+class _StubWorker(RegistrationWorker):
+    """
+    a worker without the task setting and the model, each registration takes
+    the next latency of a fixed list
+    """
+
+    def __init__(self, latencies):
+        self.tsk_opt = {"path": {"record_path": "/tmp/records"}}
+        self.latency_list = []
+        self.latencies = list(latencies)
+        self.registered = []
+
+    def register(self, pair_name, pair_info):
+        self.registered.append((pair_name, pair_info))
+        latency = self.latencies.pop(0)
+        self.latency_list.append(latency)
+        return latency
+
+
+class Test_Worker(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_parse_request(self):
+        source = {"name": "copd1_source", "data_path": "/data/copd1/source.vtk"}
+        target = {"name": "copd1_target", "data_path": "/data/copd1/target.vtk"}
+        # the plain format, the pair name is built from the file names if not given
+        self.assertEqual(
+            parse_request(" /data/copd1/source.vtk /data/copd1/target.vtk\n"),
+            (
+                "source_target",
+                {
+                    "source": {"name": "source", "data_path": "/data/copd1/source.vtk"},
+                    "target": {"name": "target", "data_path": "/data/copd1/target.vtk"},
+                },
+            ),
+        )
+        self.assertEqual(
+            parse_request("/data/copd1/source.vtk /data/copd1/target.vtk copd1")[0],
+            "copd1",
+        )
+        # the json format, the shape info is kept as it is
+        request = {"source": source, "target": target}
+        self.assertEqual(
+            parse_request(json.dumps(request)),
+            ("copd1_source_copd1_target", request),
+        )
+        request["pair_name"] = "copd1"
+        self.assertEqual(
+            parse_request(json.dumps(request)),
+            ("copd1", {"source": source, "target": target}),
+        )
+        # paths and shape infos can be mixed in the json format
+        self.assertEqual(
+            parse_request(
+                json.dumps({"source": "/data/copd1/source.vtk", "target": target})
+            ),
+            (
+                "source_copd1_target",
+                {
+                    "source": {"name": "source", "data_path": "/data/copd1/source.vtk"},
+                    "target": target,
+                },
+            ),
+        )
+        with self.assertRaises(ValueError):
+            parse_request("/data/copd1/source.vtk")
+        with self.assertRaises(ValueError):
+            parse_request("a.vtk b.vtk c d")
+        with self.assertRaises(KeyError):
+            parse_request(json.dumps({"source": source}))
+
+    def test_handle(self):
+        worker = _StubWorker([0.5, 1.5])
+        response = worker.handle("/data/source.vtk /data/target.vtk\n")
+        self.assertEqual(
+            response,
+            {
+                "pair_name": "source_target",
+                "status": "done",
+                "latency": 0.5,
+                "mean_latency": 0.5,
+                "record_path": "/tmp/records",
+            },
+        )
+        response = worker.handle(
+            json.dumps(
+                {"source": "/data/a.vtk", "target": "/data/b.vtk", "pair_name": "ab"}
+            )
+        )
+        self.assertEqual(response["pair_name"], "ab")
+        self.assertEqual(response["latency"], 1.5)
+        self.assertEqual(response["mean_latency"], 1.0)
+        self.assertEqual(
+            [name for name, _ in worker.registered], ["source_target", "ab"]
+        )
+
+    def test_handle_malformed(self):
+        worker = _StubWorker([])
+        # a malformed line is answered by an error response, nothing is registered
+        for line in ["/data/source.vtk", "{not json", json.dumps({"target": "b.vtk"})]:
+            response = worker.handle(line)
+            self.assertEqual(response["pair_name"], None)
+            self.assertEqual(response["status"], "error")
+            self.assertTrue(response["error"])
+        self.assertEqual(worker.registered, [])
+        self.assertEqual(worker.latency_list, [])
+        # a failed registration keeps the pair name
+        response = worker.handle("/data/source.vtk /data/target.vtk")
+        self.assertEqual(response["pair_name"], "source_target")
+        self.assertEqual(response["status"], "error")
+        # the worker keeps serving after an error
+        worker.latencies.append(0.25)
+        self.assertEqual(worker.handle("a.vtk b.vtk")["status"], "done")
+
+
+def run_by_name(test_name):
+    suite = unittest.TestSuite()
+    suite.addTest(Test_Worker(test_name))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
+
+
+if __name__ == "__main__":
+    run_by_name("test_parse_request")
+    run_by_name("test_handle")
+    run_by_name("test_handle_malformed")
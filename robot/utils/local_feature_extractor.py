@@ -9,7 +9,7 @@ from robot.utils.visualizer import (
     visualize_point_fea_with_arrow,
     visualize_point_overlap,
 )
-from torchvectorized.vlinalg import vSymEig
+from torchvectorized.vlinalg import vSymEig3x3
 
 # import pykeops
 # pykeops.clean_pykeops()
@@ -102,11 +102,9 @@ def compute_local_fea_from_moments(fea_type, weights, mass, dev, cov):
                 cov, eigenvectors=compute_eigen_vector, flatten_output=True
             )
         elif D == 3:
-            cov = cov.view(B, N, -1, 1, 1).permute(0, 2, 1, 3, 4)
-            vals, vectors = vSymEig(
-                cov,
+            vals, vectors = vSymEig3x3(
+                cov.view(B * N, D, D),
                 eigenvectors=compute_eigen_vector,
-                flatten_output=True,
                 descending_eigenvals=True,
             )
         else:
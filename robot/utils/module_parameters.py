@@ -124,6 +124,15 @@ class ParameterDict(object):
         """
         return self.printSettings
 
+    def freeze(self):
+        """
+        Returns a read-only view of the parameters for hot loops, see FrozenParameterDict.
+        Defaults and comments are still recorded in this ParameterDict on the first access of every key.
+
+        :return: FrozenParameterDict
+        """
+        return FrozenParameterDict(self)
+
     def _set_value_of_instance(self, ext, int, com, currentCategoryName):
         self.ext = ext
         self.int = int
@@ -321,6 +330,61 @@ class ParameterDict(object):
             #    raise ValueError('Cannot create key = ' + str(key) + ' without a default value')
 
 
+class FrozenParameterDict(object):
+    """
+    Read-only view of a ParameterDict.
+
+    The first access of a key (or (key, default, comment) tuple) goes through the ParameterDict, so defaults and
+    comments are written back once and can still be saved via write_JSON/write_JSON_comments; the resolved value
+    is then cached and later accesses are plain dictionary lookups. Categories are returned as frozen views.
+    Changes made to the underlying ParameterDict after a key has been resolved are not seen by the view.
+    """
+
+    def __init__(self, par):
+        self.par = par
+        self.values = {}
+
+    def __str__(self):
+        return self.par.__str__()
+
+    @property
+    def ext(self):
+        return self.par.ext
+
+    def __getitem__(self, key_or_keyTuple):
+        key = key_or_keyTuple[0] if type(key_or_keyTuple) == tuple else key_or_keyTuple
+        try:
+            return self.values[key]
+        except KeyError:
+            pass
+        value = self.par[key_or_keyTuple]
+        if type(value) == ParameterDict:
+            value = value.freeze()
+        self.values[key] = value
+        return value
+
+    def __setitem__(self, key, valueTuple):
+        raise TypeError("FrozenParameterDict is read-only, cannot set key = " + str(key))
+
+    def __contains__(self, key):
+        return key in self.values or key in self.par.ext
+
+    def unfreeze(self):
+        """
+        :return: the underlying ParameterDict
+        """
+        return self.par
+
+    def write_JSON(self, fileName, save_int=True):
+        self.par.write_JSON(fileName, save_int)
+
+    def write_JSON_comments(self, fileNameComments):
+        self.par.write_JSON_comments(fileNameComments)
+
+    def write_JSON_and_JSON_comments(self, fileNames):
+        self.par.write_JSON_and_JSON_comments(fileNames)
+
+
 # test it
 def test_parameter_dict():
     """
@@ -1,5 +1,7 @@
 import os
+import shutil
 import torch
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 
 
@@ -75,15 +77,114 @@ def save_checkpoint(state, is_best, path, prefix, filename="checkpoint.pth.tar")
     :param path: path to save the checkpoint
     :param prefix: prefix to add before the fname
     :param filename: filename
-    :return:
+    :return: the path of the saved checkpoint
     """
     if not os.path.exists(path):
-        os.mkdir(path)
+        os.makedirs(path, exist_ok=True)
     prefix_save = os.path.join(path, prefix)
     name = "_".join([prefix_save, filename])
-    torch.save(state, name)
+    atomic_save(state, name)
     if is_best:
-        torch.save(state, path + "/model_best.pth.tar")
+        atomic_copy(name, os.path.join(path, "model_best.pth.tar"))
+    return name
+
+
+def atomic_save(state, file_path):
+    """
+    torch.save into a temporary file then rename it, a crash during the write never leaves
+    a truncated checkpoint behind
+    """
+    tmp_path = file_path + ".tmp"
+    torch.save(state, tmp_path)
+    os.replace(tmp_path, file_path)
+
+
+def atomic_copy(src_path, file_path):
+    tmp_path = file_path + ".tmp"
+    shutil.copyfile(src_path, tmp_path)
+    os.replace(tmp_path, file_path)
+
+
+def snapshot_state(state):
+    """
+    copy a (nested) checkpoint state into cpu memory, so that it can be written while the
+    training goes on and updates the parameters in place
+    """
+    if isinstance(state, torch.Tensor):
+        return state.detach().to("cpu", copy=True)
+    if isinstance(state, dict):
+        return state.__class__(
+            (key, snapshot_state(value)) for key, value in state.items()
+        )
+    if isinstance(state, (list, tuple)):
+        return state.__class__(snapshot_state(value) for value in state)
+    return deepcopy(state)
+
+
+class CheckpointSaver(object):
+    """
+    save the checkpoints in a background thread
+
+    the state is snapshotted into cpu memory on the calling thread, the file is written by a
+    single worker thread (so the writes keep their order) through a temporary file and an
+    atomic rename, the write error, if any, is raised on the next call
+
+    :param asynchronous: write in the background, otherwise behave like save_checkpoint
+    :param max_to_keep: number of the latest checkpoints to keep, -1 keeps all of them,
+        model_best.pth.tar is never removed
+    """
+
+    def __init__(self, asynchronous=True, max_to_keep=-1):
+        self.asynchronous = asynchronous
+        self.max_to_keep = max_to_keep
+        self.executor = ThreadPoolExecutor(max_workers=1) if asynchronous else None
+        self.pending = []
+        self.saved = []
+
+    def _write(self, state, is_best, path, prefix, filename):
+        name = save_checkpoint(state, is_best, path, prefix, filename)
+        if name in self.saved:
+            self.saved.remove(name)
+        self.saved.append(name)
+        if self.max_to_keep > 0:
+            while len(self.saved) > self.max_to_keep:
+                old_name = self.saved.pop(0)
+                if os.path.isfile(old_name):
+                    os.remove(old_name)
+        return name
+
+    def _check_pending(self, wait=False):
+        pending = []
+        for future in self.pending:
+            if wait or future.done():
+                future.result()
+            else:
+                pending.append(future)
+        self.pending = pending
+
+    def save(self, state, is_best, path, prefix, filename="checkpoint.pth.tar"):
+        """
+        same arguments as save_checkpoint
+        """
+        if not self.asynchronous:
+            self._write(state, is_best, path, prefix, filename)
+            return
+        self._check_pending()
+        state = snapshot_state(state)
+        self.pending.append(
+            self.executor.submit(self._write, state, is_best, path, prefix, filename)
+        )
+
+    def wait(self):
+        """
+        block until every submitted checkpoint is written
+        """
+        self._check_pending(wait=True)
+
+    def close(self):
+        self.wait()
+        if self.executor is not None:
+            self.executor.shutdown()
 
 
 def print_model(net):
@@ -1,6 +1,8 @@
 import os
+import ast
+import copy
 import importlib
-from functools import partial
+from functools import partial, lru_cache
 
 KNOWN_MODULES = {
     # Torch
@@ -52,11 +54,100 @@ def extract_args(*args, **kwargs):
     return args, kwargs
 
 
+def parse_args_exp(args_exp):
+    """Parses an argument expression such as "(1, 'a', b=[0.1, 0.2])" without calling eval.
+
+    Only python literals (numbers, strings, bools, None, tuples, lists, dicts and sets) are accepted.
+
+    Args:
+        args_exp (str): The argument expression, including the enclosing parentheses
+
+    Returns:
+        tuple, dict: The positional and keyword arguments
+
+    Raises:
+        ValueError: If the expression is not a call with literal arguments
+    """
+    try:
+        call = ast.parse("extract_args" + args_exp, mode="eval").body
+    except SyntaxError as e:
+        raise ValueError("invalid argument expression {}".format(args_exp)) from e
+    if not isinstance(call, ast.Call):
+        raise ValueError("invalid argument expression {}".format(args_exp))
+    if any(isinstance(arg, ast.Starred) for arg in call.args) or any(
+        kw.arg is None for kw in call.keywords
+    ):
+        raise ValueError("unpacking is not supported in {}".format(args_exp))
+    args = tuple(ast.literal_eval(arg) for arg in call.args)
+    kwargs = {kw.arg: ast.literal_eval(kw.value) for kw in call.keywords}
+    return args, kwargs
+
+
+def _parse_obj_exp(obj_exp, safe):
+    args, kwargs = (), {}
+    if "(" in obj_exp and ")" in obj_exp:
+        args_exp = obj_exp[obj_exp.find("(") :]
+        try:
+            args, kwargs = parse_args_exp(args_exp)
+        except ValueError:
+            if safe:
+                raise
+            args, kwargs = eval("extract_args" + args_exp)
+        obj_exp = obj_exp[: obj_exp.find("(")]
+    return obj_exp, args, kwargs
+
+
+@lru_cache(maxsize=None)
+def compile_obj_exp(obj_exp, safe=False):
+    """Parses an object string expression and resolves its callable, the result is cached per expression.
+
+    Args:
+        obj_exp (str): The object string expression, e.g. "keops_kernels.LazyKeopsKernel('gauss',sigma=0.1)"
+        safe (bool): If True, the arguments must be python literals, otherwise non-literal arguments
+            fall back to eval
+
+    Returns:
+        callable, tuple, dict: The resolved callable with the positional and keyword arguments of the expression,
+            the arguments are shared between calls and must not be modified, see bind_obj_exp
+    """
+    obj_exp, args, kwargs = _parse_obj_exp(obj_exp, safe)
+
+    # From here we can assume that dots in the remaining of the expression
+    # only separate between modules_reg and classes
+    module_name, class_name = os.path.splitext(obj_exp)
+    class_name = class_name[1:]
+    module = importlib.import_module(
+        KNOWN_MODULES[module_name] if module_name in KNOWN_MODULES else module_name
+    )
+    module_class = getattr(module, class_name)
+    return module_class, args, kwargs
+
+
+def _copy_arg(arg):
+    return copy.deepcopy(arg) if isinstance(arg, (list, dict, set)) else arg
+
+
+def bind_obj_exp(obj_exp, *args, **kwargs):
+    """Resolves a (cached) object string expression and binds the additional provided arguments.
+
+    Only the arguments coming from the expression are copied (when mutable), so the cache is never modified by
+    the created objects. As in obj_factory, the keyword arguments of the expression take precedence.
+
+    Returns:
+        callable, tuple, dict: The callable and the arguments to call it with
+    """
+    module_class, obj_args, obj_kwargs = compile_obj_exp(obj_exp)
+    args = tuple(_copy_arg(arg) for arg in obj_args) + args
+    kwargs.update({key: _copy_arg(value) for key, value in obj_kwargs.items()})
+    return module_class, args, kwargs
+
+
 def obj_factory(obj_exp, *args, **kwargs):
     """Creates objects from strings or partial objects with additional provided arguments.
 
     In case a sequence is provided, all objects in the sequence will be created recursively.
     Objects that are not strings or partials be returned as they are.
+    The parsed string expressions and their resolved callables are cached, see compile_obj_exp.
 
     Args:
         obj_exp (str or partial): The object string expresion or partial to be converted into an object. Can also be
@@ -74,25 +165,7 @@ def obj_factory(obj_exp, *args, **kwargs):
     if not isinstance(obj_exp, str):
         return obj_exp
 
-    # Handle arguments
-    if "(" in obj_exp and ")" in obj_exp:
-        args_exp = obj_exp[obj_exp.find("(") :]
-        obj_args, obj_kwargs = eval("extract_args" + args_exp)
-
-        # Concatenate arguments
-        args = obj_args + args
-        kwargs.update(obj_kwargs)
-
-        obj_exp = obj_exp[: obj_exp.find("(")]
-
-    # From here we can assume that dots in the remaining of the expression
-    # only separate between modules_reg and classes
-    module_name, class_name = os.path.splitext(obj_exp)
-    class_name = class_name[1:]
-    module = importlib.import_module(
-        KNOWN_MODULES[module_name] if module_name in KNOWN_MODULES else module_name
-    )
-    module_class = getattr(module, class_name)
+    module_class, args, kwargs = bind_obj_exp(obj_exp, *args, **kwargs)
     class_instance = module_class(*args, **kwargs)
 
     return class_instance
@@ -103,6 +176,7 @@ def partial_obj_factory(obj_exp, *args, **kwargs):
 
     In case a sequence is provided, all objects in the sequence will be created recursively.
     Objects that are not strings or partials be returned as they are.
+    The parsed string expressions and their resolved callables are cached, see compile_obj_exp.
 
     Args:
         obj_exp (str or partial): The object string expresion or partial to be converted into an object. Can also be
@@ -122,25 +196,7 @@ def partial_obj_factory(obj_exp, *args, **kwargs):
     if not isinstance(obj_exp, str):
         return partial(obj_exp)
 
-    # Handle arguments
-    if "(" in obj_exp and ")" in obj_exp:
-        args_exp = obj_exp[obj_exp.find("(") :]
-        obj_args, obj_kwargs = eval("extract_args" + args_exp)
-
-        # Concatenate arguments
-        args = obj_args + args
-        kwargs.update(obj_kwargs)
-
-        obj_exp = obj_exp[: obj_exp.find("(")]
-
-    # From here we can assume that dots in the remaining of the expression
-    # only separate between modules_reg and classes
-    module_name, class_name = os.path.splitext(obj_exp)
-    class_name = class_name[1:]
-    module = importlib.import_module(
-        KNOWN_MODULES[module_name] if module_name in KNOWN_MODULES else module_name
-    )
-    module_class = getattr(module, class_name)
+    module_class, args, kwargs = bind_obj_exp(obj_exp, *args, **kwargs)
 
     return partial(module_class, *args, **kwargs)
 
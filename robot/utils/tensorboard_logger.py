@@ -1,5 +1,11 @@
-# from torch.utils.tensorboard import SummaryWriter
-from tensorboardX import SummaryWriter
+import threading
+
+import torch
+
+try:
+    from tensorboardX import SummaryWriter
+except ImportError:
+    from torch.utils.tensorboard import SummaryWriter
 
 
 class AverageMeter(object):
@@ -115,3 +121,119 @@ class TensorBoardLogger(SummaryWriter):
             desc += "] "
 
         return desc
+
+
+class DeviceLogBuffer(object):
+    """Buffers the logged values as detached tensors on their device.
+
+    A .item() per step would synchronize the device at every step, the buffered tensors
+    are instead moved to the host in one transfer every flush_every steps, then the
+    messages are printed and the scalars are written in the order they were logged.
+    With flush_every=1, every entry is written right away.
+
+    Args:
+        flush_every (int): Number of steps between two flushes
+        writer (SummaryWriter, optional): The writer of the logged scalars
+    """
+
+    def __init__(self, flush_every=1, writer=None):
+        self.flush_every = flush_every
+        self.writer = writer
+        self.entries = []
+        self.n_step = 0
+        # the DataParallel replicas log from their own threads
+        self.lock = threading.Lock()
+
+    def configure(self, flush_every=1, writer=None):
+        """Flushes the pending entries then sets the flush period and the writer."""
+        self.flush()
+        self.flush_every = flush_every
+        self.writer = writer
+        self.n_step = 0
+
+    @staticmethod
+    def _detach(value):
+        if isinstance(value, torch.Tensor):
+            return value.detach().clone()
+        if isinstance(value, (list, tuple)):
+            return type(value)(DeviceLogBuffer._detach(v) for v in value)
+        return value
+
+    def _add(self, entry):
+        entry = self._detach(entry)
+        with self.lock:
+            self.entries.append(entry)
+        if self.flush_every <= 1:
+            self.flush()
+
+    def print(self, message, *args, step=None, print_step=1):
+        """Queues message.format(*args).
+
+        Args:
+            message (str): The message to format
+            *args: The values to format, tensors (or lists of tensors) are formatted
+                as numbers
+            step (int or torch.Tensor, optional): The message is only printed if
+                step % print_step == 0
+            print_step (int): Print period of the message
+        """
+        self._add(("print", message, args, step, print_step))
+
+    def add_scalar(self, tag, value, global_step):
+        """Queues a scalar, written by the writer with the given tag and global step."""
+        self._add(("scalar", tag, (value,), global_step, 1))
+
+    def step(self):
+        """Counts one step, flushes every flush_every steps."""
+        self.n_step += 1
+        if self.n_step % self.flush_every == 0:
+            self.flush()
+
+    def flush(self):
+        """Moves the pending values to the host, prints and writes the entries."""
+        with self.lock:
+            entries, self.entries = self.entries, []
+        if not entries:
+            return
+        tensors = {}
+
+        def collect(value):
+            if isinstance(value, torch.Tensor):
+                tensors.setdefault(value.device, []).append(value)
+            elif isinstance(value, (list, tuple)):
+                for v in value:
+                    collect(v)
+
+        for _, _, args, step, _ in entries:
+            collect(args)
+            collect(step)
+        host = {}
+        for device_tensors in tensors.values():
+            # one transfer per device
+            flat = torch.cat([t.double().reshape(-1) for t in device_tensors]).tolist()
+            offset = 0
+            for t in device_tensors:
+                values = flat[offset : offset + t.numel()]
+                offset += t.numel()
+                if not t.is_floating_point():
+                    values = [int(v) for v in values]
+                host[id(t)] = values[0] if t.numel() == 1 else values
+
+        def to_host(value):
+            if isinstance(value, torch.Tensor):
+                return host[id(value)]
+            if isinstance(value, (list, tuple)):
+                return type(value)(to_host(v) for v in value)
+            return value
+
+        for kind, name, args, step, print_step in entries:
+            args, step = to_host(args), to_host(step)
+            if kind == "print":
+                if step is None or step % print_step == 0:
+                    print(name.format(*args))
+            elif self.writer is not None:
+                self.writer.add_scalar(name, args[0], step)
+
+
+log_buffer = DeviceLogBuffer()
+"""shared buffer of the training logs, set up by train_model"""
@@ -11,12 +11,6 @@ from tqdm import tqdm
 import torch.backends.cudnn as cudnn
 import torch.nn.init as init
 import numpy as np
-from pykeops.numpy.cluster import (
-    grid_cluster,
-    cluster_ranges_centroids,
-    sort_clusters,
-    from_matrix,
-)
 
 
 def init_weights(m, init_type="normal", gain=0.02):
@@ -188,6 +182,35 @@ def to_tensor(data, device):
         return torch.from_numpy(data).to(device)
 
 
+PRECISION_DTYPE = {
+    "float32": torch.float32,
+    "float16": torch.float16,
+    "bfloat16": torch.bfloat16,
+}
+
+
+def get_compute_dtype(precision, device, backend="torch"):
+    """
+    get the dtype a kernel reduction runs in,
+    keops supports float16 on gpu only and has no bfloat16, torch has no fast float16 on cpu,
+    so the unsupported requests fall back to bfloat16 (torch) or float32 (keops)
+
+    :param precision: str, float32/float16/bfloat16
+    :param device: torch.device of the input
+    :param backend: str, torch/keops
+    :return: torch.dtype
+    """
+    dtype = PRECISION_DTYPE[precision]
+    if dtype == torch.float32:
+        return dtype
+    on_gpu = torch.device(device).type == "cuda"
+    if backend == "keops":
+        return torch.float16 if on_gpu else torch.float32
+    if not on_gpu and dtype == torch.float16:
+        return torch.bfloat16
+    return dtype
+
+
 # Adapted from: https://github.com/Sudy/coling2018/blob/master/torchtext/utils.py
 def download_from_url(url, output_path):
     """Download file from url including Google Drive.
@@ -415,64 +438,117 @@ def enlarge_by_factor(param, factor):
     return param
 
 
-def memory_sort(points, eps=0.0):
+def _quantize_points(points, eps, nbits):
     """
-    sort neighboring points close to each other in memory
-    :param points: BxNxD or NxD  tenosr /array
-    :return:
+    quantize BxNxD points into integer cells of size eps, shifted to start from 0 in each batch
+    if eps<=0, the bounding box of each batch is split into 2^nbits cells along each axis
     """
+    if eps <= 0:
+        low = points.min(1, keepdim=True)[0]
+        high = points.max(1, keepdim=True)[0]
+        eps = ((high - low).max(2, keepdim=True)[0] / (2 ** nbits - 1)).clamp(min=1e-12)
+        return torch.floor((points - low) / eps).long()
+    cells = torch.floor(points / eps).long()
+    return cells - cells.min(1, keepdim=True)[0]
+
+
+def _morton_code(cells, nbits):
+    """
+    interleave the bits of BxNxD integer cells into a BxN Z-order (Morton) code
+    """
+    D = cells.shape[-1]
+    code = torch.zeros_like(cells[..., 0])
+    for bit in range(nbits):
+        for d in range(D):
+            code |= ((cells[..., d] >> bit) & 1) << (bit * D + d)
+    return code
+
+
+def memory_sort_index(points, eps=0.0, mode="grid"):
+    """
+    cluster points into cubic cells of size eps and order the clusters so that neighboring points are close in memory
+    torch implementation that works on batched tensors on any device
+
+    :param points: BxNxD tensor, D<=3
+    :param eps: cell size, if eps<=0, the bounding box is split into 2^(63//D) (morton) or 2^10 (grid) cells per axis
+    :param mode: "grid" orders the cells lexicographically (as pykeops grid_cluster),
+        "morton" orders the cells along a Z-order curve
+    :return: perm (BxN, the sorted points are points[b, perm[b]]), labels (BxN, cluster label of each unsorted point,
+        compact in [0, C_b)), ranges (list of B C_bx2 int32 tensors, [start, end) of each cluster in the sorted points,
+        in the format of KeOps block-sparse reductions)
+    """
+    B, N, D = points.shape
+    if D > 3:
+        raise NotImplementedError("memory sort only supports points of dimension <= 3")
+    if mode == "morton":
+        nbits = 63 // D
+        cells = _quantize_points(points, eps, nbits).clamp(max=2 ** nbits - 1)
+        key = _morton_code(cells, nbits)
+    elif mode == "grid":
+        cells = _quantize_points(points, eps, 10)
+        dims = cells.max(1)[0].max(0)[0] + 1
+        key = torch.zeros_like(cells[..., 0])
+        for d in range(D):
+            key = key * dims[d] + cells[..., d]
+    else:
+        raise ValueError("unknown memory sort mode {}".format(mode))
 
-    def _sort(points, eps):
-        x_labels = grid_cluster(points, eps)
-        # Compute the memory footprint and centroid of each of those non-empty "cubic" clusters:
-        points, x_labels_sorted = sort_clusters(points, x_labels)
-        return points, x_labels
+    # sort within each batch, the batch index is the slowest varying key
+    key_sorted, perm = torch.sort(key, dim=1, stable=True)
+    is_new_cluster = torch.ones_like(key_sorted, dtype=torch.bool)
+    is_new_cluster[:, 1:] = key_sorted[:, 1:] != key_sorted[:, :-1]
+    labels_sorted = torch.cumsum(is_new_cluster.long(), 1) - 1
+    labels = torch.empty_like(labels_sorted).scatter_(1, perm, labels_sorted)
 
+    ranges = []
+    for b in range(B):
+        start = torch.nonzero(is_new_cluster[b]).view(-1)
+        end = torch.cat([start[1:], start.new_tensor([N])])
+        ranges.append(torch.stack([start, end], 1).int())
+    return perm, labels, ranges
+
+
+def memory_sort(points, eps=0.0, mode="grid", return_ranges=False):
+    """
+    sort neighboring points close to each other in memory
+    :param points: BxNxD or NxD  tenosr /array
+    :param eps: size of the cubic clusters, see memory_sort_index
+    :param mode: "grid" or "morton", see memory_sort_index
+    :param return_ranges: if True, also return the [start, end) ranges of the sorted clusters (for KeOps block-sparse
+        reductions), a list over the batch if points is batched
+    :return: sorted points, cluster labels of the unsorted points (to be used in memory_sort_helper)
+    """
     is_tensor = isinstance(points, torch.Tensor)
     has_batch = len(points.shape) == 3
+    points_t = points if is_tensor else torch.from_numpy(points)
+    if not has_batch:
+        points_t = points_t[None]
+    perm, labels, ranges = memory_sort_index(points_t.detach(), eps, mode)
+    points_t = torch.gather(
+        points_t, 1, perm[..., None].expand(-1, -1, points_t.shape[-1])
+    )
+    if not has_batch:
+        points_t, labels, ranges = points_t[0], labels[0], ranges[0]
     if is_tensor:
-        points_np = points.detach().cpu().numpy()
-    else:
-        points_np = points
-    if has_batch:
-        points_np_list = []
-        ind_np_list = []
-        for _points_np in points_np:
-            _points_np, _ind = _sort(_points_np, eps)
-            points_np_list.append(_points_np)
-            ind_np_list.append(_ind)
-        points_np = np.stack(points_np_list, 0)
-        ind_np = np.stack(ind_np_list, 0)
-    else:
-        points_np, ind_np = _sort(points_np, eps)
-    if is_tensor:
-        points = torch.tensor(points_np).to(points.device)
-        ind = torch.tensor(ind_np).to(points.device)
-        return points, ind
+        output = (points_t, labels)
     else:
-        return points_np, ind_np
+        output = (points_t.numpy(), labels.numpy())
+    return output + (ranges,) if return_ranges else output
 
 
 def memory_sort_helper(x, x_labels):
+    """
+    sort x (BxNx... or Nx... tensor / array) with the cluster labels returned by memory_sort
+    """
     is_tensor = isinstance(x, torch.Tensor)
     has_batch = len(x.shape) == 3
-    if is_tensor:
-        x_np = x.detach().cpu().numpy()
-    else:
-        x_np = x
-    if has_batch:
-        x_np_list = []
-        for _x in x_np:
-            _x, _ = sort_clusters(_x, x_labels)
-            x_np_list.append(_x)
-        x_np = np.concatenate(x_np_list, 0)
-    else:
-        x_np, _ = sort_clusters(x_np, x_labels)
-    if is_tensor:
-        x = torch.tensor(x_np).to(x.device)
-        return x
-    else:
-        return x_np
+    x_t = x if is_tensor else torch.from_numpy(x)
+    x_labels = torch.as_tensor(x_labels).to(x_t.device)
+    perm = torch.sort(x_labels, dim=-1, stable=True)[1]
+    if has_batch and perm.dim() == 1:
+        perm = perm[None].expand(x_t.shape[0], -1)
+    x_t = x_t[torch.arange(x_t.shape[0])[:, None], perm] if has_batch else x_t[perm]
+    return x_t if is_tensor else x_t.numpy()
 
 
 def add_zero_last_dim(points):
@@ -68,10 +68,203 @@ def _compute_eigenvectors(input: torch.Tensor, eigenvalues: torch.Tensor):
     return torch.cat([u0.unsqueeze(1), u1.unsqueeze(1), u2.unsqueeze(1)], dim=1)
 
 
+def _sym3x3_eigenvalues(a11, a12, a13, a22, a23, a33):
+    # trigonometric solution of the characteristic polynomial, ascending order
+    q = (a11 + a22 + a33) / 3.0
+    b11, b22, b33 = a11 - q, a22 - q, a33 - q
+    p2 = (b11 ** 2 + b22 ** 2 + b33 ** 2 + 2.0 * (a12 ** 2 + a13 ** 2 + a23 ** 2)) / 6.0
+    p = torch.sqrt(p2)
+    # for p == 0 the matrix is a multiple of identity and any phi is valid
+    safe_p = torch.where(p > 0, p, torch.ones_like(p))
+    half_det = (b11 * (b22 * b33 - a23 * a23) - a12 * (a12 * b33 - a13 * a23)
+                + a13 * (a12 * a23 - a13 * b22)) / (2.0 * safe_p ** 3)
+    phi = torch.acos(half_det.clamp(-1.0, 1.0)) / 3.0
+    eval2 = q + 2.0 * p * torch.cos(phi)
+    eval0 = q + 2.0 * p * torch.cos(phi + pi * (2.0 / 3.0))
+    eval1 = 3.0 * q - eval0 - eval2
+    return torch.stack([eval0, eval1, eval2], -1), half_det
+
+
+def _cross(u, v):
+    return (u[1] * v[2] - u[2] * v[1], u[2] * v[0] - u[0] * v[2], u[0] * v[1] - u[1] * v[0])
+
+
+def _dot(u, v):
+    return u[0] * v[0] + u[1] * v[1] + u[2] * v[2]
+
+
+def _select(cond, u, v):
+    return tuple(torch.where(cond, _u, _v) for _u, _v in zip(u, v))
+
+
+def _normalize(u, fallback):
+    # vectors with a norm below EPSILON are replaced by the fallback
+    norm = torch.sqrt(_dot(u, u))
+    degenerate = norm <= EPSILON
+    safe_norm = torch.where(degenerate, torch.ones_like(norm), norm)
+    return _select(degenerate, fallback, tuple(_u / safe_norm for _u in u))
+
+
+def _sym3x3_isolated_eigenvector(a, eigenvalue):
+    # the eigenvector of an isolated eigenvalue is the largest cross product of the rows of (A - lambda I)
+    a11, a12, a13, a22, a23, a33 = a
+    r0 = (a11 - eigenvalue, a12, a13)
+    r1 = (a12, a22 - eigenvalue, a23)
+    r2 = (a13, a23, a33 - eigenvalue)
+    c01, c02, c12 = _cross(r0, r1), _cross(r0, r2), _cross(r1, r2)
+    n01, n02, n12 = _dot(c01, c01), _dot(c02, c02), _dot(c12, c12)
+    best = _select(n01 >= n02, c01, c02)
+    best = _select(torch.max(n01, n02) >= n12, best, c12)
+    # A is (nearly) a multiple of identity, any direction is an eigenvector
+    zeros = torch.zeros_like(a11)
+    return _normalize(best, (torch.ones_like(a11), zeros, zeros))
+
+
+def _sym3x3_orthogonal_complement(w):
+    # orthonormal U, V spanning the plane perpendicular to the unit vector w
+    zeros = torch.zeros_like(w[0])
+    use_w0 = w[0].abs() > w[1].abs()
+    u = _select(use_w0, (-w[2], zeros, w[0]), (zeros, w[2], -w[1]))
+    u = _normalize(u, (zeros, zeros, torch.ones_like(zeros)))
+    return u, _cross(w, u)
+
+
+def _sym3x3_eigenvector_in_plane(a, w, eigenvalue):
+    # restrict (A - lambda I) to the plane perpendicular to w and take its null direction,
+    # this stays well defined when the two remaining eigenvalues are (nearly) equal
+    a11, a12, a13, a22, a23, a33 = a
+    u, v = _sym3x3_orthogonal_complement(w)
+
+    def matvec(x):
+        return (
+            a11 * x[0] + a12 * x[1] + a13 * x[2],
+            a12 * x[0] + a22 * x[1] + a23 * x[2],
+            a13 * x[0] + a23 * x[1] + a33 * x[2],
+        )
+
+    av = matvec(v)
+    m00 = _dot(u, matvec(u)) - eigenvalue
+    m01 = _dot(u, av)
+    m11 = _dot(v, av) - eigenvalue
+    use_m00 = m00.abs() >= m11.abs()
+    c0 = torch.where(use_m00, m01, m11)
+    c1 = torch.where(use_m00, m00, m01)
+    return _normalize(tuple(c0 * _u - c1 * _v for _u, _v in zip(u, v)), u)
+
+
+def sym3x3_eig(mat: torch.Tensor, eigenvectors=False):
+    r"""
+    Closed-form eigendecomposition of a batch of 3x3 symmetric matrices of shape **...x3x3**.
+    The eigenvalues are solved by the trigonometric formula, the eigenvector of the most isolated eigenvalue
+    is taken from the cross products of :math:`\mathbf{A} - \lambda \mathbf{I}` and the other two are solved
+    in its orthogonal complement, so repeated eigenvalues still get an orthonormal basis.
+    The eigenvalues are computed in float64, the eigenvectors in the input precision (at least float32).
+    No autograd, see :class:`SymEig3x3Func` for the differentiable version.
+
+    :param mat: The input tensor of shape **...x3x3**
+    :type mat: torch.Tensor
+    :param eigenvectors: If ``True``, computes the eigenvectors.
+    :type eigenvectors: bool
+    :return: float64 eigenvalues **...x3** in ascending order and eigenvectors **...x3x3** (as columns) or None
+    :rtype: tuple[torch.Tensor, torch.Tensor]
+    """
+    vec_dtype = mat.dtype if mat.dtype == torch.float64 else torch.float32
+    mat = mat.double()
+    a = (
+        mat[..., 0, 0],
+        0.5 * (mat[..., 0, 1] + mat[..., 1, 0]),
+        0.5 * (mat[..., 0, 2] + mat[..., 2, 0]),
+        mat[..., 1, 1],
+        0.5 * (mat[..., 1, 2] + mat[..., 2, 1]),
+        mat[..., 2, 2],
+    )
+    eig_vals, half_det = _sym3x3_eigenvalues(*a)
+    eig_vecs = None
+    if eigenvectors:
+        # the eigenvalues need float64 to resolve close roots, the eigenvectors are solved in the input precision
+        a = tuple(_a.to(vec_dtype) for _a in a)
+        vals = eig_vals.to(vec_dtype)
+        # if half_det >= 0 the largest eigenvalue is the most isolated one, otherwise the smallest
+        largest_isolated = half_det >= 0
+        isolated_val = torch.where(largest_isolated, vals[..., 2], vals[..., 0])
+        isolated_vec = _sym3x3_isolated_eigenvector(a, isolated_val)
+        middle_vec = _sym3x3_eigenvector_in_plane(a, isolated_vec, vals[..., 1])
+        remaining_vec = _cross(middle_vec, isolated_vec)
+        vec0 = torch.stack(_select(largest_isolated, remaining_vec, isolated_vec), -1)
+        vec2 = torch.stack(_select(largest_isolated, isolated_vec, tuple(-_r for _r in remaining_vec)), -1)
+        eig_vecs = torch.stack([vec0, torch.stack(middle_vec, -1), vec2], -1)
+    return eig_vals, eig_vecs
+
+
+class SymEig3x3Func(torch.autograd.Function):
+    r"""
+    Differentiable :func:`sym3x3_eig`. The backward pass uses
+    :math:`\bar{\mathbf{A}} = \mathbf{U}(\bar{\Lambda} + \mathbf{F} \circ \mathbf{U}^{\top}\bar{\mathbf{U}})\mathbf{U}^{\top}`
+    with :math:`F_{ij} = (\lambda_j - \lambda_i) / ((\lambda_j - \lambda_i)^2 + \epsilon^2)`, which is bounded for
+    (near) degenerate eigenvalues instead of blowing up like :math:`1 / (\lambda_j - \lambda_i)`.
+    """
+
+    @staticmethod
+    def forward(ctx, mat, eps=1e-6):
+        eig_vals, eig_vecs = sym3x3_eig(mat, eigenvectors=True)
+        eig_vals, eig_vecs = eig_vals.to(mat.dtype), eig_vecs.to(mat.dtype)
+        ctx.eps = eps
+        ctx.save_for_backward(eig_vals, eig_vecs)
+        return eig_vals, eig_vecs
+
+    @staticmethod
+    def backward(ctx, grad_vals, grad_vecs):
+        eig_vals, eig_vecs = ctx.saved_tensors
+        eps = ctx.eps * eig_vals.abs().max(-1, keepdim=True)[0][..., None].clamp(min=EPSILON)
+        gaps = eig_vals[..., None, :] - eig_vals[..., :, None]  # lambda_j - lambda_i
+        inner = torch.diag_embed(grad_vals) if grad_vals is not None else torch.zeros_like(eig_vecs)
+        if grad_vecs is not None:
+            f = gaps / (gaps ** 2 + eps ** 2)
+            inner = inner + f * (eig_vecs.transpose(-1, -2) @ grad_vecs)
+        grad_mat = eig_vecs @ inner @ eig_vecs.transpose(-1, -2)
+        return 0.5 * (grad_mat + grad_mat.transpose(-1, -2)), None
+
+
+def vSymEig3x3(mat: torch.Tensor, eigenvectors=False, descending_eigenvals=False):
+    r"""
+    Differentiable eigendecomposition of a batch of 3x3 symmetric matrices of shape **...x3x3**.
+
+    :param mat: The input tensor of shape **...x3x3**
+    :type mat: torch.Tensor
+    :param eigenvectors: If ``True``, computes the eigenvectors.
+    :type eigenvectors: bool
+    :param descending_eigenvals: If ``True``, return the eigenvvalues in descending order
+    :type descending_eigenvals: bool
+    :return: eigenvalues **...x3** and eigenvectors **...x3x3** (as columns) or None
+    :rtype: tuple[torch.Tensor, torch.Tensor]
+
+    Example:
+        .. code-block:: python
+
+            import torch
+            from torchvectorized.vlinalg import vSymEig3x3
+
+            x = torch.rand(1000, 3, 3)
+            eig_vals, eig_vecs = vSymEig3x3(x @ x.transpose(1, 2), eigenvectors=True)
+
+    """
+    if eigenvectors or mat.requires_grad:
+        eig_vals, eig_vecs = SymEig3x3Func.apply(mat)
+    else:
+        eig_vals, _ = sym3x3_eig(mat)
+        eig_vals, eig_vecs = eig_vals.to(mat.dtype), None
+    if descending_eigenvals:
+        eig_vals = eig_vals.flip(-1)
+        eig_vecs = eig_vecs.flip(-1) if eig_vecs is not None else None
+    return eig_vals, eig_vecs if eigenvectors else None
+
+
 def vSymEig(inputs: torch.Tensor, eigenvectors=False, flatten_output=False, descending_eigenvals=False):
     r"""
     Compute the eigendecomposition :math:`\mathbf{M} = \mathbf{U} \mathbf{\Sigma} \mathbf{U}^{\top}` of every
     voxel in a volume of flattened 3x3 symmetric matrices of shape **Bx9xDxHxW**.
+    The eigenvectors are solved from a single cross product, which is fast but breaks down for (nearly) repeated
+    eigenvalues, see :func:`vSymEig3x3` for the robust version.
 
     :param inputs: The input tensor of shape **Bx9xDxHxW**, where the 9 channels represent flattened 3x3 symmetric matrices.
     :type inputs: torch.Tensor